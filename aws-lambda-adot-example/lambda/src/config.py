@@ -2,6 +2,12 @@ import os
 
 class DynamoDBConfig:
     TABLE_NAME = os.getenv('DYNAMODB_TABLE_NAME', 'product_info')
+    # batch_get_item accepts at most 100 keys per request
+    BATCH_SIZE = min(int(os.getenv('DYNAMODB_BATCH_SIZE', '100')), 100)
+    MAX_CONCURRENCY = int(os.getenv('DYNAMODB_MAX_CONCURRENCY', '4'))
+    UNPROCESSED_KEYS_MAX_RETRIES = int(os.getenv('DYNAMODB_UNPROCESSED_KEYS_MAX_RETRIES', '5'))
+    UNPROCESSED_KEYS_BASE_DELAY_MS = int(os.getenv('DYNAMODB_UNPROCESSED_KEYS_BASE_DELAY_MS', '50'))
+    UNPROCESSED_KEYS_MAX_DELAY_MS = int(os.getenv('DYNAMODB_UNPROCESSED_KEYS_MAX_DELAY_MS', '1000'))
 
 class DelayInjectionConfig:
     ENABLED = os.getenv('DELAY_INJECTION_ENABLED', 'false').lower() == 'true'
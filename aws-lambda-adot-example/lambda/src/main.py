@@ -1,14 +1,31 @@
 from aws_lambda_powertools import Logger
 import boto3
+from botocore.config import Config
 from config import ProjectConfig, DynamoDBConfig, FaultInjectionConfig, DelayInjectionConfig
+import contextvars
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
 logger = Logger(
     service = ProjectConfig.SERVICE_NAME,
 )
 
+# Created once per execution environment and reused by warm invocations, boto3 clients are thread-safe
+dynamodb = boto3.client(
+    "dynamodb",
+    config=Config(max_pool_connections=max(10, DynamoDBConfig.MAX_CONCURRENCY)),
+)
+batch_executor = ThreadPoolExecutor(
+    max_workers=DynamoDBConfig.MAX_CONCURRENCY,
+    thread_name_prefix="dynamodb-batch",
+)
+
+
+class UnprocessedKeysError(Exception):
+    pass
+
 @contextmanager
 def fault_injection(error_message: str):
     yield
@@ -26,24 +43,66 @@ def delay_injection():
         time.sleep(DelayInjectionConfig.DELAY_MS / 1000)
 
 
-def get_product_infos(product_ids: list[str]):
-    dynamodb = boto3.client("dynamodb")
+def _projection(attributes: list[str] | None) -> dict:
+    if not attributes:
+        return {}
+    # The key is always projected so items can be matched to the requested ids,
+    # names are aliased as many attribute names are DynamoDB reserved words
+    names = list(dict.fromkeys(["product_id", *attributes]))
+    return {
+        "ProjectionExpression": ", ".join(f"#a{i}" for i in range(len(names))),
+        "ExpressionAttributeNames": {f"#a{i}": name for i, name in enumerate(names)},
+    }
+
+
+def _batch_get(client, keys: list[dict], projection: dict) -> list[dict]:
+    items = []
+    request = {"Keys": keys, **projection}
+    for attempt in range(DynamoDBConfig.UNPROCESSED_KEYS_MAX_RETRIES + 1):
+        if attempt:
+            # Exponential backoff with full jitter, keys are left unprocessed when the table is throttled
+            max_delay_ms = min(
+                DynamoDBConfig.UNPROCESSED_KEYS_MAX_DELAY_MS,
+                DynamoDBConfig.UNPROCESSED_KEYS_BASE_DELAY_MS * 2 ** (attempt - 1),
+            )
+            delay_ms = random.uniform(0, max_delay_ms)
+            logger.warning(f"{len(request['Keys'])} keys unprocessed by DynamoDB, retry {attempt} in {delay_ms:.0f}ms")
+            time.sleep(delay_ms / 1000)
+        response = client.batch_get_item(RequestItems={DynamoDBConfig.TABLE_NAME: request})
+        items.extend(response["Responses"].get(DynamoDBConfig.TABLE_NAME, []))
+        request = response.get("UnprocessedKeys", {}).get(DynamoDBConfig.TABLE_NAME)
+        if not request:
+            return items
+    raise UnprocessedKeysError(
+        f"{len(request['Keys'])} keys still unprocessed after {DynamoDBConfig.UNPROCESSED_KEYS_MAX_RETRIES} retries"
+    )
+
+
+def get_product_infos(product_ids: list[str], attributes: list[str] | None = None, client=None):
+    client = client or dynamodb
     with (
         fault_injection("Failed to get product info from DynamoDB"),
         delay_injection()
     ):
-        keys = [{"product_id": {"S": product_id}} for product_id in product_ids]
-        response = dynamodb.batch_get_item(
-            RequestItems={
-                DynamoDBConfig.TABLE_NAME: {
-                    "Keys": keys
-                }
-            }
-        )
-        return response["Responses"][DynamoDBConfig.TABLE_NAME]
+        # batch_get_item rejects duplicate keys within a request
+        unique_ids = list(dict.fromkeys(product_ids))
+        keys = [{"product_id": {"S": product_id}} for product_id in unique_ids]
+        batches = [keys[i:i + DynamoDBConfig.BATCH_SIZE] for i in range(0, len(keys), DynamoDBConfig.BATCH_SIZE)]
+        projection = _projection(attributes)
+        # Each batch runs in a copy of the caller's context, so its DynamoDB spans stay under the invocation's trace
+        futures = [
+            batch_executor.submit(contextvars.copy_context().run, _batch_get, client, batch, projection)
+            for batch in batches
+        ]
+        items_by_id = {
+            item["product_id"]["S"]: item
+            for future in futures
+            for item in future.result()
+        }
+        return [items_by_id[product_id] for product_id in unique_ids if product_id in items_by_id]
 
 @logger.inject_lambda_context(log_event=True)
 def lambda_handler(event, context):
     product_ids = event["product_ids"]
-    product_infos = get_product_infos(product_ids)
+    product_infos = get_product_infos(product_ids, event.get("attributes"))
     return product_infos
\ No newline at end of file
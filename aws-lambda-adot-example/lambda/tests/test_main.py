@@ -0,0 +1,85 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+# The module-level client needs a region, no request ever leaves the stubbed clients
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import main  # noqa: E402
+from config import DynamoDBConfig  # noqa: E402
+
+TABLE = DynamoDBConfig.TABLE_NAME
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Batches run one at a time, in order, so they meet the stubbed responses in the order they were queued
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(main, "batch_executor", executor)
+    monkeypatch.setattr(DynamoDBConfig, "UNPROCESSED_KEYS_BASE_DELAY_MS", 0)
+    client = boto3.client("dynamodb", aws_access_key_id="test", aws_secret_access_key="test")
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+    executor.shutdown()
+
+
+def keys(ids: list[str]) -> list[dict]:
+    return [{"product_id": {"S": product_id}} for product_id in ids]
+
+
+def items(ids: list[str]) -> list[dict]:
+    return [{"product_id": {"S": product_id}, "name": {"S": f"name-{product_id}"}} for product_id in ids]
+
+
+def expect_batch_get(stubber: Stubber, requested: list[str], returned: list[str], unprocessed: list[str] = ()) -> None:
+    response = {"Responses": {TABLE: items(returned)}}
+    if unprocessed:
+        response["UnprocessedKeys"] = {TABLE: {"Keys": keys(unprocessed)}}
+    stubber.add_response("batch_get_item", response, {"RequestItems": {TABLE: {"Keys": keys(requested)}}})
+
+
+def test_more_than_100_ids_are_fetched_in_batches_of_100(client):
+    client, stubber = client
+    ids = [f"p{i:03d}" for i in range(250)]
+    for start in range(0, 250, 100):
+        expect_batch_get(stubber, ids[start:start + 100], ids[start:start + 100])
+
+    result = main.get_product_infos(ids, client=client)
+
+    assert [item["product_id"]["S"] for item in result] == ids
+
+
+def test_items_follow_request_order_and_duplicates_are_fetched_once(client):
+    client, stubber = client
+    # DynamoDB returns items in no particular order, and "missing" does not exist
+    expect_batch_get(stubber, ["b", "a", "missing", "c"], ["c", "a", "b"])
+
+    result = main.get_product_infos(["b", "a", "b", "missing", "c", "a"], client=client)
+
+    assert [item["product_id"]["S"] for item in result] == ["b", "a", "c"]
+
+
+def test_unprocessed_keys_are_retried(client):
+    client, stubber = client
+    expect_batch_get(stubber, ["a", "b", "c"], ["a"], unprocessed=["b", "c"])
+    expect_batch_get(stubber, ["b", "c"], ["c"], unprocessed=["b"])
+    expect_batch_get(stubber, ["b"], ["b"])
+
+    result = main.get_product_infos(["a", "b", "c"], client=client)
+
+    assert [item["product_id"]["S"] for item in result] == ["a", "b", "c"]
+
+
+def test_unprocessed_keys_error_once_retries_run_out(client, monkeypatch):
+    client, stubber = client
+    monkeypatch.setattr(DynamoDBConfig, "UNPROCESSED_KEYS_MAX_RETRIES", 2)
+    expect_batch_get(stubber, ["a", "b"], ["a"], unprocessed=["b"])
+    expect_batch_get(stubber, ["b"], [], unprocessed=["b"])
+    expect_batch_get(stubber, ["b"], [], unprocessed=["b"])
+
+    with pytest.raises(main.UnprocessedKeysError, match="1 keys still unprocessed after 2 retries"):
+        main.get_product_infos(["a", "b"], client=client)
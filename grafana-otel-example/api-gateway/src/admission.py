@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import itertools
+from contextvars import ContextVar
+from typing import Iterable
+
+import httpx
+from opentelemetry import metrics, trace
+from opentelemetry.metrics import CallbackOptions, Observation
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from config import AdmissionSettings
+from deadline import get_remaining_time
+
+meter = metrics.get_meter(__name__)
+
+shed_counter = meter.create_counter(
+    "gateway.admission.shed",
+    unit="{request}",
+    description="Requests rejected by admission control, per upstream, route and reason",
+)
+
+#? Upstream answers meaning it is overloaded; other errors are failures of the request, not a capacity signal
+OVERLOAD_STATUS_CODES = {429, 503, 504}
+
+#? Waiting requests as (priority, arrival order, future); the future resolves to None once admitted, or to a shed reason
+_Waiter = tuple[int, int, asyncio.Future]
+
+#? Route template and priority of the gateway request being served, set by AdmissionMiddleware
+_route: ContextVar[tuple[str, int] | None] = ContextVar("admission_route", default=None)
+
+
+class AdmissionRejected(httpx.TransportError):
+    """Raised instead of sending an upstream call shed by admission control; like a pool timeout, nothing was sent."""
+
+    def __init__(self, message: str, reason: str, *, request: httpx.Request) -> None:
+        super().__init__(message, request=request)
+        self.reason = reason
+
+
+class AdaptiveConcurrencyLimit:
+    """
+    Gradient-based limit on the requests in flight against one upstream.
+
+    Every `window_size` calls, the window's average latency is compared with
+    the long-term average: the limit is scaled down by their ratio once it goes
+    past `latency_tolerance`, and grows by its square root otherwise, but only
+    while the limit is actually in use. Comparing with the upstream's own
+    history rather than a fixed target keeps routes that are slow by nature
+    from being throttled. Windows with failed calls back off multiplicatively.
+    Requests over the limit wait in a priority queue, the most important and
+    then the oldest admitted first.
+    """
+
+    def __init__(self, upstream: str, settings: AdmissionSettings) -> None:
+        self.upstream = upstream
+        self._settings = settings
+        self.limit = float(settings.initial_limit)
+        self.in_flight = 0
+        self._waiters: list[_Waiter] = []
+        self._arrivals = itertools.count()
+        self._baseline: float | None = None
+        self._window_total = 0.0
+        self._window_count = 0
+        self._window_failed = False
+        self._window_max_in_flight = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def record_sample(self, seconds: float, failed: bool) -> None:
+        self._window_total += seconds
+        self._window_count += 1
+        self._window_failed |= failed
+        self._window_max_in_flight = max(self._window_max_in_flight, self.in_flight)
+        if self._window_count < self._settings.window_size:
+            return
+
+        settings = self._settings
+        latency = self._window_total / self._window_count
+        if self._baseline is None:
+            self._baseline = latency
+        if self._window_failed:
+            limit = self.limit * settings.backoff_ratio
+        else:
+            gradient = max(0.5, min(1.0, settings.latency_tolerance * self._baseline / latency))
+            #? A limit that was not reached says nothing about the upstream's capacity, so it only grows when used
+            headroom = self.limit**0.5 if self._window_max_in_flight * 2 >= self.limit else 0.0
+            limit = self.limit * gradient + headroom
+        self.limit = max(
+            settings.min_limit,
+            min(settings.max_limit, self.limit * (1 - settings.limit_smoothing) + limit * settings.limit_smoothing),
+        )
+        self._baseline += (latency - self._baseline) * settings.baseline_smoothing
+        self._window_total, self._window_count = 0.0, 0
+        self._window_failed, self._window_max_in_flight = False, 0
+        self._admit_waiters()
+
+    async def admit(self, request: httpx.Request) -> None:
+        """
+        Take a slot for an upstream call, queued by the priority of the gateway route making it.
+
+        The wait is bounded by `max_queue_time_ms` and the request's deadline;
+        raises `AdmissionRejected` if the call is shed. Calls made outside any
+        route, such as background refreshes, get the default priority.
+        """
+        route, priority = _route.get() or (None, self._settings.default_priority)
+        timeout = self._settings.max_queue_time_ms / 1000
+        if (remaining := get_remaining_time()) is not None:
+            timeout = min(timeout, remaining)
+
+        reason = await self.acquire(priority, timeout)
+        if reason is None:
+            return
+        attributes = {"upstream": self.upstream, "reason": reason}
+        if route is not None:
+            attributes["http.route"] = route
+        shed_counter.add(1, attributes)
+        trace.get_current_span().set_attribute("gateway.admission.shed", reason)
+        raise AdmissionRejected(f"Call to {self.upstream} shed by admission control: {reason}", reason, request=request)
+
+    async def acquire(self, priority: int, timeout: float) -> str | None:
+        """Wait for a slot; returns None once admitted, or the reason the request was shed."""
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return None
+
+        if len(self._waiters) >= self._settings.max_queue_size:
+            #? With no room to queue at all, requests are shed rather than queued
+            worst = max(self._waiters) if self._waiters else None
+            if worst is None or worst[0] <= priority:
+                return "queue_full"
+            #? A more important request takes the place of the least important one queued
+            self._remove(worst)
+            worst[2].set_result("evicted")
+
+        waiter: _Waiter = (priority, next(self._arrivals), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, waiter)
+        try:
+            async with asyncio.timeout(max(timeout, 0.0)):
+                return await waiter[2]
+        except TimeoutError:
+            self._abandon(waiter)
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._admit_waiters()
+
+    def _admit_waiters(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            #? Cancelled along with its task, which has not removed it yet
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        future = waiter[2]
+        #? Cancelling the waiting task also cancels the future it awaits, which is still queued then
+        if not future.done() or future.cancelled():
+            self._remove(waiter)
+            future.cancel()
+        elif future.result() is None:
+            #? Admitted in the same loop iteration as the timeout or cancellation, give the slot back
+            self.release()
+
+    def _remove(self, waiter: _Waiter) -> None:
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+
+
+class AdmissionController:
+    """The adaptive limits of the upstreams, and the gauges exporting them."""
+
+    def __init__(self, settings: AdmissionSettings, upstreams: Iterable[str]) -> None:
+        self.settings = settings
+        self.limits = {upstream: AdaptiveConcurrencyLimit(upstream, settings) for upstream in upstreams}
+        meter.create_observable_gauge(
+            "gateway.admission.limit",
+            callbacks=[self._observe_limit],
+            unit="{request}",
+            description="Current adaptive concurrency limit per upstream",
+        )
+        meter.create_observable_gauge(
+            "gateway.admission.in_flight",
+            callbacks=[self._observe_in_flight],
+            unit="{request}",
+            description="Admitted requests in flight per upstream",
+        )
+        meter.create_observable_gauge(
+            "gateway.admission.queue_depth",
+            callbacks=[self._observe_queue_depth],
+            unit="{request}",
+            description="Requests waiting for admission per upstream",
+        )
+
+    def _observe_limit(self, options: CallbackOptions) -> Iterable[Observation]:
+        for upstream, limit in self.limits.items():
+            yield Observation(int(limit.limit), {"upstream": upstream})
+
+    def _observe_in_flight(self, options: CallbackOptions) -> Iterable[Observation]:
+        for upstream, limit in self.limits.items():
+            yield Observation(limit.in_flight, {"upstream": upstream})
+
+    def _observe_queue_depth(self, options: CallbackOptions) -> Iterable[Observation]:
+        for upstream, limit in self.limits.items():
+            yield Observation(limit.queue_depth, {"upstream": upstream})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware tagging each request with its route's admission priority.
+
+    The upstream clients take a slot of the upstream's limit around every
+    call, see `AdaptiveConcurrencyLimit.admit`; calls over a limit are queued
+    by this priority for up to `max_queue_time_ms` (or the caller's deadline
+    if sooner), then shed, which the app answers with a 503. The gateway thus
+    keeps answering the requests it takes on time instead of piling up
+    fan-outs when the queriers slow down, and requests that never reach an
+    upstream, such as cache hits, are never limited.
+    """
+
+    def __init__(self, app: ASGIApp, settings: AdmissionSettings) -> None:
+        self.app = app
+        self.settings = settings
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        route = self._match_route(scope) if scope["type"] == "http" else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = _route.set((route, self.settings.route_priorities.get(route, self.settings.default_priority)))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _route.reset(token)
+
+    def _match_route(self, scope: Scope) -> str | None:
+        #? Routing has not run yet, so match the app's routes the way the router will
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return None
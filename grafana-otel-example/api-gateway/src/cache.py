@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+from opentelemetry import metrics
+
+from config import CacheSettings
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+T = TypeVar("T")
+
+cache_hits_counter = meter.create_counter(
+    "gateway.cache.hits", unit="{lookup}", description="Lookups served from the cache, including stale entries"
+)
+cache_misses_counter = meter.create_counter(
+    "gateway.cache.misses", unit="{lookup}", description="Lookups that had to wait for an upstream load"
+)
+cache_evictions_counter = meter.create_counter(
+    "gateway.cache.evictions", unit="{entry}", description="Entries evicted to stay within the size bound"
+)
+cache_coalesced_counter = meter.create_counter(
+    "gateway.cache.coalesced", unit="{lookup}", description="Misses that joined an in-flight load instead of starting one"
+)
+
+
+@dataclass
+class _CacheEntry(Generic[T]):
+    value: T
+    expires_at: float
+
+
+class ReadThroughCache(Generic[T]):
+    """
+    Bounded LRU cache with per-entry TTL in front of an async loader.
+
+    Concurrent misses for the same key share a single load (single-flight),
+    which runs as its own task so a cancelled caller does not fail the others.
+    When `stale_while_revalidate` is set, an expired entry is still served for
+    that long while one background load refreshes it.
+    """
+
+    def __init__(self, name: str, settings: CacheSettings) -> None:
+        self._settings = settings
+        self._attributes = {"cache.name": name}
+        self._entries: OrderedDict[Hashable, _CacheEntry[T]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task[T]] = {}
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        if not self._settings.enabled:
+            return await loader()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            now = time.monotonic()
+            if now < entry.expires_at:
+                self._entries.move_to_end(key)
+                cache_hits_counter.add(1, self._attributes)
+                return entry.value
+            if now < entry.expires_at + self._settings.stale_while_revalidate:
+                self._entries.move_to_end(key)
+                cache_hits_counter.add(1, self._attributes)
+                self._start_load(key, loader)
+                return entry.value
+
+        cache_misses_counter.add(1, self._attributes)
+        if key in self._inflight:
+            cache_coalesced_counter.add(1, self._attributes)
+        return await asyncio.shield(self._start_load(key, loader))
+
+    async def close(self) -> None:
+        for task in self._inflight.values():
+            task.cancel()
+        self._inflight.clear()
+        self._entries.clear()
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> asyncio.Task[T]:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, loader))
+            self._inflight[key] = task
+            task.add_done_callback(self._log_background_failure)
+        return task
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        try:
+            value = await loader()
+            self._entries[key] = _CacheEntry(value=value, expires_at=time.monotonic() + self._settings.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._settings.max_entries:
+                self._entries.popitem(last=False)
+                cache_evictions_counter.add(1, self._attributes)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _log_background_failure(task: asyncio.Task[Any]) -> None:
+        #? Retrieve the exception so background revalidation failures are logged rather than lost
+        if not task.cancelled() and (e := task.exception()) is not None:
+            logger.debug("Cache load failed: %r", e)
@@ -1,3 +1,6 @@
+from typing import Literal
+
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -5,19 +8,195 @@ class ProjectSettings(BaseSettings):
     service_name: str = "api-gateway"
     service_instance_id: str = "api-gateway-1"
     env: str = "dev"
+    #? Worker processes per container, read from the same variable as uvicorn's --workers default
+    web_concurrency: int = 1
+
+
+class OTLPExportSettings(BaseModel):
+    protocol: Literal["http/protobuf", "grpc"] = "http/protobuf"
+    #? Full endpoint for this signal, by default derived from OTEL_EXPORTER_OTLP_ENDPOINT
+    endpoint: str | None = None
+    compression: Literal["none", "gzip"] = "gzip"
+    timeout_ms: int = 10_000
+
+class BatchExportSettings(OTLPExportSettings):
+    max_queue_size: int = 2048
+    max_export_batch_size: int = 512
+    schedule_delay_ms: int = 5000
+    export_timeout_ms: int = 30_000
 
+class MetricExportSettings(OTLPExportSettings):
+    export_interval_ms: int = 60_000
+    export_timeout_ms: int = 30_000
+    #? "delta" reports counters and histograms as deltas, for backends that expect them; gauges stay cumulative
+    temporality: Literal["cumulative", "delta"] = "cumulative"
 
 class OTELSettings(BaseSettings):
+    #? Nested settings are read from e.g. OTEL_TRACES_EXPORT__MAX_QUEUE_SIZE
+    model_config = SettingsConfigDict(env_nested_delimiter="__")
     otel_exporter_otlp_endpoint: str
+    #? Turns off the SDK and every instrumentation, like the standard variable of the same name
+    otel_sdk_disabled: bool = False
+    #? "none" drops every export and "memory" only encodes it to OTLP protobuf, to measure telemetry without a collector
+    otel_export_mode: Literal["otlp", "none", "memory"] = "otlp"
+    #? Share of new traces to sample, requests carrying a parent follow the caller's decision
+    otel_sampling_ratio: float = 1.0
+    #? Per-route ratios keyed on the route template, e.g. OTEL_SAMPLING_ROUTE_RATIOS='{"/products/ids": 0.01}'
+    otel_sampling_route_ratios: dict[str, float] = {}
+    #? Upper bound on new traces sampled per second, 0 disables
+    otel_sampling_max_traces_per_second: float = 0.0
+    otel_traces_export: BatchExportSettings = BatchExportSettings()
+    otel_logs_export: BatchExportSettings = BatchExportSettings()
+    otel_metrics_export: MetricExportSettings = MetricExportSettings()
+
+class HTTPClientSettings(BaseModel):
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 1.0
+    read_timeout: float = 5.0
+    write_timeout: float = 5.0
+    pool_timeout: float = 1.0
+    http2: bool = False
 
 class ServiceSettings(BaseSettings):
+    #? Nested settings are read from e.g. HTTP_CLIENT__MAX_CONNECTIONS
+    model_config = SettingsConfigDict(env_nested_delimiter="__")
     product_info_service_url: str
     product_price_service_url: str
+    http_client: HTTPClientSettings = HTTPClientSettings()
+    batch_get_max_size: int = 100
+    #? How long the in-memory product ids snapshot is served before a background refresh (seconds)
+    product_ids_refresh_interval: float = 30.0
+
+class CacheSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="CACHE_")
+    enabled: bool = True
+    #? Seconds an entry is fresh
+    ttl: float = 5.0
+    max_entries: int = 10_000
+    #? Seconds an expired entry may still be served while it is refreshed in the background, 0 disables
+    stale_while_revalidate: float = 0.0
+
+class PaginationSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="PAGINATION_")
+    default_limit: int = 100
+    #? Larger requested limits are clamped to this
+    max_limit: int = 1000
+
+class SerializationSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="SERIALIZATION_")
+    #? Validate trusted upstream data through the pydantic models, slower but useful when debugging bad payloads
+    strict_validation: bool = False
+
+class TailSamplingSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="OTEL_TAIL_SAMPLING_")
+    enabled: bool = False
+    #? Traces whose local root span takes at least this long are always kept (milliseconds)
+    latency_threshold_ms: float = 500.0
+    #? Per-route thresholds keyed on the route template, e.g. '{"/products": 2000}'
+    route_latency_thresholds_ms: dict[str, float] = {}
+    #? Share of healthy traces kept anyway, decided on the trace id so every service keeps the same ones
+    baseline_ratio: float = 0.1
+    #? Bounds on what is buffered while waiting for local root spans to end, the oldest traces are evicted first
+    max_traces: int = 10_000
+    max_spans: int = 100_000
+
+class SpoolSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="OTEL_SPOOL_")
+    #? Spool OTLP/HTTP exports on local disk and replay them in order, so a slow or down collector costs disk instead of memory
+    enabled: bool = False
+    #? A sub-directory per service instance and signal is created below this
+    directory: str = "/tmp/otel-spool"
+    segment_size_bytes: int = 4 * 1024 * 1024
+    #? Per signal, the oldest segments are evicted past this whether replayed or not
+    max_size_bytes: int = 256 * 1024 * 1024
+    retry_initial_backoff: float = 1.0
+    retry_max_backoff: float = 30.0
+
+class LogControlSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="LOG_CONTROL_")
+    enabled: bool = True
+    #? Records at or above this level are never sampled or rate limited
+    always_keep_level: str = "WARNING"
+    #? Keep every record emitted inside a sampled trace, so it only trims logs once trace sampling is below 100%
+    keep_sampled_traces: bool = True
+    #? Ratios keyed on "logger:LEVEL", "logger" or "LEVEL", e.g. LOG_CONTROL_SAMPLE_RATIOS='{"main:INFO": 0.1}'
+    sample_ratios: dict[str, float] = {}
+    #? Per logger, 0 disables
+    max_records_per_second: float = 0.0
+
+class RuntimeMetricsSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="RUNTIME_METRICS_")
+    enabled: bool = True
+    #? How often the event loop probe wakes up; lag is how late it wakes (seconds)
+    loop_lag_interval: float = 0.5
+
+class ProfilerSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="OTEL_PROFILER_")
+    #? Opt-in: samples every thread's stack and attributes it to the span active there
+    enabled: bool = False
+    interval_ms: float = 10.0
+    #? The sampler backs off so it never takes more than this share of wall time, whatever the interval
+    max_overhead_ratio: float = 0.02
+    #? Samples are aggregated per span and flushed once per window (seconds)
+    window_seconds: float = 30.0
+    #? "otlp" emits one log record per span and window, linked to the span; "file" writes folded stacks per window
+    output: Literal["otlp", "file"] = "otlp"
+    #? A sub-directory per service instance is created below this
+    directory: str = "/tmp/otel-profiles"
+    max_stack_depth: int = 64
+    #? Distinct (span, stack) pairs kept per window, further ones are counted but dropped
+    max_stacks_per_window: int = 10_000
+    #? Also keep samples outside any sampled span, mostly idle threads
+    include_unattributed: bool = False
+
+class ResilienceSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="RESILIENCE_")
+    enabled: bool = True
+    #? Total time for one upstream call, retries and hedges included (milliseconds); sent on as X-Request-Timeout-Ms
+    deadline_ms: float = 3000.0
+    #? Per-upstream overrides keyed on the upstream name, e.g. '{"product-price-querier": 1500}'
+    upstream_deadlines_ms: dict[str, float] = {}
+    #? Idempotent calls still outstanding after this latency percentile of their route get a second request
+    hedge_enabled: bool = True
+    hedge_percentile: float = 95.0
+    #? Hedge delay until a route has enough recorded latencies, and lower bound afterwards (milliseconds)
+    hedge_initial_delay_ms: float = 200.0
+    hedge_min_delay_ms: float = 10.0
+    max_retries: int = 2
+    #? Full jitter, doubled on every retry (milliseconds)
+    retry_backoff_ms: float = 25.0
+    retry_status_codes: set[int] = {500, 502, 503, 504}
+    #? Hedges and retries spend tokens earned at this ratio per call, plus a floor per second, up to the burst
+    retry_budget_ratio: float = 0.1
+    retry_budget_min_per_second: float = 1.0
+    retry_budget_burst: float = 10.0
 
-class PymysqlSettings(BaseSettings):
-    model_config = SettingsConfigDict(env_prefix="MYSQL_")
-    host: str
-    port: int
-    db: str
-    user: str
-    password: str
\ No newline at end of file
+class AdmissionSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="ADMISSION_")
+    enabled: bool = True
+    #? Adaptive limit on the requests in flight against each upstream, per worker process
+    initial_limit: int = 20
+    min_limit: int = 2
+    max_limit: int = 200
+    #? Latency is averaged over windows of this many upstream calls (time to response headers)
+    window_size: int = 20
+    #? The limit shrinks once a window's latency exceeds the long-term average by this factor
+    latency_tolerance: float = 1.5
+    #? Weight of each window in the long-term average latency, and of each new estimate in the limit
+    baseline_smoothing: float = 0.05
+    limit_smoothing: float = 0.2
+    #? The limit is multiplied by this after a window with failed calls
+    backoff_ratio: float = 0.9
+    #? Calls over the limit wait in a priority queue of this size per upstream, then are shed with a 503; 0 sheds them at once
+    max_queue_size: int = 100
+    max_queue_time_ms: float = 500.0
+    #? Lower is served first; cheap single-product lookups go ahead of full listings
+    route_priorities: dict[str, int] = {
+        "/products/{product_id}": 0,
+        "/products/ids": 0,
+        "/products:batchGet": 1,
+        "/products": 2,
+    }
+    default_priority: int = 1
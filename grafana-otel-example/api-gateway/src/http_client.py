@@ -0,0 +1,134 @@
+import time
+from typing import Any, AsyncIterator, Callable
+
+import httpx
+import orjson
+
+from admission import OVERLOAD_STATUS_CODES, AdaptiveConcurrencyLimit
+from config import HTTPClientSettings, ResilienceSettings
+from metrics import get_route_template, upstream_duration_histogram
+from resilience import ResilientTransport
+
+
+class _TimedByteStream(httpx.AsyncByteStream):
+    """Response stream recording the upstream call duration, and ending the call, once the body is fully read or closed."""
+
+    def __init__(
+        self, stream: httpx.AsyncByteStream, started_at: float, attributes: dict[str, Any], on_close: Callable[[], None]
+    ) -> None:
+        self._stream = stream
+        self._started_at = started_at
+        self._attributes = attributes
+        self._on_close = on_close
+        self._recorded = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._recorded:
+                self._recorded = True
+                upstream_duration_histogram.record(time.perf_counter() - self._started_at, self._attributes)
+                self._on_close()
+
+
+class TimedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper recording `gateway.upstream.duration` for every call to one upstream.
+
+    With an admission limit, every call holds one of the upstream's slots
+    until its response body is read or closed, so the limit counts the
+    requests actually in flight against the upstream. The time to response
+    headers feeds the limit; streamed bodies would otherwise count as slow
+    calls.
+    """
+
+    def __init__(
+        self, transport: httpx.AsyncBaseTransport, upstream: str, admission_limit: AdaptiveConcurrencyLimit | None = None
+    ) -> None:
+        self._transport = transport
+        self._upstream = upstream
+        self._admission_limit = admission_limit
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attributes: dict[str, Any] = {
+            "upstream": self._upstream,
+            "http.route": get_route_template(request.url.path),
+            "http.request.method": request.method,
+        }
+        if self._admission_limit is not None:
+            await self._admission_limit.admit(request)
+        release = self._admission_limit.release if self._admission_limit is not None else lambda: None
+
+        started_at = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception as e:
+            attributes["error.type"] = type(e).__qualname__
+            elapsed = time.perf_counter() - started_at
+            upstream_duration_histogram.record(elapsed, attributes)
+            if self._admission_limit is not None:
+                self._admission_limit.record_sample(elapsed, failed=True)
+            release()
+            raise
+        except BaseException:
+            release()
+            raise
+        attributes["http.response.status_code"] = response.status_code
+        if self._admission_limit is not None:
+            self._admission_limit.record_sample(time.perf_counter() - started_at, failed=response.status_code in OVERLOAD_STATUS_CODES)
+        response.stream = _TimedByteStream(response.stream, started_at, attributes, release)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def create_async_client(
+    base_url: str,
+    upstream: str,
+    settings: HTTPClientSettings,
+    resilience_settings: ResilienceSettings,
+    admission_limit: AdaptiveConcurrencyLimit | None = None,
+) -> httpx.AsyncClient:
+    """
+    Build a long-lived client for a single upstream service.
+
+    The client owns its connection pool, so it must be created once per
+    process (in the app lifespan) and closed on shutdown. HTTPX instrumentation
+    has to be set up before this is called for the client to be traced.
+    `upstream` names the service in the client's latency metrics and
+    resilience settings. The latency metric covers the whole call, hedges and
+    retries included, while each attempt gets its own client span;
+    `admission_limit` is the upstream's concurrency limit to enforce, if any.
+    """
+    limits = httpx.Limits(
+        max_connections=settings.max_connections,
+        max_keepalive_connections=settings.max_keepalive_connections,
+        keepalive_expiry=settings.keepalive_expiry,
+    )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        transport=TimedTransport(
+            ResilientTransport(
+                httpx.AsyncHTTPTransport(http2=settings.http2, limits=limits), upstream, resilience_settings
+            ),
+            upstream,
+            admission_limit,
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.connect_timeout,
+            read=settings.read_timeout,
+            write=settings.write_timeout,
+            pool=settings.pool_timeout,
+        ),
+    )
+
+
+def read_json(response: httpx.Response) -> Any:
+    #? orjson parses large upstream bodies several times faster than httpx's stdlib-based `Response.json()`
+    return orjson.loads(response.content)
@@ -1,6 +1,9 @@
 import asyncio
-from fastapi import FastAPI, status
-from fastapi.responses import JSONResponse
+from contextlib import AsyncExitStack
+from typing import AsyncIterator
+from fastapi import FastAPI, Query, Request, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
 from opentelemetry import trace
 
@@ -8,13 +11,20 @@ from otel_instrumentation import (
     setup_otel,
     setup_fastapi_instrumentation,
     setup_httpx_instrumentation,
-    setup_pymysql_instrumentation
 )
 import logging
-from config import ServiceSettings, PymysqlSettings
-from pydantic import BaseModel
-import pymysql
-from pymysql.cursors import DictCursor
+from admission import AdmissionController, AdmissionMiddleware, AdmissionRejected
+from cache import ReadThroughCache
+from config import AdmissionSettings, CacheSettings, PaginationSettings, ResilienceSettings, SerializationSettings, ServiceSettings
+from deadline import DeadlineMiddleware
+from http_client import create_async_client, read_json
+from metrics import REDMetricsMiddleware
+from ndjson import NDJSON_MEDIA_TYPE, accepts_ndjson, iter_ndjson, ndjson_line
+from pagination import InvalidCursorError, decode_cursor, encode_cursor
+from product_ids import ProductIdsSnapshot
+from runtime_metrics import shutdown_runtime_metrics
+from typing import Literal
+from pydantic import BaseModel, Field, TypeAdapter
 
 
 logger = logging.getLogger(__name__)
@@ -23,13 +33,46 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     setup_otel()
     setup_httpx_instrumentation()
-    setup_pymysql_instrumentation()
-    yield
+
+    #? One pooled client per upstream, reused by every request for the app lifetime
+    async with (
+        create_async_client(
+            service_settings.product_info_service_url,
+            "product-info-querier",
+            service_settings.http_client,
+            resilience_settings,
+            admission_controller.limits["product-info-querier"] if admission_settings.enabled else None,
+        ) as info_client,
+        create_async_client(
+            service_settings.product_price_service_url,
+            "product-price-querier",
+            service_settings.http_client,
+            resilience_settings,
+            admission_controller.limits["product-price-querier"] if admission_settings.enabled else None,
+        ) as price_client,
+    ):
+        app.state.product_info_client = info_client
+        app.state.product_price_client = price_client
+        app.state.product_ids_snapshot = ProductIdsSnapshot(
+            price_client, service_settings.product_ids_refresh_interval, pagination_settings.max_limit
+        )
+        app.state.product_cache = ReadThroughCache("products", cache_settings)
+        try:
+            yield
+        finally:
+            await app.state.product_cache.close()
+            await app.state.product_ids_snapshot.close()
+            await shutdown_runtime_metrics()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 service_settings = ServiceSettings()
-pymysql_settings = PymysqlSettings()
+cache_settings = CacheSettings()
+pagination_settings = PaginationSettings()
+serialization_settings = SerializationSettings()
+resilience_settings = ResilienceSettings()
+admission_settings = AdmissionSettings()
+admission_controller = AdmissionController(admission_settings, ["product-info-querier", "product-price-querier"])
 
 
 class Price(BaseModel):
@@ -46,119 +89,283 @@ class Product(BaseModel):
     price: Price
     url: str
 
+class ProductBatchGetRequest(BaseModel):
+    product_ids: list[str] = Field(min_length=1, max_length=service_settings.batch_get_max_size)
+
+class ProductBatchGetItem(BaseModel):
+    product_id: str
+    product: Product | None = None
+    missing: list[Literal["info", "price"]] = []
+
+PRODUCT_FIELDS = tuple(Product.model_fields)
+products_adapter = TypeAdapter(list[Product])
+batch_items_adapter = TypeAdapter(list[ProductBatchGetItem])
+
 tracer = trace.get_tracer(__name__)
 
+
+def join_product(info_json: dict, price_json: dict) -> dict:
+    """Build the `Product` payload straight from the trusted upstream halves, without model round trips."""
+    price = {"currency": price_json["currency"], "value": price_json["value"]}
+    return {field: price if field == "price" else info_json[field] for field in PRODUCT_FIELDS}
+
+def validate_products(products: list[dict]) -> list[dict]:
+    #? Upstream payloads come from our own queriers, so full validation is only worth its cost when debugging them
+    if not serialization_settings.strict_validation:
+        return products
+    return products_adapter.dump_python(products_adapter.validate_python(products))
+
+
+async def open_ndjson_stream(stack: AsyncExitStack, client: httpx.AsyncClient, url: str, params: dict) -> httpx.Response:
+    resp = await stack.enter_async_context(client.stream("GET", url, params=params, headers={"Accept": NDJSON_MEDIA_TYPE}))
+    if resp.is_error:
+        #? Read the error body so it can be relayed like a buffered response
+        await resp.aread()
+        resp.raise_for_status()
+    return resp
+
+
+async def stream_join_products(stack: AsyncExitStack, info_resp: httpx.Response, price_resp: httpx.Response) -> AsyncIterator[bytes]:
+    """
+    Merge-join the two upstream NDJSON streams, both ordered by product_id.
+
+    Only the current row of each stream is held, and a joined product is sent
+    as soon as both halves have arrived. Ids present on one side only are skipped.
+    """
+    async with stack:
+        with tracer.start_as_current_span("stream_join_products") as span:
+            count = 0
+            infos = iter_ndjson(info_resp)
+            prices = iter_ndjson(price_resp)
+            info_json = await anext(infos, None)
+            price_json = await anext(prices, None)
+            while info_json is not None and price_json is not None:
+                if info_json["product_id"] == price_json["product_id"]:
+                    [product] = validate_products([join_product(info_json, price_json)])
+                    yield ndjson_line(product)
+                    count += 1
+                    info_json = await anext(infos, None)
+                    price_json = await anext(prices, None)
+                elif info_json["product_id"] < price_json["product_id"]:
+                    info_json = await anext(infos, None)
+                else:
+                    price_json = await anext(prices, None)
+            span.set_attribute("product.count", count)
+
 @app.get("/products/ids")
-async def list_product_ids():
+async def list_product_ids(
+    request: Request,
+    limit: int = Query(pagination_settings.default_limit, ge=1),
+    cursor: str | None = None,
+):
     with tracer.start_as_current_span("list_product_ids") as span:
+        limit = min(limit, pagination_settings.max_limit)
         span.set_attribute("product.action", "list_product_ids")
 
         try:
             logger.info("Listing product ids...")
 
-            with (
-                pymysql.connect(
-                    host=pymysql_settings.host,
-                    port=pymysql_settings.port,
-                    database=pymysql_settings.db,
-                    user=pymysql_settings.user,
-                    password=pymysql_settings.password,
-                ) as conn,
-                conn.cursor(cursor=DictCursor) as cur,
-            ):
-                cur.execute("SELECT product_id FROM product_price")
-                product_ids = cur.fetchall()
-
-            return JSONResponse(status_code=status.HTTP_200_OK, content=[product_id['product_id'] for product_id in product_ids])
+            after = decode_cursor(cursor)
+            product_ids_snapshot: ProductIdsSnapshot = request.app.state.product_ids_snapshot
+            product_ids, next_after = await product_ids_snapshot.get_page(after, limit)
+
+            return ORJSONResponse(status_code=status.HTTP_200_OK, content={
+                "items": product_ids,
+                "next_cursor": encode_cursor(next_after) if next_after is not None else None,
+            })
+        except InvalidCursorError as e:
+            return ORJSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"message": str(e)})
         except httpx.HTTPStatusError as e:
             logger.exception(str(e))
-            span.set_status(trace.StatusCode, "ERROR")
+            span.set_status(trace.StatusCode.ERROR, str(e))
             span.record_exception(e)
 
-            return JSONResponse(status_code=e.response.status_code, content=e.response.json())
+            return ORJSONResponse(status_code=e.response.status_code, content=e.response.json())
 
 @app.get("/products/{product_id}")
-async def get_product(product_id: str):
+async def get_product(product_id: str, request: Request):
     with tracer.start_as_current_span("get_single_product") as span:
         span.set_attribute("product.action", "get_product")
         span.set_attribute("product.count", 1)
         
         try:
-            logger.info(f"Getting product {product_id}...")
+            logger.info("Getting product %s...", product_id)
 
-            async with httpx.AsyncClient() as client:
+            info_client: httpx.AsyncClient = request.app.state.product_info_client
+            price_client: httpx.AsyncClient = request.app.state.product_price_client
+            product_cache: ReadThroughCache = request.app.state.product_cache
+
+            async def load_product() -> dict:
                 info_resp: httpx.Response
                 price_resp: httpx.Response
 
-
                 [info_resp, price_resp] = await asyncio.gather(*[
-                    client.get(f"{service_settings.product_info_service_url}/products/infos/{product_id}"),
-                    client.get(f"{service_settings.product_price_service_url}/products/prices/{product_id}"),
+                    info_client.get(f"/products/infos/{product_id}"),
+                    price_client.get(f"/products/prices/{product_id}"),
                 ])
                 info_resp.raise_for_status()
                 price_resp.raise_for_status()
 
-                info_json = info_resp.json()
-                price_json = price_resp.json()
-
-                price = Price(**price_json)
-                product = Product(**{
-                    **info_json,
-                    "price": price,
-                })
+                [product] = validate_products([join_product(read_json(info_resp), read_json(price_resp))])
+                return product
 
-            return JSONResponse(status_code=status.HTTP_200_OK, content=product.model_dump())
+            content = await product_cache.get_or_load(("product", product_id), load_product)
+            return ORJSONResponse(status_code=status.HTTP_200_OK, content=content)
         except httpx.HTTPStatusError as e:
             logger.exception(str(e))
-            span.set_status(trace.StatusCode, "ERROR")
+            span.set_status(trace.StatusCode.ERROR, str(e))
             span.record_exception(e)
-            return JSONResponse(status_code=e.response.status_code, content=e.response.json())
+            return ORJSONResponse(status_code=e.response.status_code, content=e.response.json())
 
 
 
 @app.get("/products")
-async def list_products():
+async def list_products(
+    request: Request,
+    limit: int = Query(pagination_settings.default_limit, ge=1),
+    cursor: str | None = None,
+):
     with tracer.start_as_current_span("list_products") as span:
+        limit = min(limit, pagination_settings.max_limit)
         span.set_attribute("product.action", "list_products")
 
         try:
-            async with httpx.AsyncClient() as client:
-                logger.info("Listing products...")
-                info_resp: httpx.Response
-                price_resp: httpx.Response
-
-                [info_resp, price_resp] = await asyncio.gather(*[
-                    client.get(f"{service_settings.product_info_service_url}/products/infos"),
-                    client.get(f"{service_settings.product_price_service_url}/products/prices"),
-                ])
+            logger.info("Listing products...")
+            info_client: httpx.AsyncClient = request.app.state.product_info_client
+            price_client: httpx.AsyncClient = request.app.state.product_price_client
+            product_cache: ReadThroughCache = request.app.state.product_cache
+
+            if accepts_ndjson(request):
+                #? Both upstream streams are opened before responding so upstream failures keep their status code
+                params = {"cursor": cursor} if cursor is not None else {}
+                stack = AsyncExitStack()
+                try:
+                    results = await asyncio.gather(*[
+                        open_ndjson_stream(stack, info_client, "/products/infos", params),
+                        open_ndjson_stream(stack, price_client, "/products/prices", params),
+                    ], return_exceptions=True)
+                    if errors := [result for result in results if isinstance(result, BaseException)]:
+                        raise errors[0]
+                except BaseException:
+                    #? Cancelled or failed while opening: release both connections and their admission slots
+                    await stack.aclose()
+                    raise
+                info_resp, price_resp = results
+                #? The stream closes the stack once joined; the background task also covers a body that is never read
+                return StreamingResponse(
+                    stream_join_products(stack, info_resp, price_resp),
+                    media_type=NDJSON_MEDIA_TYPE,
+                    background=BackgroundTask(stack.aclose),
+                )
+
+            async def load_products() -> dict:
+                #? The info page decides which products are on the page, prices are then fetched for exactly those ids
+                params = {"limit": limit, **({"cursor": cursor} if cursor is not None else {})}
+                info_resp = await info_client.get("/products/infos", params=params)
                 info_resp.raise_for_status()
+                info_page = read_json(info_resp)
+                info_json = info_page["items"]
+                if not info_json:
+                    return {"items": [], "next_cursor": info_page["next_cursor"]}
+
+                price_resp = await price_client.post(
+                    "/products/prices:batchGet",
+                    json={"product_ids": [product_info["product_id"] for product_info in info_json]},
+                )
                 price_resp.raise_for_status()
-
-                info_json = info_resp.json()
-                price_json = price_resp.json()
-
-                if len(info_json) != len(price_json):
-                    return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={"message": "Mismatch in product info and price data"})
-                
-                info_json_map = {product_info['product_id']: product_info for product_info in info_json}
-                price_json_map = {product_info['product_id']: product_info for product_info in price_json}
-
-                products: list[Product] = []
-                for product_id in info_json_map.keys():
-                    price = Price(**price_json_map[product_id])
-                    product = Product(**{
-                        **info_json_map[product_id],
-                        "price": price,
-                    })
-                    products.append(product)
-
-                return JSONResponse(status_code=status.HTTP_200_OK, content=[product.model_dump() for product in products])
+                price_json_map = {product_price["product_id"]: product_price for product_price in read_json(price_resp)["product_prices"]}
+
+                products: list[dict] = []
+                for product_info in info_json:
+                    price_json = price_json_map.get(product_info["product_id"])
+                    if price_json is None:
+                        continue
+                    products.append(join_product(product_info, price_json))
+                if len(products) != len(info_json):
+                    logger.warning("Skipped %s products without price data", len(info_json) - len(products))
+
+                #? The upstream cursor is opaque and keyed on product id, so it is passed through unchanged
+                return {"items": validate_products(products), "next_cursor": info_page["next_cursor"]}
+
+            content = await product_cache.get_or_load(("products", limit, cursor), load_products)
+            return ORJSONResponse(status_code=status.HTTP_200_OK, content=content)
         except httpx.HTTPStatusError as e:
             logger.exception(str(e))
-            span.set_status(trace.StatusCode, "ERROR")
+            span.set_status(trace.StatusCode.ERROR, str(e))
             span.record_exception(e)
 
-            return JSONResponse(status_code=e.response.status_code, content=e.response.json())
+            return ORJSONResponse(status_code=e.response.status_code, content=e.response.json())
         
+@app.post("/products:batchGet")
+async def batch_get_products(batch_request: ProductBatchGetRequest, request: Request):
+    with tracer.start_as_current_span("batch_get_products") as span:
+        product_ids = list(dict.fromkeys(batch_request.product_ids))
+        span.set_attribute("product.action", "batch_get_products")
+        span.set_attribute("product.count", len(product_ids))
+
+        try:
+            logger.info("Batch getting %s products...", len(product_ids))
+
+            info_client: httpx.AsyncClient = request.app.state.product_info_client
+            price_client: httpx.AsyncClient = request.app.state.product_price_client
+            info_resp: httpx.Response
+            price_resp: httpx.Response
+
+            [info_resp, price_resp] = await asyncio.gather(*[
+                info_client.post("/products/infos:batchGet", json={"product_ids": product_ids}),
+                price_client.post("/products/prices:batchGet", json={"product_ids": product_ids}),
+            ])
+            info_resp.raise_for_status()
+            price_resp.raise_for_status()
+
+            info_json_map = {product_info["product_id"]: product_info for product_info in read_json(info_resp)["product_infos"]}
+            price_json_map = {product_price["product_id"]: product_price for product_price in read_json(price_resp)["product_prices"]}
+
+            #? Missing halves are reported per item so one unknown id does not fail the batch
+            items: list[dict] = []
+            for product_id in product_ids:
+                info_json = info_json_map.get(product_id)
+                price_json = price_json_map.get(product_id)
+                missing: list[Literal["info", "price"]] = []
+                if info_json is None:
+                    missing.append("info")
+                if price_json is None:
+                    missing.append("price")
+
+                product = join_product(info_json, price_json) if not missing else None
+                items.append({"product_id": product_id, "product": product, "missing": missing})
+            if serialization_settings.strict_validation:
+                items = batch_items_adapter.dump_python(batch_items_adapter.validate_python(items))
+
+            span.set_attribute("product.missing_count", sum(1 for item in items if item["missing"]))
+            return ORJSONResponse(status_code=status.HTTP_200_OK, content={"items": items})
+        except httpx.HTTPStatusError as e:
+            logger.exception(str(e))
+            span.set_status(trace.StatusCode.ERROR, str(e))
+            span.record_exception(e)
+
+            return ORJSONResponse(status_code=e.response.status_code, content=e.response.json())
+
+@app.exception_handler(httpx.TimeoutException)
+async def upstream_timeout_handler(request: Request, exc: httpx.TimeoutException):
+    #? Raised once an upstream call's deadline is spent, retries and hedges included
+    logger.warning("Upstream call timed out: %s", exc)
+    return ORJSONResponse(status_code=status.HTTP_504_GATEWAY_TIMEOUT, content={"message": "Upstream timed out"})
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    #? An upstream call was shed before being sent, the caller should back off and retry
+    return ORJSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"message": "Server overloaded, retry later"},
+        headers={"Retry-After": "1"},
+    )
+
+#! Only tags requests with their route priority, slots are taken around each upstream call
+app.add_middleware(AdmissionMiddleware, settings=admission_settings)
+#! Runs inside the RED metrics middleware, which then records the 503s and 504s answered here
+app.add_middleware(DeadlineMiddleware)
+#! Added before the instrumentation so RED metrics are recorded inside the server span, with its trace as exemplar
+app.add_middleware(REDMetricsMiddleware)
 #! We need to put it here as we can't add middleware after app is created
 setup_fastapi_instrumentation(app)
\ No newline at end of file
@@ -0,0 +1,21 @@
+from typing import AsyncIterator
+
+import httpx
+import orjson
+from fastapi import Request
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def accepts_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_line(content: dict) -> bytes:
+    return orjson.dumps(content) + b"\n"
+
+
+async def iter_ndjson(response: httpx.Response) -> AsyncIterator[dict]:
+    async for line in response.aiter_lines():
+        if line:
+            yield orjson.loads(line)
@@ -1,4 +1,6 @@
 import logging
+import os
+from pathlib import Path
 from typing import TYPE_CHECKING
 
 # ? General imports for common labels in OTEL
@@ -6,22 +8,17 @@ from opentelemetry.sdk.resources import SERVICE_NAME, SERVICE_INSTANCE_ID, Resou
 
 # ? Imports for setting up traces and exporting them to the OTLP endpoint
 from opentelemetry import trace
-from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 
 # ? Imports for setting up metrics and exporting them to the OTLP endpoint
 from opentelemetry import metrics
-from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
-from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics import MeterProvider, TraceBasedExemplarFilter
 from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 
 # ? Imports for setting up logs and exporting them to the OTLP endpoint
 from opentelemetry._logs import set_logger_provider
 from opentelemetry.instrumentation.logging import LoggingInstrumentor
-from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
 from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
-from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
 
 # ? Import for instrumenting HTTPX client
 from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
@@ -29,60 +26,152 @@ from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
 # ? Import for instrumenting FastAPI app
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 
-#? Import for instrumenting Mysql
-from opentelemetry.instrumentation.pymysql import PyMySQLInstrumentor
-
-from config import ProjectSettings, OTELSettings
+from config import (
+    LogControlSettings,
+    ProjectSettings,
+    OTELSettings,
+    ProfilerSettings,
+    RuntimeMetricsSettings,
+    SpoolSettings,
+    TailSamplingSettings,
+)
+from log_control import setup_log_control
+from metrics import get_views
+from otlp_export import (
+    InstrumentedBatchLogRecordProcessor,
+    InstrumentedBatchSpanProcessor,
+    InstrumentedMetricExporter,
+    create_exporter,
+    get_metric_temporality,
+)
+from profiler import setup_profiler
+from resilience import mark_resent_span
+from runtime_metrics import setup_runtime_metrics
+from sampling import create_sampler
+from spool import OTLPHTTPSender, SpoolingLogExporter, SpoolingMetricExporter, SpoolingSpanExporter
+from tail_sampling import TailSamplingSpanProcessor
+from workers import claim_worker_slot
 
 if TYPE_CHECKING:
     from fastapi import FastAPI
 
 project_settings = ProjectSettings()
 otel_settings = OTELSettings()
+tail_sampling_settings = TailSamplingSettings()
+spool_settings = SpoolSettings()
+log_control_settings = LogControlSettings()
+runtime_metrics_settings = RuntimeMetricsSettings()
+profiler_settings = ProfilerSettings()
 
 logger = logging.getLogger(__name__)
 
 
+def get_service_instance_id() -> str:
+    # ? With several workers each process is an instance of its own, named after its worker slot
+    if project_settings.web_concurrency <= 1:
+        return project_settings.service_instance_id
+    slot = claim_worker_slot(project_settings.service_instance_id, project_settings.web_concurrency)
+    return f"{project_settings.service_instance_id}-worker-{slot if slot is not None else os.getpid()}"
+
+
+def get_spool_directory(signal: str) -> Path:
+    # ? Every instance needs its own spool, a segment log has a single writer and reader
+    return Path(spool_settings.directory) / get_service_instance_id() / signal
+
+
 def setup_otel() -> None:
+    """
+    Set up the tracer, meter and logger providers of this process.
+
+    Called from the app lifespan, so it runs in every worker process once the
+    server has spawned or forked it: exporter threads, spools and the profiler
+    are never shared between workers.
+    """
+    # ? The API's no-op providers stay in place, so spans and metrics recorded by the app cost next to nothing
+    if otel_settings.otel_sdk_disabled:
+        return
+
     # ? Service name is required for most backends
     resource = Resource(
         attributes={
             SERVICE_NAME: project_settings.service_name,
-            SERVICE_INSTANCE_ID: project_settings.service_instance_id,
+            SERVICE_INSTANCE_ID: get_service_instance_id(),
             "service.environment": project_settings.env,
         }
     )
 
     # ? Setting up the TraceProvider for exporting traces to the OTLP endpoint
-    trace_provider = TracerProvider(resource=resource)
-    processor = BatchSpanProcessor(
-        OTLPSpanExporter(
-            endpoint=f"{otel_settings.otel_exporter_otlp_endpoint}/v1/traces"
-        )
+    # ? Root spans are sampled by ratio and rate, child spans follow their parent's decision
+    sampler = create_sampler(
+        otel_settings.otel_sampling_ratio,
+        otel_settings.otel_sampling_route_ratios,
+        otel_settings.otel_sampling_max_traces_per_second,
     )
+    trace_provider = TracerProvider(resource=resource, sampler=sampler)
+    # ? Transport, compression and batching are set per signal in OTELSettings
+    # ? The spool sends OTLP/HTTP payloads itself, so for real exports it takes the exporter's place
+    if spool_settings.enabled and otel_settings.otel_export_mode == "otlp":
+        span_exporter = SpoolingSpanExporter(
+            get_spool_directory("traces"),
+            spool_settings,
+            OTLPHTTPSender("traces", otel_settings.otel_exporter_otlp_endpoint, otel_settings.otel_traces_export),
+        )
+    else:
+        span_exporter = create_exporter(
+            "traces", otel_settings.otel_exporter_otlp_endpoint, otel_settings.otel_traces_export, otel_settings.otel_export_mode
+        )
+    processor = InstrumentedBatchSpanProcessor(span_exporter, otel_settings.otel_traces_export)
+    if tail_sampling_settings.enabled:
+        # ? Only slow, failed and baseline traces reach the batch processor
+        processor = TailSamplingSpanProcessor(processor, tail_sampling_settings)
     trace_provider.add_span_processor(processor)
     trace.set_tracer_provider(trace_provider)
 
     # ? Setting up the MeterProvider for exporting metrics to the OTLP endpoint
-    reader = PeriodicExportingMetricReader(
-        OTLPMetricExporter(
-            endpoint=f"{otel_settings.otel_exporter_otlp_endpoint}/v1/metrics"
+    if spool_settings.enabled and otel_settings.otel_export_mode == "otlp":
+        metric_exporter = SpoolingMetricExporter(
+            get_spool_directory("metrics"),
+            spool_settings,
+            OTLPHTTPSender("metrics", otel_settings.otel_exporter_otlp_endpoint, otel_settings.otel_metrics_export),
+            get_metric_temporality(otel_settings.otel_metrics_export),
+        )
+    else:
+        metric_exporter = create_exporter(
+            "metrics", otel_settings.otel_exporter_otlp_endpoint, otel_settings.otel_metrics_export, otel_settings.otel_export_mode
         )
+    reader = PeriodicExportingMetricReader(
+        InstrumentedMetricExporter(metric_exporter, otel_settings.otel_metrics_export),
+        export_interval_millis=otel_settings.otel_metrics_export.export_interval_ms,
+        export_timeout_millis=otel_settings.otel_metrics_export.export_timeout_ms,
+    )
+    # ? Views fix the histogram buckets and label allow-lists; exemplars link buckets to sampled traces
+    metric_provider = MeterProvider(
+        resource=resource,
+        metric_readers=[reader],
+        views=get_views(),
+        exemplar_filter=TraceBasedExemplarFilter(),
     )
-    metric_provider = MeterProvider(resource=resource, metric_readers=[reader])
     metrics.set_meter_provider(metric_provider)
+    #? Saturation of this process: event loop lag, worker threads, in-flight requests, GC and memory
+    setup_runtime_metrics(runtime_metrics_settings)
 
     # ? Setting up the LoggingInstrumentor for log, and log export to the OTLP endpoint
     LoggingInstrumentor().instrument(set_logging_format=True)
     logger_provider = LoggerProvider(resource=resource)
     set_logger_provider(logger_provider)
 
-    logger_provider.add_log_record_processor(
-        BatchLogRecordProcessor(
-            OTLPLogExporter(
-                endpoint=f"{otel_settings.otel_exporter_otlp_endpoint}/v1/logs"
-            )
+    if spool_settings.enabled and otel_settings.otel_export_mode == "otlp":
+        log_exporter = SpoolingLogExporter(
+            get_spool_directory("logs"),
+            spool_settings,
+            OTLPHTTPSender("logs", otel_settings.otel_exporter_otlp_endpoint, otel_settings.otel_logs_export),
         )
+    else:
+        log_exporter = create_exporter(
+            "logs", otel_settings.otel_exporter_otlp_endpoint, otel_settings.otel_logs_export, otel_settings.otel_export_mode
+        )
+    logger_provider.add_log_record_processor(
+        InstrumentedBatchLogRecordProcessor(log_exporter, otel_settings.otel_logs_export)
     )
     otlp_logging_handler = LoggingHandler(
         level=logging.NOTSET, logger_provider=logger_provider
@@ -90,16 +179,30 @@ def setup_otel() -> None:
 
     # Attach OTLP handler to root logger
     logging.getLogger().addHandler(otlp_logging_handler)
+    # ? Sampling and rate limiting run as handler filters, before records are formatted or exported
+    setup_log_control(log_control_settings)
+
+    #? Opt-in stack sampling, attributed to the active span and exported as log records linked to it
+    setup_profiler(
+        profiler_settings,
+        trace_provider,
+        logger_provider,
+        Path(profiler_settings.directory) / get_service_instance_id(),
+    )
 
     logger.info("OTEL instrumentation setup complete")
 
 
-def setup_pymysql_instrumentation() -> None:
-    PyMySQLInstrumentor().instrument()
-
 def setup_httpx_instrumentation() -> None:
-    HTTPXClientInstrumentor().instrument()
+    if otel_settings.otel_sdk_disabled:
+        return
+    # ? Hedged and retried attempts each get a client span, marked with their resend count
+    HTTPXClientInstrumentor().instrument(async_request_hook=mark_resent_span)
 
 
 def setup_fastapi_instrumentation(app: "FastAPI") -> None:
+    if otel_settings.otel_sdk_disabled:
+        return
+    # ? Safe at import time, before workers are forked: the middleware only holds proxy tracers and meters,
+    # ? which bind to the providers that setup_otel installs in each worker
     FastAPIInstrumentor.instrument_app(app)
\ No newline at end of file
@@ -0,0 +1,77 @@
+import asyncio
+import bisect
+import logging
+import time
+
+import httpx
+
+from http_client import read_json
+
+logger = logging.getLogger(__name__)
+
+
+class ProductIdsSnapshot:
+    """
+    In-memory copy of the product ids served by product-price-querier.
+
+    The first caller loads the snapshot; afterwards callers always get the
+    current copy immediately and a stale copy triggers a single background
+    refresh. A failed refresh keeps serving the previous snapshot. Ids are
+    kept sorted so pages can be served by bisecting on the cursor.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, refresh_interval: float, page_size: int) -> None:
+        self._client = client
+        self._refresh_interval = refresh_interval
+        self._page_size = page_size
+        self._product_ids: list[str] | None = None
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+
+    async def get(self) -> list[str]:
+        if self._product_ids is None:
+            async with self._lock:
+                if self._product_ids is None:
+                    await self._refresh()
+        elif self._is_stale() and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh_in_background())
+        return self._product_ids
+
+    async def get_page(self, after: str | None, limit: int) -> tuple[list[str], str | None]:
+        product_ids = await self.get()
+        start = bisect.bisect_right(product_ids, after) if after is not None else 0
+        page = product_ids[start:start + limit]
+        next_after = page[-1] if start + limit < len(product_ids) else None
+        return page, next_after
+
+    async def close(self) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+
+    def _is_stale(self) -> bool:
+        return time.monotonic() - self._refreshed_at > self._refresh_interval
+
+    async def _refresh(self) -> None:
+        product_ids: list[str] = []
+        cursor: str | None = None
+        while True:
+            params = {"limit": self._page_size, **({"cursor": cursor} if cursor is not None else {})}
+            resp = await self._client.get("/products/prices/ids", params=params)
+            resp.raise_for_status()
+            page = read_json(resp)
+            product_ids.extend(page["items"])
+            if (cursor := page["next_cursor"]) is None:
+                break
+        self._product_ids = sorted(product_ids)
+        self._refreshed_at = time.monotonic()
+        logger.info("Refreshed product ids snapshot with %s ids", len(self._product_ids))
+
+    async def _refresh_in_background(self) -> None:
+        try:
+            async with self._lock:
+                await self._refresh()
+        except (httpx.HTTPError, ValueError) as e:
+            #? ValueError is a body that is not JSON; retried after another interval rather than by every request meanwhile
+            self._refreshed_at = time.monotonic()
+            logger.warning("Failed to refresh product ids snapshot, serving stale copy: %s", e)
@@ -0,0 +1,229 @@
+import asyncio
+import itertools
+import random
+import time
+from collections import deque
+from typing import Iterator
+
+import httpx
+from opentelemetry import metrics, trace
+from opentelemetry.trace import Span
+
+from config import ResilienceSettings
+from deadline import DEADLINE_HEADER, get_remaining_time
+from metrics import get_route_template
+
+meter = metrics.get_meter(__name__)
+
+resends_counter = meter.create_counter(
+    "gateway.upstream.resends",
+    unit="{request}",
+    description="Hedged and retried upstream requests, including those denied by the retry budget",
+)
+
+#? Request extension carrying the resend count and reason of an attempt, read back by the HTTPX span hook
+RESEND_EXTENSION = "resend"
+
+_HEDGE_WINDOW_SIZE = 1000
+_HEDGE_MIN_SAMPLES = 50
+
+
+class UpstreamDeadlineExceeded(httpx.TimeoutException):
+    pass
+
+
+class RetryBudget:
+    """
+    Token bucket bounding hedges and retries to a share of the calls made.
+
+    Every call earns `ratio` tokens and the bucket also refills by
+    `min_per_second`, so a failing upstream gets at most that much extra load
+    instead of a retry storm.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, burst: float) -> None:
+        self._ratio = ratio
+        self._min_per_second = min_per_second
+        self._burst = burst
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+
+    def deposit(self) -> None:
+        self._tokens = min(self._burst, self._tokens + self._ratio)
+
+    def try_withdraw(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * self._min_per_second)
+        self._refilled_at = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+
+class _LatencyWindow:
+    """Recent response times of one route; the percentile is recomputed every few samples, not per call."""
+
+    def __init__(self) -> None:
+        self._values: deque[float] = deque(maxlen=_HEDGE_WINDOW_SIZE)
+        self._since_computed = 0
+        self._percentiles: dict[float, float] = {}
+
+    def record(self, seconds: float) -> None:
+        self._values.append(seconds)
+        self._since_computed += 1
+
+    def percentile(self, percent: float) -> float | None:
+        if len(self._values) < _HEDGE_MIN_SAMPLES:
+            return None
+        if percent not in self._percentiles or self._since_computed >= _HEDGE_MIN_SAMPLES:
+            values = sorted(self._values)
+            self._percentiles = {percent: values[min(len(values) - 1, int(len(values) * percent / 100))]}
+            self._since_computed = 0
+        return self._percentiles[percent]
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper adding a deadline, hedging and budgeted retries to the calls made to one upstream.
+
+    Each call gets the upstream's deadline, capped by the incoming request's
+    own, and the time left is sent downstream in `X-Request-Timeout-Ms`.
+    Idempotent calls (reads and `:batchGet`) still outstanding after the
+    route's hedge percentile get a second request, and the slower one is
+    cancelled; failed calls are retried with jittered backoff. Hedges and
+    retries share the upstream's `RetryBudget`.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, upstream: str, settings: ResilienceSettings) -> None:
+        self._transport = transport
+        self._upstream = upstream
+        self._settings = settings
+        self._deadline = settings.upstream_deadlines_ms.get(upstream, settings.deadline_ms) / 1000
+        self._budget = RetryBudget(
+            settings.retry_budget_ratio, settings.retry_budget_min_per_second, settings.retry_budget_burst
+        )
+        #? Keyed on the route template, so every product id shares its route's window
+        self._latencies: dict[str, _LatencyWindow] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not self._settings.enabled:
+            return await self._transport.handle_async_request(request)
+
+        timeout = self._deadline
+        if (remaining := get_remaining_time()) is not None:
+            timeout = min(timeout, remaining)
+        deadline = time.monotonic() + timeout
+        resendable = self._is_resendable(request)
+        resend_counts = itertools.count()
+        self._budget.deposit()
+
+        try:
+            async with asyncio.timeout(max(timeout, 0.0)):
+                for retry in itertools.count():
+                    error: httpx.TransportError | None = None
+                    response: httpx.Response | None = None
+                    try:
+                        response = await self._send_hedged(request, deadline, resendable, resend_counts)
+                    except httpx.TransportError as e:
+                        error = e
+                    failed = error is not None or response.status_code in self._settings.retry_status_codes
+                    if not (failed and resendable and retry < self._settings.max_retries and self._try_resend("retry")):
+                        if error is not None:
+                            raise error
+                        return response
+                    if response is not None:
+                        await response.aclose()
+                    backoff = random.uniform(0, self._settings.retry_backoff_ms * 2**retry) / 1000
+                    await asyncio.sleep(backoff)
+        except TimeoutError:
+            raise UpstreamDeadlineExceeded(
+                f"Deadline of {timeout * 1000:.0f}ms exceeded calling {self._upstream}", request=request
+            ) from None
+        raise AssertionError("unreachable")
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+    def _is_resendable(self, request: httpx.Request) -> bool:
+        idempotent = request.method in ("GET", "HEAD") or request.url.path.endswith(":batchGet")
+        #? Only buffered bodies can be sent again
+        return idempotent and isinstance(request.stream, httpx.ByteStream)
+
+    def _try_resend(self, reason: str) -> bool:
+        allowed = self._budget.try_withdraw()
+        resends_counter.add(1, {"upstream": self._upstream, "reason": reason, "result": "sent" if allowed else "denied"})
+        if allowed:
+            trace.get_current_span().add_event(f"upstream.{reason}", {"upstream": self._upstream})
+        return allowed
+
+    def _hedge_delay(self, route: str) -> float:
+        window = self._latencies.get(route)
+        delay = window.percentile(self._settings.hedge_percentile) if window is not None else None
+        if delay is None:
+            delay = self._settings.hedge_initial_delay_ms / 1000
+        return max(delay, self._settings.hedge_min_delay_ms / 1000)
+
+    async def _send_hedged(
+        self, request: httpx.Request, deadline: float, resendable: bool, resend_counts: Iterator[int]
+    ) -> httpx.Response:
+        first = asyncio.create_task(self._send(request, deadline, next(resend_counts), None))
+        if not (self._settings.hedge_enabled and resendable):
+            return await first
+
+        pending: set[asyncio.Task] = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self._hedge_delay(get_route_template(request.url.path)))
+            if done:
+                return first.result()
+            if not self._try_resend("hedge"):
+                pending.clear()
+                return await first
+            pending.add(asyncio.create_task(self._send(request, deadline, next(resend_counts), "hedge")))
+
+            #? The first good response wins; if both fail, the last outcome goes to the retry logic
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in self._settings.retry_status_codes:
+                        for other in done - {task}:
+                            if other.exception() is None:
+                                await other.result().aclose()
+                        return task.result()
+                if not pending:
+                    return task.result()
+                for task in done:
+                    if task.exception() is None:
+                        await task.result().aclose()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send(
+        self, request: httpx.Request, deadline: float, resend_count: int, reason: str | None
+    ) -> httpx.Response:
+        #? A request per attempt: the instrumentation replaces the headers of the request it sends
+        attempt = httpx.Request(
+            request.method,
+            request.url,
+            headers=request.headers.copy(),
+            stream=request.stream,
+            extensions={**request.extensions, RESEND_EXTENSION: (resend_count, reason or "retry")},
+        )
+        attempt.headers[DEADLINE_HEADER] = str(max(0, int((deadline - time.monotonic()) * 1000)))
+        started_at = time.perf_counter()
+        response = await self._transport.handle_async_request(attempt)
+        route = get_route_template(request.url.path)
+        self._latencies.setdefault(route, _LatencyWindow()).record(time.perf_counter() - started_at)
+        return response
+
+
+async def mark_resent_span(span: Span, request) -> None:
+    """HTTPX instrumentation hook marking hedged and retried attempts on their client span."""
+    resend = (request.extensions or {}).get(RESEND_EXTENSION)
+    if resend is None or not span.is_recording():
+        return
+    resend_count, reason = resend
+    if resend_count:
+        span.set_attribute("http.request.resend_count", resend_count)
+        span.set_attribute("gateway.resend_reason", reason)
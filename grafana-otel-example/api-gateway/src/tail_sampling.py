@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from opentelemetry import metrics
+from opentelemetry.context import Context
+from opentelemetry.metrics import CallbackOptions, Observation
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.sampling import TraceIdRatioBased
+from opentelemetry.semconv.trace import SpanAttributes
+from opentelemetry.trace import StatusCode
+
+from config import TailSamplingSettings
+
+meter = metrics.get_meter(__name__)
+
+decisions_counter = meter.create_counter(
+    "otel.tail_sampling.decisions", unit="{trace}", description="Local traces kept or dropped when their root span ended"
+)
+evictions_counter = meter.create_counter(
+    "otel.tail_sampling.evictions", unit="{trace}", description="Undecided traces dropped to stay within the buffer bounds"
+)
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    Buffers the spans of each local trace and forwards them to `delegate` only if the trace is kept.
+
+    The decision is taken when the local root span ends (the span without a
+    parent, or with a remote one): a trace is kept if any of its spans has an
+    error status, if the root took at least the latency threshold for its
+    route, or if its trace id falls within the baseline ratio. Spans ending
+    after the decision follow it. Buffered traces are bounded by count and by
+    total spans, evicting the oldest undecided trace first.
+    """
+
+    def __init__(self, delegate: SpanProcessor, settings: TailSamplingSettings) -> None:
+        self._delegate = delegate
+        self._settings = settings
+        self._baseline_bound = TraceIdRatioBased.get_bound_for_rate(settings.baseline_ratio)
+        self._traces: OrderedDict[int, list[ReadableSpan]] = OrderedDict()
+        self._buffered_spans = 0
+        #? Recent decisions, so spans ending after their local root are not buffered again
+        self._decisions: OrderedDict[int, bool] = OrderedDict()
+        self._lock = threading.Lock()
+        meter.create_observable_gauge(
+            "otel.tail_sampling.buffered_spans",
+            callbacks=[self._observe_buffered_spans],
+            unit="{span}",
+            description="Spans held while waiting for their local root span to end",
+        )
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        self._delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if not span.context.trace_flags.sampled:
+            return
+
+        trace_id = span.context.trace_id
+        is_local_root = span.parent is None or span.parent.is_remote
+        kept: list[ReadableSpan] = []
+        reason: str | None = None
+        decided = False
+        evicted = 0
+        with self._lock:
+            decision = self._decisions.get(trace_id)
+            if decision is not None:
+                if decision:
+                    kept = [span]
+            elif is_local_root:
+                spans = self._traces.pop(trace_id, [])
+                self._buffered_spans -= len(spans)
+                spans.append(span)
+                reason = self._decide(span, spans)
+                self._remember(trace_id, reason is not None)
+                decided = True
+                if reason is not None:
+                    kept = spans
+            else:
+                self._traces.setdefault(trace_id, []).append(span)
+                self._buffered_spans += 1
+                evicted = self._evict()
+
+        if decided:
+            decisions_counter.add(1, {"decision": "keep" if reason is not None else "drop", "reason": reason or "none"})
+        if evicted:
+            evictions_counter.add(evicted)
+        for kept_span in kept:
+            self._delegate.on_end(kept_span)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._traces.clear()
+            self._buffered_spans = 0
+        self._delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._delegate.force_flush(timeout_millis)
+
+    def _decide(self, root: ReadableSpan, spans: list[ReadableSpan]) -> str | None:
+        """Return why the trace is kept, or None to drop it."""
+        if any(span.status.status_code is StatusCode.ERROR for span in spans):
+            return "error"
+        route = root.attributes.get(SpanAttributes.HTTP_ROUTE) if root.attributes else None
+        threshold_ms = self._settings.route_latency_thresholds_ms.get(route, self._settings.latency_threshold_ms)
+        if root.end_time is not None and root.start_time is not None and (root.end_time - root.start_time) / 1e6 >= threshold_ms:
+            return "latency"
+        if root.context.trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self._baseline_bound:
+            return "baseline"
+        return None
+
+    def _remember(self, trace_id: int, keep: bool) -> None:
+        self._decisions[trace_id] = keep
+        while len(self._decisions) > self._settings.max_traces:
+            self._decisions.popitem(last=False)
+
+    def _evict(self) -> int:
+        evicted = 0
+        while len(self._traces) > self._settings.max_traces or self._buffered_spans > self._settings.max_spans:
+            trace_id, spans = self._traces.popitem(last=False)
+            self._buffered_spans -= len(spans)
+            #? The rest of an evicted trace is dropped too, it could not be kept whole anyway
+            self._remember(trace_id, False)
+            evicted += 1
+        return evicted
+
+    def _observe_buffered_spans(self, options: CallbackOptions) -> Iterable[Observation]:
+        yield Observation(self._buffered_spans)
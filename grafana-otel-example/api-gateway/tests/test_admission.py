@@ -0,0 +1,75 @@
+import asyncio
+
+import httpx
+import pytest
+
+from admission import AdaptiveConcurrencyLimit, AdmissionRejected
+from config import AdmissionSettings
+from http_client import TimedTransport
+
+
+class Body(httpx.AsyncByteStream):
+    """Response body streamed like one read off the network; bodies given as content are read up front by httpx."""
+
+    async def __aiter__(self):
+        yield b'{"id": 1}\n'
+
+
+def create_client(limit: AdaptiveConcurrencyLimit, handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(base_url="http://upstream", transport=TimedTransport(httpx.MockTransport(handler), "upstream", limit))
+
+
+def test_call_over_limit_is_shed_without_a_queue():
+    limit = AdaptiveConcurrencyLimit("upstream", AdmissionSettings(initial_limit=1, min_limit=1, max_queue_size=0))
+
+    async def run() -> None:
+        release = asyncio.Event()
+
+        async def handler(request: httpx.Request) -> httpx.Response:
+            await release.wait()
+            return httpx.Response(200, stream=Body())
+
+        async with create_client(limit, handler) as client:
+            first = asyncio.create_task(client.get("/products/infos/1"))
+            await asyncio.sleep(0)
+            with pytest.raises(AdmissionRejected) as e:
+                await client.get("/products/infos/2")
+            assert e.value.reason == "queue_full"
+            release.set()
+            assert (await first).status_code == 200
+
+    asyncio.run(run())
+    assert limit.in_flight == 0
+
+
+def test_slot_is_held_until_the_body_is_closed():
+    limit = AdaptiveConcurrencyLimit("upstream", AdmissionSettings())
+
+    async def run() -> None:
+        async def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, stream=Body())
+
+        async with create_client(limit, handler) as client:
+            async with client.stream("GET", "/products/infos") as resp:
+                assert limit.in_flight == 1
+                await resp.aread()
+            assert limit.in_flight == 0
+            await client.get("/products/infos")
+            assert limit.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_failed_call_gives_its_slot_back():
+    limit = AdaptiveConcurrencyLimit("upstream", AdmissionSettings())
+
+    async def run() -> None:
+        def handler(request: httpx.Request) -> httpx.Response:
+            raise httpx.ConnectError("refused", request=request)
+
+        async with create_client(limit, handler) as client:
+            with pytest.raises(httpx.ConnectError):
+                await client.get("/products/infos/1")
+
+    asyncio.run(run())
+    assert limit.in_flight == 0
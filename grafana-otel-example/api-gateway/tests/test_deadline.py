@@ -0,0 +1,58 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from deadline import DEADLINE_HEADER, DeadlineMiddleware, get_remaining_time
+
+ROWS = 20
+ROW_DELAY_S = 0.01
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(DeadlineMiddleware)
+
+    @app.get("/slow")
+    async def slow():
+        await asyncio.sleep(1)
+        return {"message": "too late"}
+
+    @app.get("/remaining")
+    async def remaining():
+        return {"remaining": get_remaining_time()}
+
+    @app.get("/stream")
+    async def stream():
+        async def rows():
+            for i in range(ROWS):
+                await asyncio.sleep(ROW_DELAY_S)
+                yield b'{"row": %d}\n' % i
+
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    return app
+
+
+def test_request_past_deadline_is_answered_with_504():
+    with TestClient(create_app()) as client:
+        resp = client.get("/slow", headers={DEADLINE_HEADER: "50"})
+    assert resp.status_code == 504
+
+
+def test_remaining_time_is_exposed_to_handlers():
+    with TestClient(create_app()) as client:
+        assert client.get("/remaining").json() == {"remaining": None}
+        remaining = client.get("/remaining", headers={DEADLINE_HEADER: "5000"}).json()["remaining"]
+    assert 0 < remaining <= 5
+
+
+def test_stream_outlives_deadline_once_started():
+    #? The whole stream takes several times the deadline, its 200 is sent well within it
+    deadline_ms = ROWS * ROW_DELAY_S * 1000 / 4
+    with TestClient(create_app()) as client:
+        with client.stream("GET", "/stream", headers={DEADLINE_HEADER: str(deadline_ms)}) as resp:
+            assert resp.status_code == 200
+            lines = list(resp.iter_lines())
+    assert lines == [f'{{"row": {i}}}' for i in range(ROWS)]
@@ -0,0 +1,99 @@
+import asyncio
+import os
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import httpx
+from starlette.requests import Request
+
+from ndjson import NDJSON_MEDIA_TYPE
+
+# Settings main reads at import, unset again so they do not leak into other tests; no request reaches these upstreams
+with patch.dict(os.environ, {
+    "OTEL_SDK_DISABLED": "true",
+    "OTEL_EXPORTER_OTLP_ENDPOINT": "http://otel-collector:4318",
+    "PRODUCT_INFO_SERVICE_URL": "http://product-info-querier",
+    "PRODUCT_PRICE_SERVICE_URL": "http://product-price-querier",
+}):
+    import main
+
+
+class Body(httpx.AsyncByteStream):
+    """NDJSON body streamed like one read off the network, remembering whether it was closed."""
+
+    def __init__(self, rows: list[bytes]) -> None:
+        self._rows = rows
+        self.closed = False
+
+    async def __aiter__(self):
+        for row in self._rows:
+            yield row
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+def create_client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(base_url="http://upstream", transport=httpx.MockTransport(handler))
+
+
+def create_request(info_client: httpx.AsyncClient, price_client: httpx.AsyncClient) -> Request:
+    app = SimpleNamespace(state=SimpleNamespace(
+        product_info_client=info_client, product_price_client=price_client, product_cache=None
+    ))
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/products",
+        "query_string": b"",
+        "headers": [(b"accept", NDJSON_MEDIA_TYPE.encode())],
+        "app": app,
+    }
+    return Request(scope)
+
+
+def test_streams_are_closed_when_the_client_leaves_before_the_body():
+    info_body = Body([b'{"product_id": "1"}\n'])
+    price_body = Body([b'{"product_id": "1"}\n'])
+
+    async def run() -> None:
+        info_client = create_client(lambda request: httpx.Response(200, stream=info_body))
+        price_client = create_client(lambda request: httpx.Response(200, stream=price_body))
+        request = create_request(info_client, price_client)
+        response = await main.list_products(request, limit=10, cursor=None)
+
+        async def receive() -> dict:
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            await asyncio.sleep(1)
+
+        await response(request.scope, receive, send)
+        assert info_body.closed
+        assert price_body.closed
+
+    asyncio.run(run())
+
+
+def test_opened_stream_is_closed_when_cancelled_while_opening_the_other():
+    info_body = Body([b'{"product_id": "1"}\n'])
+
+    async def run() -> None:
+        info_opened = asyncio.Event()
+
+        async def info_handler(request: httpx.Request) -> httpx.Response:
+            info_opened.set()
+            return httpx.Response(200, stream=info_body)
+
+        async def price_handler(request: httpx.Request) -> httpx.Response:
+            await asyncio.Event().wait()
+
+        request = create_request(create_client(info_handler), create_client(price_handler))
+        task = asyncio.create_task(main.list_products(request, limit=10, cursor=None))
+        await info_opened.wait()
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert info_body.closed
+
+    asyncio.run(run())
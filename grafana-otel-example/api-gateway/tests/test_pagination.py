@@ -0,0 +1,24 @@
+import base64
+import json
+
+import pytest
+
+from pagination import InvalidCursorError, decode_cursor, encode_cursor
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def test_cursor_round_trips():
+    assert decode_cursor(encode_cursor("product-42")) == "product-42"
+    assert decode_cursor(None) is None
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["not base64!", raw_cursor(["after"]), raw_cursor({}), raw_cursor({"after": 42}), raw_cursor({"after": None})],
+)
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
@@ -0,0 +1,46 @@
+import asyncio
+
+import httpx
+
+from product_ids import ProductIdsSnapshot
+
+
+def create_snapshot(responses: list[httpx.Response], refresh_interval: float = 0.0) -> ProductIdsSnapshot:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return responses.pop(0) if responses else httpx.Response(503)
+
+    client = httpx.AsyncClient(base_url="http://product-price-querier", transport=httpx.MockTransport(handler))
+    return ProductIdsSnapshot(client, refresh_interval, page_size=2)
+
+
+async def wait_for_refresh(snapshot: ProductIdsSnapshot) -> None:
+    await snapshot.get()
+    await asyncio.gather(*(task for task in asyncio.all_tasks() if task is not asyncio.current_task()))
+
+
+def test_snapshot_is_loaded_page_by_page_and_sorted():
+    async def run() -> None:
+        snapshot = create_snapshot([
+            httpx.Response(200, json={"items": ["c", "a"], "next_cursor": "next"}),
+            httpx.Response(200, json={"items": ["b"], "next_cursor": None}),
+        ])
+        assert await snapshot.get() == ["a", "b", "c"]
+        assert await snapshot.get_page("a", 1) == (["b"], "b")
+
+    asyncio.run(run())
+
+
+def test_failed_refresh_keeps_the_current_snapshot():
+    async def run() -> None:
+        snapshot = create_snapshot([
+            httpx.Response(200, json={"items": ["a", "b"], "next_cursor": None}),
+            httpx.Response(503, json={"message": "unavailable"}),
+            httpx.Response(200, content=b"<html>not json</html>"),
+        ])
+        assert await snapshot.get() == ["a", "b"]
+        await wait_for_refresh(snapshot)
+        assert await snapshot.get() == ["a", "b"]
+        await wait_for_refresh(snapshot)
+        assert await snapshot.get() == ["a", "b"]
+
+    asyncio.run(run())
@@ -0,0 +1,105 @@
+import asyncio
+
+import httpx
+
+from config import ResilienceSettings
+from resilience import ResilientTransport
+
+INFO_URL = "http://product-info-querier/products/infos"
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    """Answers attempts with the given (delay in seconds, status) replies in turn, repeating the last one."""
+
+    def __init__(self, *replies: tuple[float, int]) -> None:
+        self._replies = list(replies)
+        self.requests: list[httpx.Request] = []
+        self.cancelled = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        attempt = len(self.requests)
+        delay, status = self._replies.pop(0) if len(self._replies) > 1 else self._replies[0]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return httpx.Response(status, json={"attempt": attempt})
+
+
+def create_transport(stub: StubTransport, **settings) -> ResilientTransport:
+    defaults = {"hedge_initial_delay_ms": 20.0, "hedge_min_delay_ms": 1.0, "retry_backoff_ms": 1.0}
+    return ResilientTransport(stub, "product-info-querier", ResilienceSettings(**{**defaults, **settings}))
+
+
+def send(transport: ResilientTransport, method: str = "GET", url: str = f"{INFO_URL}/1", **kwargs) -> httpx.Response:
+    async def run() -> httpx.Response:
+        response = await transport.handle_async_request(httpx.Request(method, url, **kwargs))
+        await response.aread()
+        return response
+
+    return asyncio.run(run())
+
+
+def test_slow_attempt_is_hedged_and_the_loser_cancelled():
+    stub = StubTransport((1.0, 200), (0.0, 200))
+    response = send(create_transport(stub))
+
+    assert response.json() == {"attempt": 2}
+    assert len(stub.requests) == 2
+    assert stub.cancelled == 1
+
+
+def test_failed_status_is_retried_up_to_max_retries():
+    stub = StubTransport((0.0, 503))
+    response = send(create_transport(stub, hedge_enabled=False, max_retries=2))
+
+    assert response.status_code == 503
+    assert len(stub.requests) == 3
+
+
+def test_retries_stop_once_the_budget_is_spent():
+    stub = StubTransport((0.0, 503))
+    transport = create_transport(
+        stub, hedge_enabled=False, max_retries=5, retry_budget_ratio=0.0, retry_budget_min_per_second=0.0, retry_budget_burst=1.0
+    )
+    response = send(transport)
+
+    # The burst pays for a single retry, and calls earn nothing at a ratio of 0
+    assert response.status_code == 503
+    assert len(stub.requests) == 2
+
+
+def test_hedges_stop_once_the_budget_is_spent():
+    stub = StubTransport((0.05, 200))
+    transport = create_transport(
+        stub, max_retries=0, retry_budget_ratio=0.0, retry_budget_min_per_second=0.0, retry_budget_burst=1.0
+    )
+    assert send(transport).status_code == 200
+    assert len(stub.requests) == 2
+    assert send(transport).status_code == 200
+    assert len(stub.requests) == 3
+
+
+def test_non_idempotent_post_is_never_hedged_or_retried():
+    stub = StubTransport((0.05, 503))
+    response = send(create_transport(stub), "POST", "http://product-info-querier/products", json={"title": "new"})
+
+    assert response.status_code == 503
+    assert len(stub.requests) == 1
+    assert stub.cancelled == 0
+
+
+def test_hedge_delay_is_learned_per_route_across_product_ids():
+    # Fast calls for many different ids fill one window, so the next id is hedged at the route's percentile
+    # rather than after the initial delay, which here is longer than the slow attempt itself
+    stub = StubTransport(*[(0.0, 200)] * 60, (1.0, 200), (0.0, 200))
+    transport = create_transport(stub, hedge_initial_delay_ms=5000.0)
+    for product_id in range(60):
+        send(transport, url=f"{INFO_URL}/{product_id}")
+
+    response = send(transport, url=f"{INFO_URL}/new")
+
+    assert response.json() == {"attempt": 62}
+    assert stub.cancelled == 1
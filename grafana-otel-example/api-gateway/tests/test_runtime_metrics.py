@@ -0,0 +1,19 @@
+import asyncio
+
+from config import RuntimeMetricsSettings
+from runtime_metrics import setup_runtime_metrics, shutdown_runtime_metrics
+
+
+def probe_tasks() -> list[asyncio.Task]:
+    return [task for task in asyncio.all_tasks() if task.get_name() == "event-loop-probe" and not task.done()]
+
+
+def test_shutdown_stops_the_event_loop_probe():
+    async def run() -> None:
+        setup_runtime_metrics(RuntimeMetricsSettings(loop_lag_interval=0.01))
+        assert len(probe_tasks()) == 1
+        await shutdown_runtime_metrics()
+        await asyncio.sleep(0)
+        assert probe_tasks() == []
+
+    asyncio.run(run())
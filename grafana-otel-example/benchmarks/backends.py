@@ -0,0 +1,57 @@
+"""
+Local stand-ins for the services' dependencies, seeded with the same catalog.
+
+Runs a RESP server for product-info-querier, a MySQL-protocol server backed
+by sqlite for product-price-querier and an OTLP/HTTP sink recording what it
+receives (`GET /stats` on its port), in one process separate from the
+benchmarked services. Prints their ports as one JSON line once ready, then
+serves until killed.
+
+Example:
+    python -m benchmarks.backends --catalog-size 10000
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from benchmarks.catalog import load_catalog
+from benchmarks.fake_mysql import FakeMySQL
+from benchmarks.fake_redis import FakeRedis
+from benchmarks.otlp_sink import OTLPSink
+
+
+async def serve(args: argparse.Namespace) -> None:
+    products = load_catalog(args.catalog_size)
+    redis, mysql = FakeRedis(), FakeMySQL()
+    redis.seed(products)
+    mysql.seed(products)
+
+    redis_server = await redis.start(args.host, args.redis_port)
+    mysql_server = await mysql.start(args.host, args.mysql_port)
+    otlp_sink = OTLPSink().start(args.host, args.otlp_port)
+    print(json.dumps({
+        "catalog_size": len(products),
+        "redis_port": redis_server.sockets[0].getsockname()[1],
+        "mysql_port": mysql_server.sockets[0].getsockname()[1],
+        "otlp_port": otlp_sink.server_address[1],
+    }), flush=True)
+    async with redis_server, mysql_server:
+        await asyncio.gather(redis_server.serve_forever(), mysql_server.serve_forever())
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog-size", type=int, help="Products to seed, the whole CSV by default")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--redis-port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--mysql-port", type=int, default=0)
+    parser.add_argument("--otlp-port", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(parse_args(sys.argv[1:])))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,64 @@
+import csv
+from dataclasses import dataclass
+from pathlib import Path
+
+CSV_PATH = Path(__file__).resolve().parent.parent / "data" / "amazon_kitchenware.csv"
+
+#? CSV columns renamed the way data/init_load.ipynb does before loading Redis and MySQL
+_INFO_COLUMNS = {
+    "asin": "product_id",
+    "title": "title",
+    "brand": "brand",
+    "description": "description",
+    "stars": "stars",
+    "reviewsCount": "reviews_count",
+    "breadCrumbs": "bread_crumbs",
+    "url": "url",
+}
+
+
+@dataclass(frozen=True)
+class Product:
+    product_id: str
+    info: dict[str, str]
+    currency: str
+    value: float
+
+
+def load_catalog(size: int | None = None, path: Path = CSV_PATH) -> list[Product]:
+    """
+    Products from the sample CSV, sorted by id, skipping those without a price like the notebook does.
+
+    Asking for more products than the CSV holds repeats it with derived ids
+    (same length as an ASIN), so larger catalogs keep realistic payloads.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        base = [
+            Product(
+                product_id=row["asin"],
+                info={field: row[column] for column, field in _INFO_COLUMNS.items()},
+                currency=row["price/currency"],
+                value=float(row["price/value"]),
+            )
+            for row in csv.DictReader(f)
+            if row["price/value"]
+        ]
+    size = len(base) if size is None else size
+
+    products: dict[str, Product] = {}
+    for copy in range(-(-size // len(base))):
+        for product in base:
+            if len(products) == size:
+                break
+            product_id = product.product_id if copy == 0 else f"{product.product_id[:7]}{copy:03d}"
+            if product_id in products:
+                continue
+            products[product_id] = Product(product_id, {**product.info, "product_id": product_id}, product.currency, product.value)
+    #? Derived ids can collide with real ones and be skipped, top up with ids that cannot
+    filler = 0
+    while len(products) < size:
+        product = base[filler % len(base)]
+        product_id = f"Z{filler:09d}"
+        products[product_id] = Product(product_id, {**product.info, "product_id": product_id}, product.currency, product.value)
+        filler += 1
+    return sorted(products.values(), key=lambda product: product.product_id)
@@ -0,0 +1,147 @@
+import asyncio
+import re
+import sqlite3
+import struct
+from typing import Any
+
+from benchmarks.catalog import Product
+
+#? Capabilities of a 4.1+ server with native password auth, without CLIENT_DEPRECATE_EOF so result sets end with EOF packets
+_CAPABILITIES = 0x1 | 0x2 | 0x4 | 0x8 | 0x200 | 0x2000 | 0x8000 | 0x20000 | 0x80000
+_UTF8MB4 = 45
+_BINARY = 63
+_TYPE_DOUBLE, _TYPE_LONGLONG, _TYPE_VAR_STRING = 0x05, 0x08, 0xFD
+
+_COM_QUIT, _COM_INIT_DB, _COM_QUERY, _COM_PING = 0x01, 0x02, 0x03, 0x0E
+#? Session and transaction statements the drivers send, which sqlite has no use for
+_NO_OP_STATEMENT = re.compile(rb"\s*(SET|COMMIT|ROLLBACK|BEGIN|START)\b", re.IGNORECASE)
+
+
+def _length_encoded_int(value: int) -> bytes:
+    if value < 251:
+        return bytes([value])
+    if value < 2**16:
+        return b"\xfc" + struct.pack("<H", value)
+    if value < 2**24:
+        return b"\xfd" + struct.pack("<I", value)[:3]
+    return b"\xfe" + struct.pack("<Q", value)
+
+
+def _length_encoded_bytes(value: bytes) -> bytes:
+    return _length_encoded_int(len(value)) + value
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._reader = reader
+        self._writer = writer
+        self._sequence = 0
+
+    async def read_packet(self) -> bytes:
+        header = await self._reader.readexactly(4)
+        self._sequence = header[3] + 1
+        return await self._reader.readexactly(header[0] | header[1] << 8 | header[2] << 16)
+
+    def write_packet(self, payload: bytes) -> None:
+        self._writer.write(struct.pack("<I", len(payload))[:3] + bytes([self._sequence & 0xFF]) + payload)
+        self._sequence += 1
+
+    def write_ok(self) -> None:
+        self.write_packet(b"\x00\x00\x00" + struct.pack("<HH", 0x0002, 0))
+
+    def write_eof(self) -> None:
+        self.write_packet(b"\xfe" + struct.pack("<HH", 0, 0x0002))
+
+    def write_error(self, message: str) -> None:
+        self.write_packet(b"\xff" + struct.pack("<H", 1064) + b"#42000" + message.encode())
+
+
+class FakeMySQL:
+    """
+    Server speaking the MySQL text protocol, enough for PyMySQL and aiomysql,
+    with queries run by an in-memory sqlite database holding `product_price`.
+
+    The price querier only issues plain SELECTs that sqlite accepts as is; the
+    drivers interpolate parameters client-side, so no prepared statements are needed.
+    """
+
+    def __init__(self) -> None:
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        #? Same table as data/init_load.ipynb creates in MySQL
+        self._db.execute("CREATE TABLE product_price (product_id VARCHAR(10) PRIMARY KEY, currency VARCHAR(3), value FLOAT)")
+
+    def seed(self, products: list[Product]) -> None:
+        self._db.executemany(
+            "INSERT INTO product_price (product_id, currency, value) VALUES (?, ?, ?)",
+            [(product.product_id, product.currency, product.value) for product in products],
+        )
+        self._db.commit()
+
+    async def start(self, host: str, port: int) -> asyncio.Server:
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = _Connection(reader, writer)
+        connection.write_packet(
+            b"\x0a" + b"8.0.0-benchmark\x00" + struct.pack("<I", 1) + b"abcdefgh\x00"
+            + struct.pack("<HBHH", _CAPABILITIES & 0xFFFF, _UTF8MB4, 0x0002, _CAPABILITIES >> 16)
+            + bytes([21]) + b"\x00" * 10 + b"ijklmnopqrst\x00" + b"mysql_native_password\x00"
+        )
+        try:
+            await writer.drain()
+            #? Any credentials are accepted
+            await connection.read_packet()
+            connection.write_ok()
+            await writer.drain()
+            while True:
+                packet = await connection.read_packet()
+                command = packet[0]
+                if command == _COM_QUIT:
+                    break
+                if command in (_COM_INIT_DB, _COM_PING):
+                    connection.write_ok()
+                elif command == _COM_QUERY:
+                    self._query(connection, packet[1:])
+                else:
+                    connection.write_error(f"Unsupported command {command:#x}")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _query(self, connection: _Connection, query: bytes) -> None:
+        if _NO_OP_STATEMENT.match(query):
+            connection.write_ok()
+            return
+        try:
+            cursor = self._db.execute(query.decode())
+        except sqlite3.Error as e:
+            connection.write_error(str(e))
+            return
+        if cursor.description is None:
+            self._db.commit()
+            connection.write_ok()
+            return
+
+        rows = cursor.fetchall()
+        connection.write_packet(_length_encoded_int(len(cursor.description)))
+        for position, column in enumerate(cursor.description):
+            name = column[0].encode()
+            column_type, charset = _column_type(next((row[position] for row in rows if row[position] is not None), None))
+            connection.write_packet(
+                b"".join(_length_encoded_bytes(part) for part in (b"def", b"mysql", b"product_price", b"product_price", name, name))
+                + b"\x0c" + struct.pack("<HIBHB", charset, 255, column_type, 0, 0) + b"\x00\x00"
+            )
+        connection.write_eof()
+        for row in rows:
+            connection.write_packet(b"".join(b"\xfb" if value is None else _length_encoded_bytes(str(value).encode()) for value in row))
+        connection.write_eof()
+
+
+def _column_type(value: Any) -> tuple[int, int]:
+    if isinstance(value, int):
+        return _TYPE_LONGLONG, _BINARY
+    if isinstance(value, float):
+        return _TYPE_DOUBLE, _BINARY
+    return _TYPE_VAR_STRING, _UTF8MB4
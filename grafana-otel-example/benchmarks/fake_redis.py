@@ -0,0 +1,162 @@
+import asyncio
+import bisect
+import fnmatch
+from typing import Any
+
+from benchmarks.catalog import Product
+
+PRODUCT_INDEX_KEY = "product_index"
+
+
+class _RedisError(Exception):
+    pass
+
+
+class FakeRedis:
+    """
+    In-memory server speaking enough RESP2 for product-info-querier: hashes, one
+    lexicographic sorted set (all scores 0, as `product_index` is) and SCAN.
+
+    It runs on its own event loop and answers every command inline, so it adds
+    no more than the protocol's own latency to the benchmarked service.
+    """
+
+    def __init__(self) -> None:
+        self._hashes: dict[bytes, dict[bytes, bytes]] = {}
+        self._sorted_sets: dict[bytes, list[bytes]] = {}
+        self._scan_keys: list[bytes] | None = None
+
+    def seed(self, products: list[Product]) -> None:
+        index = self._sorted_sets.setdefault(PRODUCT_INDEX_KEY.encode(), [])
+        for product in products:
+            key = f"product:{product.product_id}".encode()
+            self._hashes[key] = {field.encode(): value.encode() for field, value in product.info.items()}
+            index.append(product.product_id.encode())
+        index.sort()
+        self._scan_keys = None
+
+    async def start(self, host: str, port: int) -> asyncio.Server:
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                try:
+                    reply = self._execute(command)
+                except _RedisError as e:
+                    writer.write(b"-ERR " + str(e).encode() + b"\r\n")
+                else:
+                    writer.write(_encode(reply))
+                #? Only waits when the client is not reading its replies, pipelined replies are written back to back
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> list[bytes] | None:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        arguments = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            arguments.append((await reader.readexactly(length + 2))[:-2])
+        return arguments
+
+    def _execute(self, command: list[bytes]) -> Any:
+        name, arguments = command[0].upper(), command[1:]
+        if name == b"PING":
+            return _SimpleString("PONG")
+        if name in (b"SELECT", b"CLIENT", b"FLUSHDB"):
+            return _SimpleString("OK")
+        if name == b"HGETALL":
+            return [item for pair in self._hashes.get(arguments[0], {}).items() for item in pair]
+        if name == b"HSET":
+            if arguments[0] not in self._hashes:
+                self._scan_keys = None
+            fields = self._hashes.setdefault(arguments[0], {})
+            added = 0
+            for field, value in zip(arguments[1::2], arguments[2::2]):
+                added += field not in fields
+                fields[field] = value
+            return added
+        if name == b"ZADD":
+            return self._zadd(arguments[0], arguments[2::2])
+        if name == b"ZCARD":
+            return len(self._sorted_sets.get(arguments[0], []))
+        if name == b"ZRANGEBYLEX":
+            return self._zrangebylex(arguments)
+        if name == b"SCAN":
+            return self._scan(arguments)
+        if name == b"EXISTS":
+            return sum(key in self._hashes or key in self._sorted_sets for key in arguments)
+        if name == b"DBSIZE":
+            return len(self._hashes) + len(self._sorted_sets)
+        raise _RedisError(f"unknown command '{name.decode()}'")
+
+    def _zadd(self, key: bytes, members: list[bytes]) -> int:
+        if key not in self._sorted_sets:
+            self._scan_keys = None
+        index = self._sorted_sets.setdefault(key, [])
+        added = 0
+        for member in members:
+            position = bisect.bisect_left(index, member)
+            if position == len(index) or index[position] != member:
+                index.insert(position, member)
+                added += 1
+        return added
+
+    def _zrangebylex(self, arguments: list[bytes]) -> list[bytes]:
+        index = self._sorted_sets.get(arguments[0], [])
+        start, stop = _lex_bound(index, arguments[1], lower=True), _lex_bound(index, arguments[2], lower=False)
+        members = index[start:stop]
+        if len(arguments) > 3 and arguments[3].upper() == b"LIMIT":
+            offset, count = int(arguments[4]), int(arguments[5])
+            members = members[offset:] if count < 0 else members[offset:offset + count]
+        return members
+
+    def _scan(self, arguments: list[bytes]) -> list[Any]:
+        options = {arguments[i].upper(): arguments[i + 1] for i in range(1, len(arguments) - 1, 2)}
+        pattern = options.get(b"MATCH", b"*").decode()
+        count = int(options.get(b"COUNT", b"10"))
+        #? The cursor is an offset in key order, which stays valid as long as no keys are added mid-scan
+        if self._scan_keys is None:
+            self._scan_keys = sorted([*self._hashes, *self._sorted_sets])
+        keys = self._scan_keys
+        cursor = int(arguments[0])
+        page = keys[cursor:cursor + count]
+        next_cursor = cursor + count if cursor + count < len(keys) else 0
+        return [str(next_cursor).encode(), [key for key in page if fnmatch.fnmatchcase(key.decode(), pattern)]]
+
+
+class _SimpleString(str):
+    pass
+
+
+def _lex_bound(index: list[bytes], bound: bytes, lower: bool) -> int:
+    if bound == b"-":
+        return 0
+    if bound == b"+":
+        return len(index)
+    value, inclusive = bound[1:], bound[:1] == b"["
+    if lower:
+        return bisect.bisect_left(index, value) if inclusive else bisect.bisect_right(index, value)
+    return bisect.bisect_right(index, value) if inclusive else bisect.bisect_left(index, value)
+
+
+def _encode(reply: Any) -> bytes:
+    if isinstance(reply, _SimpleString):
+        return b"+" + reply.encode() + b"\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    if reply is None:
+        return b"$-1\r\n"
+    return b"*%d\r\n" % len(reply) + b"".join(_encode(item) for item in reply)
@@ -0,0 +1,112 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SIGNALS = ("traces", "metrics", "logs")
+
+#? Histogram the services' exporters record their export calls in, see otlp_export.py
+_EXPORT_DURATION_METRIC = "otel.exporter.duration"
+
+
+class OTLPSink:
+    """
+    OTLP/HTTP receiver for the benchmarks, accepting every export and recording what it costs.
+
+    Per signal it counts export requests, their size on the wire and
+    uncompressed, and the time spent receiving them. Export latency as the
+    services' exporters observe it comes from their own
+    `otel.exporter.duration` histogram, which reaches the sink with the other
+    metrics: only metrics payloads are decoded, and only for that.
+    `GET /stats` returns the totals so far.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._signals = {
+            signal: {"requests": 0, "bytes": 0, "uncompressed_bytes": 0, "receive_seconds": 0.0} for signal in SIGNALS
+        }
+        #? Latest cumulative (sum, count) per (service instance, signal, result), as exported
+        self._export_durations: dict[tuple[str, str, str], tuple[float, int]] = {}
+
+    def record(self, signal: str, body: bytes, payload: bytes, seconds: float) -> None:
+        with self._lock:
+            stats = self._signals[signal]
+            stats["requests"] += 1
+            stats["bytes"] += len(body)
+            stats["uncompressed_bytes"] += len(payload)
+            stats["receive_seconds"] += seconds
+        if signal == "metrics":
+            self._record_export_durations(payload)
+
+    def stats(self) -> dict:
+        with self._lock:
+            export_duration = {signal: {"sum_seconds": 0.0, "count": 0} for signal in SIGNALS}
+            for (_, signal, _), (total, count) in self._export_durations.items():
+                if signal in export_duration:
+                    export_duration[signal]["sum_seconds"] += total
+                    export_duration[signal]["count"] += count
+            return {
+                "signals": {signal: dict(stats) for signal, stats in self._signals.items()},
+                "export_duration": export_duration,
+            }
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                started_at = time.perf_counter()
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                payload = gzip.decompress(body) if self.headers.get("Content-Encoding") == "gzip" else body
+                #? An empty body is a valid, fully successful Export*ServiceResponse
+                self._respond(200, b"", "application/x-protobuf")
+                signal = self.path.rstrip("/").rsplit("/", 1)[-1]
+                if signal in SIGNALS:
+                    sink.record(signal, body, payload, time.perf_counter() - started_at)
+
+            def do_GET(self) -> None:
+                if self.path != "/stats":
+                    self._respond(404, b"", "text/plain")
+                    return
+                self._respond(200, json.dumps(sink.stats()).encode(), "application/json")
+
+            def _respond(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="otlp-sink", daemon=True).start()
+        return server
+
+    def _record_export_durations(self, payload: bytes) -> None:
+        try:
+            from opentelemetry.proto.collector.metrics.v1.metrics_service_pb2 import ExportMetricsServiceRequest
+        except ImportError:
+            return
+        request = ExportMetricsServiceRequest()
+        request.ParseFromString(payload)
+        for resource_metrics in request.resource_metrics:
+            instance = next(
+                (attribute.value.string_value for attribute in resource_metrics.resource.attributes if attribute.key == "service.instance.id"),
+                "",
+            )
+            for scope_metrics in resource_metrics.scope_metrics:
+                for metric in scope_metrics.metrics:
+                    if metric.name != _EXPORT_DURATION_METRIC:
+                        continue
+                    for point in metric.histogram.data_points:
+                        attributes = {attribute.key: attribute.value.string_value for attribute in point.attributes}
+                        key = (instance, attributes.get("signal", ""), attributes.get("result", ""))
+                        with self._lock:
+                            self._export_durations[key] = (point.sum, point.count)
@@ -0,0 +1,459 @@
+"""
+Per-endpoint throughput and latency benchmark of the three services, without the docker-compose stack.
+
+For each catalog size, the stand-ins of `benchmarks.backends` are seeded from
+data/amazon_kitchenware.csv and every service is started on localhost with
+uvicorn, configured against them. Each endpoint is then driven by a fixed
+number of concurrent closed-loop clients, for a warm-up and then for the
+measured duration, so the reported throughput is the saturation throughput
+and the latencies are those at saturation. The CPU time and GC activity of
+each service process during the measured phase are reported per request.
+
+With several --telemetry modes the stack is restarted for each of them, and
+every endpoint's cost is also reported relative to the first mode listed:
+"off" disables the OpenTelemetry SDK, "none" runs it but drops every export,
+"memory" encodes every export to OTLP protobuf without sending it and "otlp"
+sends it to the recording sink of `benchmarks.backends`, which adds what the
+exports weigh and how long they take.
+
+Results are written as JSON tagged with the git commit; pass a previous
+results file to --compare to print the change of every endpoint. The client
+shares the machine with the services, so only compare runs made on the same
+host.
+
+Example:
+    python -m benchmarks.run --catalog-sizes 259,10000 --concurrency 16 --duration 10 --output baseline.json
+    python -m benchmarks.run --catalog-sizes 259,10000 --compare baseline.json --output results.json
+    python -m benchmarks.run --telemetry off,none,memory,otlp --endpoints 'api-gateway/*' --output telemetry.json
+"""
+import argparse
+import asyncio
+import fnmatch
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import httpx
+
+from benchmarks.catalog import load_catalog
+from load_generator import RequestStats
+
+ROOT = Path(__file__).resolve().parent.parent
+
+#? (method, url, httpx request kwargs) of one request, built from the catalog's product ids
+RequestBuilder = Callable[[random.Random, list[str]], tuple[str, str, dict]]
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    service: str
+    name: str
+    build: RequestBuilder
+
+    @property
+    def key(self) -> str:
+        return f"{self.service}/{self.name}"
+
+
+def _batch(rng: random.Random, product_ids: list[str]) -> dict:
+    return {"json": {"product_ids": rng.sample(product_ids, min(10, len(product_ids)))}}
+
+
+ENDPOINTS = [
+    Endpoint("api-gateway", "get_product", lambda rng, ids: ("GET", f"/products/{rng.choice(ids)}", {})),
+    Endpoint("api-gateway", "list_products", lambda rng, ids: ("GET", "/products", {"params": {"limit": 20}})),
+    Endpoint("api-gateway", "batch_get_products", lambda rng, ids: ("POST", "/products:batchGet", _batch(rng, ids))),
+    Endpoint("api-gateway", "list_product_ids", lambda rng, ids: ("GET", "/products/ids", {"params": {"limit": 100}})),
+    Endpoint("product-info-querier", "get_product_info", lambda rng, ids: ("GET", f"/products/infos/{rng.choice(ids)}", {})),
+    Endpoint("product-info-querier", "list_product_infos", lambda rng, ids: ("GET", "/products/infos", {"params": {"limit": 20}})),
+    Endpoint("product-info-querier", "batch_get_product_infos", lambda rng, ids: ("POST", "/products/infos:batchGet", _batch(rng, ids))),
+    Endpoint("product-price-querier", "get_product_price", lambda rng, ids: ("GET", f"/products/prices/{rng.choice(ids)}", {})),
+    Endpoint("product-price-querier", "list_product_prices", lambda rng, ids: ("GET", "/products/prices", {"params": {"limit": 20}})),
+    Endpoint("product-price-querier", "batch_get_product_prices", lambda rng, ids: ("POST", "/products/prices:batchGet", _batch(rng, ids))),
+    Endpoint("product-price-querier", "list_product_ids", lambda rng, ids: ("GET", "/products/prices/ids", {"params": {"limit": 100}})),
+]
+
+#? Querier settings without defaults, set to their production values with fault and delay injection off
+_SERVICE_ENV = {
+    "api-gateway": lambda backends, ports: {
+        "PRODUCT_INFO_SERVICE_URL": f"http://127.0.0.1:{ports['product-info-querier']}",
+        "PRODUCT_PRICE_SERVICE_URL": f"http://127.0.0.1:{ports['product-price-querier']}",
+        #? Measure the fan-out rather than the read-through cache, override with --env CACHE_ENABLED=true
+        "CACHE_ENABLED": "false",
+    },
+    "product-info-querier": lambda backends, ports: {
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": str(backends["redis_port"]),
+        "REDIS_DB": "0",
+        "FAULT_INJECTION_ENABLED": "false",
+        "FAULT_INJECTION_RATE": "0",
+    },
+    "product-price-querier": lambda backends, ports: {
+        "MYSQL_HOST": "127.0.0.1",
+        "MYSQL_PORT": str(backends["mysql_port"]),
+        "MYSQL_DB": "mysql",
+        "MYSQL_USER": "mysql",
+        "MYSQL_PASSWORD": "mysql",
+        "DELAY_INJECTION_ENABLED": "false",
+        "DELAY_INJECTION_RATE": "0",
+        "DELAY_INJECTION_MS": "0",
+    },
+}
+#? Started in this order, the gateway loads its product ids snapshot from the price querier on startup
+_SERVICE_ORDER = ("product-info-querier", "product-price-querier", "api-gateway")
+
+TELEMETRY_MODES = ("off", "none", "memory", "otlp")
+_TELEMETRY_ENV = {
+    "off": {"OTEL_SDK_DISABLED": "true"},
+    "none": {"OTEL_EXPORT_MODE": "none"},
+    "memory": {"OTEL_EXPORT_MODE": "memory"},
+    "otlp": {"OTEL_EXPORT_MODE": "otlp"},
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get_json(url: str) -> dict:
+    resp = httpx.get(url)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _git_revision() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": bool(status.strip())}
+
+
+class Stack:
+    """The backends process and the three services for one catalog size and telemetry mode, stopped on exit."""
+
+    def __init__(self, args: argparse.Namespace, catalog_size: int, telemetry: str, log_dir: Path) -> None:
+        self._args = args
+        self._catalog_size = catalog_size
+        self.telemetry = telemetry
+        self._log_dir = log_dir
+        self._exit_stack = ExitStack()
+        self.backends: dict = {}
+        self.ports: dict[str, int] = {}
+        self.stats_ports: dict[str, int] = {}
+        self.processes: dict[str, subprocess.Popen] = {}
+
+    def process_stats(self) -> dict[str, dict]:
+        """CPU time, GC activity and memory of every service process, see benchmarks.serve."""
+        return {service: _get_json(f"http://127.0.0.1:{port}/") for service, port in self.stats_ports.items()}
+
+    def sink_stats(self) -> dict:
+        return _get_json(f"http://127.0.0.1:{self.backends['otlp_port']}/stats")
+
+    def __enter__(self) -> "Stack":
+        try:
+            self._start()
+        except BaseException:
+            self._exit_stack.close()
+            raise
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._exit_stack.close()
+
+    def _start(self) -> None:
+        backends = self._popen(
+            "backends",
+            [sys.executable, "-m", "benchmarks.backends", "--catalog-size", str(self._catalog_size)],
+            cwd=ROOT,
+            env=os.environ,
+            stdout=subprocess.PIPE,
+        )
+        line = backends.stdout.readline()
+        if not line:
+            raise RuntimeError(f"The backends did not start, see {self._log_dir / 'backends.log'}")
+        self.backends = json.loads(line)
+
+        self.ports = {service: _free_port() for service in _SERVICE_ORDER}
+        self.stats_ports = {service: _free_port() for service in _SERVICE_ORDER}
+        for service in _SERVICE_ORDER:
+            env = {
+                **os.environ,
+                "OTEL_EXPORTER_OTLP_ENDPOINT": f"http://127.0.0.1:{self.backends['otlp_port']}",
+                #? Same interval in every mode, short enough for the exporters' own latency metric to reach the sink during each endpoint
+                "OTEL_METRICS_EXPORT__EXPORT_INTERVAL_MS": str(self._args.metric_export_interval_ms),
+                **_TELEMETRY_ENV[self.telemetry],
+                **_SERVICE_ENV[service](self.backends, self.ports),
+                **self._args.env,
+            }
+            self.processes[service] = self._popen(
+                service,
+                [
+                    self._args.python, "-m", "benchmarks.serve", "--app-dir", str(ROOT / service / "src"),
+                    "--port", str(self.ports[service]), "--stats-port", str(self.stats_ports[service]),
+                    "--workers", str(self._args.workers),
+                ],
+                cwd=ROOT,
+                env=env,
+            )
+            self._wait_until_ready(service)
+
+    def _popen(self, name: str, command: list[str], cwd: Path, env: dict, stdout=None) -> subprocess.Popen:
+        log = self._exit_stack.enter_context(open(self._log_dir / f"{name}.log", "w"))
+        process = subprocess.Popen(command, cwd=cwd, env=env, stdout=stdout or log, stderr=log, text=True)
+        self._exit_stack.callback(_terminate, process)
+        return process
+
+    def _wait_until_ready(self, service: str) -> None:
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.processes[service].poll() is not None:
+                break
+            try:
+                if httpx.get(f"http://127.0.0.1:{self.ports[service]}/openapi.json").status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{service} did not start, see {self._log_dir / f'{service}.log'}")
+
+
+def _terminate(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def measure(stack: Stack, endpoint: Endpoint, product_ids: list[str], args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    stats = RequestStats()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    base_url = f"http://127.0.0.1:{stack.ports[endpoint.service]}"
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+
+        async def worker(stop_at: float, record: bool) -> None:
+            while time.perf_counter() < stop_at:
+                method, url, kwargs = endpoint.build(rng, product_ids)
+                started_at = time.perf_counter()
+                try:
+                    resp = await client.request(method, url, **kwargs)
+                    outcome, is_error = str(resp.status_code), resp.status_code >= 400
+                except httpx.HTTPError as e:
+                    outcome, is_error = type(e).__name__, True
+                if record:
+                    stats.record(time.perf_counter() - started_at, outcome, is_error)
+
+        async def run_phase(seconds: float, record: bool) -> float:
+            started_at = time.perf_counter()
+            await asyncio.gather(*(worker(started_at + seconds, record) for _ in range(args.concurrency)))
+            return time.perf_counter() - started_at
+
+        await run_phase(args.warmup, record=False)
+        process_before, sink_before = stack.process_stats(), stack.sink_stats()
+        elapsed = await run_phase(args.duration, record=True)
+        process_after, sink_after = stack.process_stats(), stack.sink_stats()
+
+    requests = max(stats.latency.count, 1)
+
+    def per_request(field: str, scale: float = 1.0) -> dict[str, float]:
+        #? Per service, including the ones the endpoint fans out to; GC fields are per generation and summed
+        return {
+            service: (sum(_as_list(process_after[service][field])) - sum(_as_list(process_before[service][field]))) * scale / requests
+            for service in process_after
+        }
+
+    row = {
+        "catalog_size": stack.backends["catalog_size"],
+        "telemetry": stack.telemetry,
+        "service": endpoint.service,
+        "endpoint": endpoint.name,
+        "concurrency": args.concurrency,
+        "duration_s": elapsed,
+        "throughput_rps": stats.latency.count / elapsed,
+        "cpu_ms_per_request": per_request("cpu_seconds", 1000),
+        "gc_collections_per_request": per_request("gc_collections"),
+        "gc_pause_ms_per_request": per_request("gc_pause_seconds", 1000),
+        #? Growth of live memory blocks over the phase, telemetry queues and caches filling up show here
+        "allocated_blocks_growth": {
+            service: process_after[service]["allocated_blocks"] - process_before[service]["allocated_blocks"] for service in process_after
+        },
+        "max_rss_mb": {service: process["max_rss_bytes"] / 2**20 for service, process in process_after.items()},
+        **stats.summary(),
+    }
+    if stack.telemetry == "otlp":
+        row["telemetry_export"] = _export_stats(sink_before, sink_after, requests)
+    return row
+
+
+def _as_list(value: float | list[float]) -> list[float]:
+    return value if isinstance(value, list) else [value]
+
+
+def _export_stats(before: dict, after: dict, requests: int) -> dict[str, dict]:
+    """What the services exported per signal during a phase, as received by the sink and as timed by their exporters."""
+    export_stats = {}
+    for signal, stats in after["signals"].items():
+        previous = before["signals"][signal]
+        exported = after["export_duration"][signal]["count"] - before["export_duration"][signal]["count"]
+        exported_seconds = after["export_duration"][signal]["sum_seconds"] - before["export_duration"][signal]["sum_seconds"]
+        export_stats[signal] = {
+            "requests": stats["requests"] - previous["requests"],
+            "bytes_per_request": (stats["bytes"] - previous["bytes"]) / requests,
+            "uncompressed_bytes_per_request": (stats["uncompressed_bytes"] - previous["uncompressed_bytes"]) / requests,
+            #? Reported by the exporters with their metrics, so it lags by up to one metric export interval
+            "export_mean_ms": exported_seconds * 1000 / exported if exported else None,
+        }
+    return export_stats
+
+
+def _row_key(row: dict) -> tuple:
+    #? Results from before telemetry modes existed were all taken with OTLP export
+    return row["catalog_size"], row.get("telemetry", "otlp"), row["service"], row["endpoint"]
+
+
+def compare(baseline: dict, results: dict) -> None:
+    previous = {_row_key(row): row for row in baseline["results"]}
+    print(f"\nCompared with {baseline['meta']['git']['commit'] or 'unknown commit'}:")
+    for row in results["results"]:
+        old = previous.get(_row_key(row))
+        if old is None:
+            continue
+        changes = "  ".join(
+            f"{label} {old[field]:8.1f} -> {row[field]:8.1f} ({(row[field] / old[field] - 1) * 100 if old[field] else 0.0:+6.1f}%)"
+            for label, field in (("rps", "throughput_rps"), ("p50", "p50_ms"), ("p99", "p99_ms"))
+        )
+        print(f"  {row['catalog_size']:>7} {row['telemetry']:<6} {row['service'] + '/' + row['endpoint']:<52} {changes}")
+
+
+def report_telemetry_cost(results: dict, modes: list[str]) -> None:
+    """Print what every telemetry mode adds to each endpoint over the first mode, summed over the services it involves."""
+    rows = {_row_key(row): row for row in results["results"]}
+    print(f"\nTelemetry cost relative to {modes[0]!r}, per request:")
+    for (catalog_size, telemetry, service, endpoint), base in rows.items():
+        if telemetry != modes[0]:
+            continue
+        print(f"  {catalog_size:>7} {service + '/' + endpoint}")
+        for mode in modes[1:]:
+            row = rows.get((catalog_size, mode, service, endpoint))
+            if row is None:
+                continue
+            line = (
+                f"    {mode:<6} cpu {_delta(base, row, 'cpu_ms_per_request'):+7.3f} ms  "
+                f"gc pause {_delta(base, row, 'gc_pause_ms_per_request'):+7.3f} ms  "
+                f"gc collections {_delta(base, row, 'gc_collections_per_request'):+7.4f}  "
+                f"p50 {row['p50_ms'] - base['p50_ms']:+7.2f} ms  p99 {row['p99_ms'] - base['p99_ms']:+7.2f} ms  "
+                f"rps {(row['throughput_rps'] / base['throughput_rps'] - 1) * 100 if base['throughput_rps'] else 0.0:+6.1f}%"
+            )
+            if "telemetry_export" in row:
+                exports = row["telemetry_export"].values()
+                latencies = [stats["export_mean_ms"] for stats in exports if stats["export_mean_ms"] is not None]
+                line += (
+                    f"  exported {sum(stats['bytes_per_request'] for stats in exports) / 1024:6.2f} KiB "
+                    f"in {sum(stats['requests'] for stats in exports)} exports"
+                    + (f", {max(latencies):.1f} ms at worst" if latencies else "")
+                )
+            print(line, flush=True)
+
+
+def _delta(base: dict, row: dict, field: str) -> float:
+    return sum(row[field].values()) - sum(base[field].values())
+
+
+def parse_env(value: str) -> tuple[str, str]:
+    name, separator, setting = value.partition("=")
+    if not separator:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {value!r}")
+    return name, setting
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--catalog-sizes", default="259", help="Comma-separated product counts; the CSV has 259 priced products, larger catalogs repeat it")
+    parser.add_argument("--endpoints", default="*", help="Comma-separated service/endpoint patterns, e.g. 'api-gateway/*,*/get_*'")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent closed-loop clients per endpoint")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of unmeasured load before each endpoint")
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured seconds per endpoint")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--telemetry", default="otlp", help=f"Comma-separated telemetry modes among {', '.join(TELEMETRY_MODES)}, costs are reported relative to the first"
+    )
+    parser.add_argument("--metric-export-interval-ms", type=int, default=1000, help="Metric export interval of the services, in every mode")
+    parser.add_argument("--env", type=parse_env, action="append", default=[], help="NAME=VALUE set on every service, repeatable")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes per service, see benchmarks.serve")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter running the services")
+    parser.add_argument("--log-dir", help="Where service logs go, a temporary directory by default")
+    parser.add_argument("--compare", help="Previous results file to compare with")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+    args.catalog_sizes = [int(size) for size in args.catalog_sizes.split(",")]
+    args.endpoints = args.endpoints.split(",")
+    args.telemetry = args.telemetry.split(",")
+    for mode in args.telemetry:
+        if mode not in TELEMETRY_MODES:
+            parser.error(f"unknown telemetry mode {mode!r}, expected one of {', '.join(TELEMETRY_MODES)}")
+    args.env = dict(args.env)
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    endpoints = [endpoint for endpoint in ENDPOINTS if any(fnmatch.fnmatchcase(endpoint.key, pattern) for pattern in args.endpoints)]
+    if not endpoints:
+        raise SystemExit(f"No endpoint matches {','.join(args.endpoints)}")
+    log_dir = Path(args.log_dir or tempfile.mkdtemp(prefix="benchmarks-"))
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    results = {
+        "meta": {
+            "git": _git_revision(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "log_dir")},
+        },
+        "results": [],
+    }
+    for catalog_size in args.catalog_sizes:
+        product_ids = [product.product_id for product in load_catalog(catalog_size)]
+        for telemetry in args.telemetry:
+            with Stack(args, catalog_size, telemetry, log_dir) as stack:
+                for endpoint in endpoints:
+                    row = asyncio.run(measure(stack, endpoint, product_ids, args))
+                    results["results"].append(row)
+                    print(
+                        f"{catalog_size:>7} {telemetry:<6} {endpoint.key:<52} {row['throughput_rps']:8.1f} req/s  "
+                        f"p50 {row['p50_ms']:7.2f} ms  p99 {row['p99_ms']:7.2f} ms  errors {row['error_rate']:.2%}",
+                        flush=True,
+                    )
+
+    if len(args.telemetry) > 1:
+        report_telemetry_cost(results, args.telemetry)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
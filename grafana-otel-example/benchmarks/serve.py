@@ -0,0 +1,160 @@
+"""
+Run one service under uvicorn for the benchmarks, with a side endpoint reporting the process's resource usage.
+
+`GET /` on the stats port returns the CPU time, GC collections and pauses,
+live allocated blocks and peak RSS of the process, so the benchmark can
+difference them around a measured phase. Counting every allocation would
+need tracemalloc, which slows the interpreter severalfold; GC activity is
+what allocation pressure costs a request, and is cheap to collect.
+
+With `--workers` above 1 uvicorn serves from that many worker processes.
+Each worker then reports its own usage on a port of its own, and the stats
+port returns the sum over the live workers, peak RSS included.
+
+Example:
+    python -m benchmarks.serve --app-dir api-gateway/src --port 8080 --stats-port 8090 --workers 4
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import uvicorn
+
+
+class _GCStats:
+    """`gc.callbacks` hook counting collections and the time spent in them, per generation."""
+
+    def __init__(self) -> None:
+        self.collections = [0, 0, 0]
+        self.pause_seconds = [0.0, 0.0, 0.0]
+        self._started_at = 0.0
+
+    def __call__(self, phase: str, info: dict) -> None:
+        if phase == "start":
+            self._started_at = time.perf_counter()
+        else:
+            generation = info["generation"]
+            self.collections[generation] += 1
+            self.pause_seconds[generation] += time.perf_counter() - self._started_at
+
+
+_gc_stats = _GCStats()
+
+#? Directory where each worker process writes its stats port, in a file named after its pid
+_WORKER_STATS_DIR_ENV = "BENCHMARK_WORKER_STATS_DIR"
+
+
+def get_process_stats() -> dict:
+    return {
+        #? CPU time of every thread of the process, exporters and the thread pool included
+        "cpu_seconds": time.process_time(),
+        "gc_collections": list(_gc_stats.collections),
+        "gc_pause_seconds": list(_gc_stats.pause_seconds),
+        "allocated_blocks": sys.getallocatedblocks(),
+        #? Kilobytes on Linux, bytes on macOS
+        "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+    }
+
+
+def get_worker_stats(stats_dir: Path) -> dict:
+    """`get_process_stats` summed over the worker processes that registered in `stats_dir`."""
+    total = {"cpu_seconds": 0.0, "gc_collections": [0, 0, 0], "gc_pause_seconds": [0.0, 0.0, 0.0], "allocated_blocks": 0, "max_rss_bytes": 0}
+    for path in stats_dir.iterdir():
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{path.read_text()}/", timeout=5) as resp:
+                stats = json.load(resp)
+        except OSError:
+            #? A worker that died and was replaced by uvicorn, or one still starting
+            continue
+        for field, value in stats.items():
+            if isinstance(value, list):
+                total[field] = [a + b for a, b in zip(total[field], value)]
+            else:
+                total[field] += value
+    return total
+
+
+def _start_stats_server(host: str, port: int, get_stats) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _StatsHandler)
+    server.get_stats = get_stats
+    threading.Thread(target=server.serve_forever, name="benchmark-stats", daemon=True).start()
+    return server
+
+
+def create_worker_app():
+    """uvicorn app factory run in every worker process, which registers the worker's own stats endpoint first."""
+    gc.callbacks.append(_gc_stats)
+    server = _start_stats_server("127.0.0.1", 0, get_process_stats)
+    (Path(os.environ[_WORKER_STATS_DIR_ENV]) / str(os.getpid())).write_text(str(server.server_address[1]))
+    from main import app
+
+    return app
+
+
+class _StatsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = json.dumps(self.server.get_stats()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-dir", required=True, help="The service's src directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--stats-port", type=int, required=True)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("WEB_CONCURRENCY", "1")),
+        help="uvicorn worker processes, WEB_CONCURRENCY by default",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    #? The services read it too, to give each worker a service instance id of its own
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    #? The services resolve their modules and files from their src directory, as in their containers
+    os.chdir(args.app_dir)
+    sys.path.insert(0, os.getcwd())
+    if args.workers <= 1:
+        gc.callbacks.append(_gc_stats)
+        _start_stats_server(args.host, args.stats_port, get_process_stats)
+        uvicorn.run("main:app", host=args.host, port=args.port, log_level="warning")
+        return
+
+    #? Workers are spawned, not forked, and inherit the environment and import path set above
+    with tempfile.TemporaryDirectory(prefix="benchmark-workers-") as stats_dir:
+        os.environ[_WORKER_STATS_DIR_ENV] = stats_dir
+        _start_stats_server(args.host, args.stats_port, lambda: get_worker_stats(Path(stats_dir)))
+        uvicorn.run(
+            "benchmarks.serve:create_worker_app",
+            factory=True,
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level="warning",
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,269 @@
+"""
+Open-loop load generator for the api-gateway.
+
+Requests are sent on a schedule fixed in advance (constant rate or Poisson
+arrivals), whatever the server's latency, and each latency is measured from
+the request's scheduled start. A slow server therefore shows up as higher
+latency instead of as a lower offered load (no coordinated omission).
+
+Example:
+    python load_generator.py --rate 200 --warmup 10 --duration 60 \\
+        --mix product=0.7,list=0.1,batch=0.1,ids=0.1 --output results.json
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import math
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+
+import httpx
+
+REQUEST_TYPES = ("ids", "product", "list", "batch")
+
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in the spirit of HdrHistogram.
+
+    Values are bucketed with a bounded relative error (`precision`, 1% by
+    default), so memory stays constant however many values are recorded and
+    percentiles are accurate over the whole range, from microseconds to
+    minutes.
+    """
+
+    def __init__(self, precision: float = 0.01) -> None:
+        self._log_base = math.log1p(precision)
+        self._counts: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        micros = max(seconds * 1e6, 1.0)
+        bucket = int(math.log(micros) / self._log_base)
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for bucket, count in other._counts.items():
+            self._counts[bucket] = self._counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound of the bucket holding the given percentile, in seconds."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= rank:
+                return min(math.exp((bucket + 1) * self._log_base) / 1e6, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p90_ms": self.percentile(90) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "p99.9_ms": self.percentile(99.9) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+@dataclass
+class RequestStats:
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    status_codes: dict[str, int] = field(default_factory=dict)
+    errors: int = 0
+
+    def record(self, seconds: float, outcome: str, is_error: bool) -> None:
+        self.latency.record(seconds)
+        self.status_codes[outcome] = self.status_codes.get(outcome, 0) + 1
+        if is_error:
+            self.errors += 1
+
+    def merge(self, other: "RequestStats") -> None:
+        self.latency.merge(other.latency)
+        for outcome, count in other.status_codes.items():
+            self.status_codes[outcome] = self.status_codes.get(outcome, 0) + count
+        self.errors += other.errors
+
+    def summary(self) -> dict:
+        count = self.latency.count
+        return {
+            **self.latency.summary(),
+            "errors": self.errors,
+            "error_rate": self.errors / count if count else 0.0,
+            "status_codes": self.status_codes,
+        }
+
+
+class ZipfSampler:
+    """Draws product ids with Zipf-distributed popularity: the id of rank k is picked with weight 1 / k**s."""
+
+    def __init__(self, product_ids: list[str], exponent: float, rng: random.Random) -> None:
+        self._product_ids = list(product_ids)
+        #? Popularity must not follow id order, shuffle once with the seeded generator
+        rng.shuffle(self._product_ids)
+        self._cumulative = list(itertools.accumulate(1 / rank**exponent for rank in range(1, len(self._product_ids) + 1)))
+        self._rng = rng
+
+    def sample(self) -> str:
+        point = self._rng.random() * self._cumulative[-1]
+        return self._product_ids[bisect.bisect_left(self._cumulative, point)]
+
+    def sample_many(self, count: int) -> list[str]:
+        return list(dict.fromkeys(self.sample() for _ in range(count)))
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix: dict[str, float] = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in REQUEST_TYPES:
+            raise argparse.ArgumentTypeError(f"unknown request type {name!r}, expected one of {', '.join(REQUEST_TYPES)}")
+        mix[name] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("the mix weights must add up to more than 0")
+    return mix
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--rate", type=float, default=50.0, help="Offered load in requests per second")
+    parser.add_argument("--arrivals", choices=("constant", "poisson"), default="poisson")
+    parser.add_argument("--warmup", type=float, default=10.0, help="Seconds of load sent before measuring")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of measured load after the warm-up")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("product=0.7,list=0.1,batch=0.1,ids=0.1"))
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of product popularity, 0 for uniform")
+    parser.add_argument("--list-limit", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Requests due beyond this many in flight are skipped and counted")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for arrivals, mix and product picks, for reproducible runs")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    return parser.parse_args(argv)
+
+
+async def load_product_ids(client: httpx.AsyncClient) -> list[str]:
+    product_ids: list[str] = []
+    cursor = None
+    while True:
+        params = {"limit": 1000, **({"cursor": cursor} if cursor else {})}
+        resp = await client.get("/products/ids", params=params)
+        resp.raise_for_status()
+        page = resp.json()
+        product_ids.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return product_ids
+
+
+def build_request(kind: str, sampler: ZipfSampler, args: argparse.Namespace) -> tuple[str, str, dict]:
+    if kind == "product":
+        return "GET", f"/products/{sampler.sample()}", {}
+    if kind == "list":
+        return "GET", "/products", {"params": {"limit": args.list_limit}}
+    if kind == "batch":
+        return "POST", "/products:batchGet", {"json": {"product_ids": sampler.sample_many(args.batch_size)}}
+    return "GET", "/products/ids", {"params": {"limit": args.list_limit}}
+
+
+async def run(args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        product_ids = await load_product_ids(client)
+        if not product_ids:
+            raise SystemExit("The gateway returned no product ids, load some data first")
+        sampler = ZipfSampler(product_ids, args.zipf, rng)
+        kinds, weights = zip(*args.mix.items())
+
+        stats = {kind: RequestStats() for kind in kinds}
+        skipped = 0
+        in_flight: set[asyncio.Task] = set()
+
+        async def send(kind: str, request: tuple[str, str, dict], scheduled_at: float, measured: bool) -> None:
+            method, url, kwargs = request
+            try:
+                resp = await client.request(method, url, **kwargs)
+                outcome, is_error = str(resp.status_code), resp.status_code >= 500
+            except httpx.HTTPError as e:
+                outcome, is_error = type(e).__name__, True
+            if measured:
+                #? Measured from the scheduled start, so time spent queued behind a slow server counts
+                stats[kind].record(time.perf_counter() - scheduled_at, outcome, is_error)
+
+        started_at = time.perf_counter()
+        measure_from = started_at + args.warmup
+        stop_at = measure_from + args.duration
+        scheduled_at = started_at
+        while True:
+            gap = 1 / args.rate if args.arrivals == "constant" else rng.expovariate(args.rate)
+            scheduled_at += gap
+            if scheduled_at >= stop_at:
+                break
+            kind = rng.choices(kinds, weights)[0]
+            #? Drawn here in schedule order, skipped or not, so the seed alone fixes the request sequence
+            request = build_request(kind, sampler, args)
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            measured = scheduled_at >= measure_from
+            if len(in_flight) >= args.max_in_flight:
+                skipped += measured
+                continue
+            task = asyncio.create_task(send(kind, request, scheduled_at, measured))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        await asyncio.gather(*in_flight)
+
+    overall = RequestStats()
+    for kind_stats in stats.values():
+        overall.merge(kind_stats)
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "product_ids": len(product_ids),
+        "offered_rate": args.rate,
+        "achieved_rate": overall.latency.count / args.duration,
+        "skipped": skipped,
+        "overall": overall.summary(),
+        "requests": {kind: kind_stats.summary() for kind, kind_stats in stats.items()},
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    summary = results["overall"]
+    print(
+        f"{summary['count']} requests at {results['achieved_rate']:.1f}/s (offered {args.rate:.1f}/s), "
+        f"errors {summary['error_rate']:.2%}, skipped {results['skipped']}"
+    )
+    for name, values in [("overall", summary), *results["requests"].items()]:
+        print(
+            f"  {name:<8} p50 {values['p50_ms']:8.2f} ms  p90 {values['p90_ms']:8.2f} ms  "
+            f"p99 {values['p99_ms']:8.2f} ms  p99.9 {values['p99.9_ms']:8.2f} ms  errors {values['error_rate']:.2%}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
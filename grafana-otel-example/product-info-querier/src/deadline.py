@@ -0,0 +1,73 @@
+import asyncio
+import time
+from contextvars import ContextVar
+
+from fastapi.responses import ORJSONResponse
+from opentelemetry import trace
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+#? Relative rather than absolute, so clock skew between hosts does not matter
+DEADLINE_HEADER = "x-request-timeout-ms"
+
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+def get_remaining_time() -> float | None:
+    """Seconds left before the current request's deadline, or None if the caller sent none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware enforcing the time budget a caller sends in `X-Request-Timeout-Ms`.
+
+    The request is cancelled once the budget is spent and answered with a 504,
+    since the caller has given up on it by then; requests without the header
+    are not limited. The budget covers the time to the response start only,
+    so a streamed body is never cut off after its 200 has been sent. The
+    remaining time is available to handlers through `get_remaining_time`.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        timeout_ms = None
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == DEADLINE_HEADER.encode():
+                    try:
+                        timeout_ms = float(value)
+                    except ValueError:
+                        pass
+                    break
+        if timeout_ms is None:
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+        token = _deadline.set(time.monotonic() + timeout_ms / 1000)
+        timeout = asyncio.timeout(max(timeout_ms, 0.0) / 1000)
+
+        async def send_tracking_start(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                #? Streaming responses send from a child task, rescheduling the parent's timeout from there is safe
+                if not timeout.expired():
+                    timeout.reschedule(None)
+            await send(message)
+
+        try:
+            async with timeout:
+                await self.app(scope, receive, send_tracking_start)
+        except TimeoutError:
+            #? Only our own deadline is answered here, and only while the response can still be replaced
+            if not timeout.expired() or response_started:
+                raise
+            trace.get_current_span().set_attribute("request.deadline_exceeded", True)
+            response = ORJSONResponse(status_code=504, content={"message": "Request deadline exceeded"})
+            await response(scope, receive, send)
+        finally:
+            _deadline.reset(token)
@@ -0,0 +1,118 @@
+import logging
+import random
+import threading
+import time
+
+from opentelemetry import metrics, trace
+
+from config import LogControlSettings
+
+meter = metrics.get_meter(__name__)
+
+suppressed_counter = meter.create_counter(
+    "logging.records.suppressed", unit="{record}", description="Log records dropped by sampling or rate limiting"
+)
+
+
+class _TokenBucket:
+    def __init__(self, rate: float) -> None:
+        self._rate = rate
+        self._capacity = max(rate, 1.0)
+        self._tokens = self._capacity
+        self._refilled_at = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._refilled_at) * self._rate)
+        self._refilled_at = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+
+class LogVolumeFilter(logging.Filter):
+    """
+    Handler filter that samples and rate limits log records before they are formatted or exported.
+
+    Records at or above `always_keep_level`, and records emitted inside a
+    sampled trace (when `keep_sampled_traces` is set), always pass. Others are
+    sampled by the ratio configured for their logger and level, then rate
+    limited by a token bucket per logger. Since the filter runs before any
+    formatting, callers using lazy `%`-style arguments pay nothing for a
+    suppressed record beyond creating it.
+    """
+
+    def __init__(self, settings: LogControlSettings) -> None:
+        super().__init__()
+        self._settings = settings
+        self._always_keep_level = logging.getLevelName(settings.always_keep_level.upper())
+        self._ratios: dict[tuple[str, int], float] = {}
+        self._buckets: dict[str, _TokenBucket] = {}
+        self._lock = threading.Lock()
+        #? Handlers run one after another on the emitting thread, remembering the last record there
+        #? gives every handler the same decision without adding attributes that would be exported
+        self._last_decision = threading.local()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(self._last_decision, "record", None) is record:
+            return self._last_decision.keep
+        keep = self._decide(record)
+        self._last_decision.record = record
+        self._last_decision.keep = keep
+        return keep
+
+    def _decide(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self._always_keep_level:
+            return True
+        if self._settings.keep_sampled_traces and trace.get_current_span().get_span_context().trace_flags.sampled:
+            return True
+
+        ratio = self._get_ratio(record.name, record.levelno)
+        if ratio < 1.0 and random.random() >= ratio:
+            suppressed_counter.add(1, {"logger": record.name, "reason": "sampled"})
+            return False
+
+        if self._settings.max_records_per_second > 0:
+            with self._lock:
+                bucket = self._buckets.get(record.name)
+                if bucket is None:
+                    bucket = self._buckets[record.name] = _TokenBucket(self._settings.max_records_per_second)
+                allowed = bucket.take()
+            if not allowed:
+                suppressed_counter.add(1, {"logger": record.name, "reason": "rate_limited"})
+                return False
+        return True
+
+    def _get_ratio(self, name: str, levelno: int) -> float:
+        """
+        Resolve the sample ratio for a logger and level.
+
+        Keys are looked up from the most specific to the least: `name:LEVEL`,
+        then `name`, repeated for each parent logger, then `LEVEL` alone.
+        """
+        ratio = self._ratios.get((name, levelno))
+        if ratio is None:
+            level = logging.getLevelName(levelno)
+            ratios = self._settings.sample_ratios
+            ratio = ratios.get(level, 1.0)
+            parts = name.split(".")
+            for i in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:i])
+                if f"{prefix}:{level}" in ratios:
+                    ratio = ratios[f"{prefix}:{level}"]
+                    break
+                if prefix in ratios:
+                    ratio = ratios[prefix]
+                    break
+            self._ratios[(name, levelno)] = ratio
+        return ratio
+
+
+def setup_log_control(settings: LogControlSettings) -> None:
+    """Attach the volume filter to every root handler, including the OTLP `LoggingHandler`."""
+    if not settings.enabled:
+        return
+    log_filter = LogVolumeFilter(settings)
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(log_filter)
@@ -1,9 +1,10 @@
 from contextlib import contextmanager
 import random
-from fastapi import FastAPI, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Query, Request, status
+from typing import AsyncIterator
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from opentelemetry import trace
-import redis
+from redis.exceptions import RedisError
 
 from otel_instrumentation import (
     setup_otel,
@@ -11,8 +12,14 @@ from otel_instrumentation import (
     setup_redis_instrumentation,
 )
 import logging
-from config import RedisSettings, FaultInjectionSettings
-from pydantic import BaseModel
+from config import RedisSettings, FaultInjectionSettings, PaginationSettings
+from deadline import DeadlineMiddleware
+from metrics import REDMetricsMiddleware
+from ndjson import NDJSON_MEDIA_TYPE, accepts_ndjson, ndjson_line
+from pagination import InvalidCursorError, decode_cursor, encode_cursor
+from redis_store import ProductInfoStore, create_product_info_store
+from runtime_metrics import shutdown_runtime_metrics
+from pydantic import BaseModel, Field, TypeAdapter
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +27,25 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     setup_otel()
     setup_redis_instrumentation()
-    yield
-
 
-app = FastAPI(lifespan=lifespan)
+    #? One shared connection pool for the app lifetime instead of a client per request
+    product_info_store = create_product_info_store(redis_settings)
+    try:
+        await product_info_store.ensure_index()
+    except RedisError as e:
+        logger.warning("Could not verify the product index at startup: %s", e)
+    app.state.product_info_store = product_info_store
+    try:
+        yield
+    finally:
+        await product_info_store.close()
+        await shutdown_runtime_metrics()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 redis_settings = RedisSettings()
 fault_injection_settings = FaultInjectionSettings()
+pagination_settings = PaginationSettings()
 
 class ProductInfo(BaseModel):
     product_id: str
@@ -37,6 +57,15 @@ class ProductInfo(BaseModel):
     bread_crumbs: str
     url: str
 
+class ProductInfoBatchRequest(BaseModel):
+    product_ids: list[str] = Field(min_length=1)
+
+#? Redis hashes hold strings only, so results always need coercing; one adapter call per page is much cheaper than a model per product
+product_infos_adapter = TypeAdapter(list[ProductInfo])
+
+def to_product_infos(results: list[dict]) -> list[dict]:
+    return product_infos_adapter.dump_python(product_infos_adapter.validate_python(results))
+
 tracer = trace.get_tracer(__name__)
 
 @contextmanager
@@ -44,68 +73,122 @@ def fault_injection(error_message: str):
     yield
     fault_injected = random.randint(1, 100) <= fault_injection_settings.rate
     if fault_injected and fault_injection_settings.enabled:
-        logger.error(f"Fault injected: {error_message}")
+        logger.error("Fault injected: %s", error_message)
         raise Exception(error_message)
 
 
-def connect_redis():
-    with trace.get_tracer(__name__).start_as_current_span("connect_redis"):
-        return redis.Redis(
-            host=redis_settings.host,
-            port=redis_settings.port,
-            db=redis_settings.db,
-            decode_responses=True,
-        )
+async def stream_product_infos(
+    product_info_store: ProductInfoStore, first_page: list[dict], next_after: str | None
+) -> AsyncIterator[bytes]:
+    """Yield product infos as NDJSON, one index page at a time, until the end of the catalog."""
+    page = first_page
+    while True:
+        for product_info in to_product_infos(page):
+            yield ndjson_line(product_info)
+        if next_after is None:
+            return
+        page, next_after = await product_info_store.list_page(next_after, pagination_settings.max_limit)
 
-def get_redis_product_key(product_id: str):
-    return f"product:{product_id}"
 
 @app.get("/products/infos")
-def list_product_infos():
+async def list_product_infos(
+    request: Request,
+    limit: int = Query(pagination_settings.default_limit, ge=1),
+    cursor: str | None = None,
+):
     with tracer.start_as_current_span("list_product_infos") as span:
+        limit = min(limit, pagination_settings.max_limit)
         span.set_attribute("product.action", "list_product_infos")
 
         logger.info("Listing products infos...")
         try:
+            after = decode_cursor(cursor)
+            product_info_store: ProductInfoStore = request.app.state.product_info_store
+
+            if accepts_ndjson(request):
+                #? The first page is read up front so failures still surface as a status code
+                with fault_injection("Database connection failed"):
+                    results, next_after = await product_info_store.list_page(after, pagination_settings.max_limit)
+                logger.info("Streaming product infos...")
+                return StreamingResponse(
+                    stream_product_infos(product_info_store, results, next_after), media_type=NDJSON_MEDIA_TYPE
+                )
+
             with fault_injection("Database connection failed"):
-                redis_client = connect_redis()
-                all_product_infos: list[ProductInfo] = []
-                for key in redis_client.scan_iter("product:*"):
-                    all_product_infos.append(ProductInfo(**redis_client.hgetall(get_redis_product_key(key))))
-            if all_product_infos:
-                logger.info(f"Found {len(all_product_infos)} product infos")
-                return JSONResponse(content=[product_info.model_dump() for product_info in all_product_infos], status_code=status.HTTP_200_OK)
-            logger.info("No products found")
-            return JSONResponse(content={"message": "No products found"}, status_code=status.HTTP_404_NOT_FOUND)
+                results, next_after = await product_info_store.list_page(after, limit)
+            product_infos = to_product_infos(results)
+            span.set_attribute("product.count", len(product_infos))
+            logger.info("Found %s product infos", len(product_infos))
+            return ORJSONResponse(
+                content={
+                    "items": product_infos,
+                    "next_cursor": encode_cursor(next_after) if next_after is not None else None,
+                },
+                status_code=status.HTTP_200_OK,
+            )
+        except InvalidCursorError as e:
+            return ORJSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.exception(str(e))
-            span.set_status(trace.StatusCode, "ERROR")
+            span.set_status(trace.StatusCode.ERROR, str(e))
             span.record_exception(e)
-            return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return ORJSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 
 @app.get("/products/infos/{product_id}")
-def get_product_info(product_id: str):
+async def get_product_info(product_id: str, request: Request):
     with tracer.start_as_current_span("get_product_info") as span:
         span.set_attribute("product.action", "get_product_info")
         span.set_attribute("product.count", 1)
         
         try:
-            logger.info(f"Getting product info of {product_id}...")
+            logger.info("Getting product info of %s...", product_id)
+
+            product_info_store: ProductInfoStore = request.app.state.product_info_store
+            with fault_injection("Database connection failed"):
+                result = await product_info_store.get(product_id)
+            if result:
+                product_info = ProductInfo(**result)
+                logger.info("Found product info: %s", product_info)
+                return ORJSONResponse(content=product_info.model_dump(), status_code=status.HTTP_200_OK)
+            logger.info("Product %s not found", product_id)
+            return ORJSONResponse(content={"message": "Product not found"}, status_code=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.exception(str(e))
+            span.set_status(trace.StatusCode.ERROR, str(e))
+            span.record_exception(e)
+            return ORJSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@app.post("/products/infos:batchGet")
+async def batch_get_product_infos(batch_request: ProductInfoBatchRequest, request: Request):
+    with tracer.start_as_current_span("batch_get_product_infos") as span:
+        product_ids = list(dict.fromkeys(batch_request.product_ids))
+        span.set_attribute("product.action", "batch_get_product_infos")
+        span.set_attribute("product.count", len(product_ids))
+
+        try:
+            logger.info("Batch getting %s product infos...", len(product_ids))
 
+            product_info_store: ProductInfoStore = request.app.state.product_info_store
             with fault_injection("Database connection failed"):
-                redis_client = connect_redis()
-                product_info = ProductInfo(**redis_client.hgetall(get_redis_product_key(product_id)))
-            if product_info:
-                logger.info(f"Found product info: {product_info}")
-                return JSONResponse(content=product_info.model_dump(), status_code=status.HTTP_200_OK)
-            logger.info(f"Product {product_id} not found")
-            return JSONResponse(content={"message": "Product not found"}, status_code=status.HTTP_404_NOT_FOUND)
+                results = await product_info_store.get_many(product_ids)
+
+            product_infos = to_product_infos([result for result in results if result])
+            missing_product_ids = [product_id for product_id, result in zip(product_ids, results) if not result]
+            logger.info("Found %s product infos, %s missing", len(product_infos), len(missing_product_ids))
+            return ORJSONResponse(
+                content={"product_infos": product_infos, "missing_product_ids": missing_product_ids},
+                status_code=status.HTTP_200_OK,
+            )
         except Exception as e:
             logger.exception(str(e))
-            span.set_status(trace.StatusCode, "ERROR")
+            span.set_status(trace.StatusCode.ERROR, str(e))
             span.record_exception(e)
-            return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return ORJSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+#! Added first so it runs inside the RED metrics middleware, which then records the 504s it answers
+app.add_middleware(DeadlineMiddleware)
+#! Added before the instrumentation so RED metrics are recorded inside the server span, with its trace as exemplar
+app.add_middleware(REDMetricsMiddleware)
 #! We need to put it here as we can't add middleware after app is created
 setup_fastapi_instrumentation(app)
\ No newline at end of file
@@ -0,0 +1,247 @@
+import asyncio
+import atexit
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Optional
+
+from opentelemetry import trace
+from opentelemetry._logs import SeverityNumber
+from opentelemetry.context import _RUNTIME_CONTEXT, Context
+from opentelemetry.sdk._logs import LoggerProvider, LogRecord
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor, TracerProvider
+
+from config import ProfilerSettings
+
+logger = logging.getLogger(__name__)
+
+#? Span attributed to a sample, as (trace id, span id, span name); zeros when no sampled span is active
+_SpanKey = tuple[int, int, str]
+_UNATTRIBUTED: _SpanKey = (0, 0, "")
+
+
+class _ThreadSpanTracker(SpanProcessor):
+    """
+    Tracks the innermost span started on each thread other than the event loop's.
+
+    Worker threads (the AnyIO thread pool, the DB-API instrumentation) start
+    and end their spans on the same thread, so the last one started and not yet
+    ended is the one running. The event loop thread interleaves tasks and is
+    resolved from the running task instead.
+    """
+
+    def __init__(self, loop_thread_id: int | None) -> None:
+        self._loop_thread_id = loop_thread_id
+        self._spans: dict[int, list[_SpanKey]] = {}
+        self._span_threads: dict[int, int] = {}
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        thread_id = threading.get_ident()
+        if thread_id == self._loop_thread_id or not span.context.trace_flags.sampled:
+            return
+        self._spans.setdefault(thread_id, []).append((span.context.trace_id, span.context.span_id, span.name))
+        self._span_threads[span.context.span_id] = thread_id
+
+    def on_end(self, span: ReadableSpan) -> None:
+        thread_id = self._span_threads.pop(span.context.span_id, None)
+        if thread_id is None:
+            return
+        #? on_end gets a snapshot of the span, not the object passed to on_start, so match on the id
+        spans = self._spans.get(thread_id, [])
+        spans[:] = [key for key in spans if key[1] != span.context.span_id]
+        if not spans:
+            self._spans.pop(thread_id, None)
+
+    def get_span(self, thread_id: int) -> _SpanKey | None:
+        #? Called from the sampler thread while the list may be emptied concurrently
+        try:
+            return self._spans[thread_id][-1]
+        except (KeyError, IndexError):
+            return None
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread at a fixed interval and aggregates the
+    samples per active span into folded stacks, flushed once per window.
+
+    Samples are attributed to the innermost sampled span: on the event loop
+    thread the span of the task running at that instant, on other threads the
+    span last started there. The sampler holds the GIL while it walks the
+    stacks, so it paces itself to stay below `max_overhead_ratio` of wall time.
+    """
+
+    def __init__(
+        self,
+        settings: ProfilerSettings,
+        logger_provider: LoggerProvider,
+        directory: Path,
+    ) -> None:
+        self._settings = settings
+        self._otel_logger = logger_provider.get_logger(__name__)
+        self._directory = directory
+        try:
+            self._loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+            self._loop_thread_id: int | None = threading.get_ident()
+        except RuntimeError:
+            self._loop = None
+            self._loop_thread_id = None
+        self.span_tracker = _ThreadSpanTracker(self._loop_thread_id)
+        self._labels: dict[CodeType, str] = {}
+        self._stacks: dict[_SpanKey, Counter[str]] = {}
+        self._distinct_stacks = 0
+        self._dropped_samples = 0
+        self._window_started_at = time.time()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="otel-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._flush()
+
+    def _run(self) -> None:
+        interval = self._settings.interval_ms / 1000
+        next_window_at = time.monotonic() + self._settings.window_seconds
+        while not self._stopped.is_set():
+            started_at = time.perf_counter()
+            self._sample()
+            spent = time.perf_counter() - started_at
+            #? Stretch the pause after slow samples so sampling stays within the overhead budget
+            delay = max(interval - spent, spent / self._settings.max_overhead_ratio - spent)
+            if time.monotonic() >= next_window_at:
+                next_window_at += self._settings.window_seconds
+                self._flush()
+            self._stopped.wait(delay)
+
+    def _sample(self) -> None:
+        own_thread_id = threading.get_ident()
+        loop_span = self._get_loop_span()
+        with self._lock:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                key = loop_span if thread_id == self._loop_thread_id else self.span_tracker.get_span(thread_id)
+                if key is None:
+                    if not self._settings.include_unattributed:
+                        continue
+                    key = _UNATTRIBUTED
+                self._add(key, self._fold(frame))
+
+    def _get_loop_span(self) -> _SpanKey | None:
+        if self._loop is None:
+            return None
+        task = asyncio.current_task(self._loop)
+        if task is None:
+            return None
+        #? Task.get_context() is 3.12+, reading a context that another thread has entered is safe
+        get_context = getattr(task, "get_context", None)
+        context = get_context() if get_context is not None else getattr(task, "_context", None)
+        if context is None:
+            return None
+        span = trace.get_current_span(context.get(_RUNTIME_CONTEXT._current_context))
+        span_context = span.get_span_context()
+        if not span_context.trace_flags.sampled or not isinstance(span, ReadableSpan):
+            return None
+        return (span_context.trace_id, span_context.span_id, span.name)
+
+    def _fold(self, frame: FrameType | None) -> str:
+        labels = []
+        while frame is not None and len(labels) < self._settings.max_stack_depth:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+            labels.append(label)
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def _add(self, key: _SpanKey, stack: str) -> None:
+        stacks = self._stacks.get(key)
+        if stacks is None:
+            stacks = self._stacks[key] = Counter()
+        if stack not in stacks:
+            if self._distinct_stacks >= self._settings.max_stacks_per_window:
+                self._dropped_samples += 1
+                return
+            self._distinct_stacks += 1
+        stacks[stack] += 1
+
+    def _flush(self) -> None:
+        with self._lock:
+            stacks, self._stacks = self._stacks, {}
+            dropped, self._dropped_samples = self._dropped_samples, 0
+            self._distinct_stacks = 0
+            window_started_at, self._window_started_at = self._window_started_at, time.time()
+        if dropped:
+            logger.warning("Profiler dropped %d samples, over %d distinct stacks in the window", dropped, self._settings.max_stacks_per_window)
+        if not stacks:
+            return
+        try:
+            if self._settings.output == "file":
+                self._write_file(stacks, window_started_at)
+            else:
+                self._emit_log_records(stacks, window_started_at)
+        except Exception:
+            logger.exception("Could not write the profile for the last window")
+
+    def _write_file(self, stacks: dict[_SpanKey, Counter[str]], window_started_at: float) -> None:
+        """One folded-stack file per window; each span is a root frame carrying its ids, so it can be grepped from a trace."""
+        self._directory.mkdir(parents=True, exist_ok=True)
+        path = self._directory / f"profile-{int(window_started_at)}.folded"
+        with open(path, "w") as f:
+            for (trace_id, span_id, name), counts in stacks.items():
+                root = f"{name} trace_id={trace_id:032x} span_id={span_id:016x}" if trace_id else "unattributed"
+                for stack, count in counts.items():
+                    f.write(f"{root};{stack} {count}\n")
+
+    def _emit_log_records(self, stacks: dict[_SpanKey, Counter[str]], window_started_at: float) -> None:
+        """One OTLP log record per span, linked to it through its trace and span ids, with the folded stacks as body."""
+        timestamp = int(window_started_at * 1e9)
+        for (trace_id, span_id, name), counts in stacks.items():
+            self._otel_logger.emit(
+                LogRecord(
+                    timestamp=timestamp,
+                    trace_id=trace_id,
+                    span_id=span_id,
+                    trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED if trace_id else trace.TraceFlags.DEFAULT),
+                    severity_text="INFO",
+                    severity_number=SeverityNumber.INFO,
+                    body="\n".join(f"{stack} {count}" for stack, count in counts.items()),
+                    resource=self._otel_logger.resource,
+                    attributes={
+                        "event.name": "profile.folded",
+                        "profile.span_name": name,
+                        "profile.samples": sum(counts.values()),
+                        "profile.interval_ms": self._settings.interval_ms,
+                        "profile.window_seconds": self._settings.window_seconds,
+                    },
+                )
+            )
+
+
+def setup_profiler(
+    settings: ProfilerSettings,
+    trace_provider: TracerProvider,
+    logger_provider: LoggerProvider,
+    directory: Path,
+) -> SamplingProfiler | None:
+    """Start the sampling profiler if enabled; call it from the event loop so its tasks can be attributed."""
+    if not settings.enabled:
+        return None
+    profiler = SamplingProfiler(settings, logger_provider, directory)
+    trace_provider.add_span_processor(profiler.span_tracker)
+    profiler.start()
+    return profiler
@@ -0,0 +1,196 @@
+from typing import Protocol
+
+import redis
+import redis.asyncio
+from starlette.concurrency import run_in_threadpool
+
+from config import RedisSettings
+from metrics import record_db_operation
+
+
+#? Sorted set of every product id (all scores 0, so members are ordered by id)
+PRODUCT_INDEX_KEY = "product_index"
+
+
+def get_redis_product_key(product_id: str) -> str:
+    return f"product:{product_id}"
+
+
+def get_index_range_start(after: str | None) -> str:
+    return f"({after}" if after is not None else "-"
+
+
+class ProductInfoStore(Protocol):
+    async def get(self, product_id: str) -> dict: ...
+
+    async def get_many(self, product_ids: list[str]) -> list[dict]: ...
+
+    async def list_ids(self, after: str | None, limit: int) -> list[str]: ...
+
+    async def list_page(self, after: str | None, limit: int) -> tuple[list[dict], str | None]: ...
+
+    async def ensure_index(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class AsyncRedisProductInfoStore:
+    """
+    Product info store on redis.asyncio, so Redis calls never occupy a worker thread.
+
+    All requests share one connection pool created at startup. Multi-key reads
+    are sent as pipelines of `pipeline_batch_size` HGETALLs, i.e. one round
+    trip per batch instead of one per product.
+    """
+
+    def __init__(self, settings: RedisSettings) -> None:
+        self._batch_size = settings.pipeline_batch_size
+        self._client = redis.asyncio.Redis(
+            connection_pool=redis.asyncio.BlockingConnectionPool(
+                host=settings.host,
+                port=settings.port,
+                db=settings.db,
+                max_connections=settings.max_connections,
+                timeout=settings.pool_timeout,
+                socket_timeout=settings.socket_timeout,
+                socket_connect_timeout=settings.socket_connect_timeout,
+                decode_responses=True,
+            )
+        )
+
+    async def get(self, product_id: str) -> dict:
+        with record_db_operation("redis", "HGETALL"):
+            return await self._client.hgetall(get_redis_product_key(product_id))
+
+    async def get_many(self, product_ids: list[str]) -> list[dict]:
+        return await self._hgetall_many([get_redis_product_key(product_id) for product_id in product_ids])
+
+    async def list_ids(self, after: str | None, limit: int) -> list[str]:
+        with record_db_operation("redis", "ZRANGEBYLEX"):
+            return await self._client.zrangebylex(PRODUCT_INDEX_KEY, get_index_range_start(after), "+", start=0, num=limit)
+
+    async def list_page(self, after: str | None, limit: int) -> tuple[list[dict], str | None]:
+        #? Read one extra id to know whether another page exists
+        product_ids = await self.list_ids(after, limit + 1)
+        next_after = product_ids[limit - 1] if len(product_ids) > limit else None
+        results = await self.get_many(product_ids[:limit])
+        return [result for result in results if result], next_after
+
+    async def ensure_index(self) -> None:
+        if await self._client.exists(PRODUCT_INDEX_KEY):
+            return
+        #? One-off backfill for data loaded before the index existed
+        batch: list[str] = []
+        async for key in self._client.scan_iter(match=get_redis_product_key("*"), count=self._batch_size):
+            batch.append(key)
+            if len(batch) == self._batch_size:
+                await self._add_to_index(batch)
+                batch = []
+        if batch:
+            await self._add_to_index(batch)
+
+    async def _add_to_index(self, keys: list[str]) -> None:
+        await self._client.zadd(PRODUCT_INDEX_KEY, {key.removeprefix(get_redis_product_key("")): 0 for key in keys})
+
+    async def close(self) -> None:
+        await self._client.aclose()
+        await self._client.connection_pool.disconnect()
+
+    async def _hgetall_many(self, keys: list[str]) -> list[dict]:
+        results: list[dict] = []
+        for start in range(0, len(keys), self._batch_size):
+            async with self._client.pipeline(transaction=False) as pipe:
+                for key in keys[start:start + self._batch_size]:
+                    pipe.hgetall(key)
+                with record_db_operation("redis", "PIPELINE HGETALL"):
+                    results.extend(await pipe.execute())
+        return results
+
+
+class RedisProductInfoStore:
+    """
+    Product info store on the blocking redis client, run on the thread pool.
+
+    Same pooling and pipelining as `AsyncRedisProductInfoStore`; kept for
+    debugging and for comparing against the async mode.
+    """
+
+    def __init__(self, settings: RedisSettings) -> None:
+        self._batch_size = settings.pipeline_batch_size
+        self._client = redis.Redis(
+            connection_pool=redis.BlockingConnectionPool(
+                host=settings.host,
+                port=settings.port,
+                db=settings.db,
+                max_connections=settings.max_connections,
+                timeout=settings.pool_timeout,
+                socket_timeout=settings.socket_timeout,
+                socket_connect_timeout=settings.socket_connect_timeout,
+                decode_responses=True,
+            )
+        )
+
+    async def get(self, product_id: str) -> dict:
+        return await run_in_threadpool(self._hgetall, get_redis_product_key(product_id))
+
+    async def get_many(self, product_ids: list[str]) -> list[dict]:
+        return await run_in_threadpool(self._hgetall_many, [get_redis_product_key(product_id) for product_id in product_ids])
+
+    async def list_ids(self, after: str | None, limit: int) -> list[str]:
+        return await run_in_threadpool(self._list_ids, after, limit)
+
+    async def list_page(self, after: str | None, limit: int) -> tuple[list[dict], str | None]:
+        return await run_in_threadpool(self._list_page, after, limit)
+
+    async def ensure_index(self) -> None:
+        await run_in_threadpool(self._ensure_index)
+
+    async def close(self) -> None:
+        self._client.close()
+        self._client.connection_pool.disconnect()
+
+    def _hgetall(self, key: str) -> dict:
+        with record_db_operation("redis", "HGETALL"):
+            return self._client.hgetall(key)
+
+    def _list_ids(self, after: str | None, limit: int) -> list[str]:
+        with record_db_operation("redis", "ZRANGEBYLEX"):
+            return self._client.zrangebylex(PRODUCT_INDEX_KEY, get_index_range_start(after), "+", start=0, num=limit)
+
+    def _list_page(self, after: str | None, limit: int) -> tuple[list[dict], str | None]:
+        product_ids = self._list_ids(after, limit + 1)
+        next_after = product_ids[limit - 1] if len(product_ids) > limit else None
+        results = self._hgetall_many([get_redis_product_key(product_id) for product_id in product_ids[:limit]])
+        return [result for result in results if result], next_after
+
+    def _ensure_index(self) -> None:
+        if self._client.exists(PRODUCT_INDEX_KEY):
+            return
+        #? One-off backfill for data loaded before the index existed
+        batch: list[str] = []
+        for key in self._client.scan_iter(match=get_redis_product_key("*"), count=self._batch_size):
+            batch.append(key)
+            if len(batch) == self._batch_size:
+                self._add_to_index(batch)
+                batch = []
+        if batch:
+            self._add_to_index(batch)
+
+    def _add_to_index(self, keys: list[str]) -> None:
+        self._client.zadd(PRODUCT_INDEX_KEY, {key.removeprefix(get_redis_product_key("")): 0 for key in keys})
+
+    def _hgetall_many(self, keys: list[str]) -> list[dict]:
+        results: list[dict] = []
+        for start in range(0, len(keys), self._batch_size):
+            with self._client.pipeline(transaction=False) as pipe:
+                for key in keys[start:start + self._batch_size]:
+                    pipe.hgetall(key)
+                with record_db_operation("redis", "PIPELINE HGETALL"):
+                    results.extend(pipe.execute())
+        return results
+
+
+def create_product_info_store(settings: RedisSettings) -> ProductInfoStore:
+    if settings.async_mode:
+        return AsyncRedisProductInfoStore(settings)
+    return RedisProductInfoStore(settings)
@@ -1,14 +1,52 @@
+from typing import Literal
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class ProjectSettings(BaseSettings):
-    service_name: str = "product-info-querier"
-    service_instance_id: str = "product-info-querier-1"
+    service_name: str = "product-price-querier"
+    service_instance_id: str = "product-price-querier-1"
     env: str = "dev"
+    #? Worker processes per container, read from the same variable as uvicorn's --workers default
+    web_concurrency: int = 1
 
 
+class OTLPExportSettings(BaseModel):
+    protocol: Literal["http/protobuf", "grpc"] = "http/protobuf"
+    #? Full endpoint for this signal, by default derived from OTEL_EXPORTER_OTLP_ENDPOINT
+    endpoint: str | None = None
+    compression: Literal["none", "gzip"] = "gzip"
+    timeout_ms: int = 10_000
+
+class BatchExportSettings(OTLPExportSettings):
+    max_queue_size: int = 2048
+    max_export_batch_size: int = 512
+    schedule_delay_ms: int = 5000
+    export_timeout_ms: int = 30_000
+
+class MetricExportSettings(OTLPExportSettings):
+    export_interval_ms: int = 60_000
+    export_timeout_ms: int = 30_000
+    #? "delta" reports counters and histograms as deltas, for backends that expect them; gauges stay cumulative
+    temporality: Literal["cumulative", "delta"] = "cumulative"
+
 class OTELSettings(BaseSettings):
+    #? Nested settings are read from e.g. OTEL_TRACES_EXPORT__MAX_QUEUE_SIZE
+    model_config = SettingsConfigDict(env_nested_delimiter="__")
     otel_exporter_otlp_endpoint: str
+    #? Turns off the SDK and every instrumentation, like the standard variable of the same name
+    otel_sdk_disabled: bool = False
+    #? "none" drops every export and "memory" only encodes it to OTLP protobuf, to measure telemetry without a collector
+    otel_export_mode: Literal["otlp", "none", "memory"] = "otlp"
+    #? Share of new traces to sample, requests carrying a parent follow the caller's decision
+    otel_sampling_ratio: float = 1.0
+    #? Per-route ratios keyed on the route template, e.g. OTEL_SAMPLING_ROUTE_RATIOS='{"/products/ids": 0.01}'
+    otel_sampling_route_ratios: dict[str, float] = {}
+    #? Upper bound on new traces sampled per second, 0 disables
+    otel_sampling_max_traces_per_second: float = 0.0
+    otel_traces_export: BatchExportSettings = BatchExportSettings()
+    otel_logs_export: BatchExportSettings = BatchExportSettings()
+    otel_metrics_export: MetricExportSettings = MetricExportSettings()
 
 class PymysqlSettings(BaseSettings):
     model_config = SettingsConfigDict(env_prefix="MYSQL_")
@@ -17,9 +55,91 @@ class PymysqlSettings(BaseSettings):
     db: str
     user: str
     password: str
+    driver: Literal["aiomysql", "pymysql"] = "aiomysql"
+    pool_min_size: int = 1
+    #? Per worker process, so the server sees up to WEB_CONCURRENCY times as many connections
+    pool_max_size: int = 10
+    pool_acquire_timeout: float = 5.0
+    #? Connections older than this are closed and replaced (seconds)
+    pool_max_lifetime: int = 3600
+    #? Ping connections idle for longer than this before reuse (seconds), negative disables
+    pool_health_check_interval: float = 30.0
 
 class DelayInjectionSettings(BaseSettings):
     model_config = SettingsConfigDict(env_prefix="DELAY_INJECTION_")
     enabled: bool
     rate: float
-    ms: int
\ No newline at end of file
+    ms: int
+
+class PaginationSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="PAGINATION_")
+    default_limit: int = 100
+    #? Larger requested limits are clamped to this
+    max_limit: int = 1000
+
+class SerializationSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="SERIALIZATION_")
+    #? Validate trusted upstream data through the pydantic models, slower but useful when debugging bad payloads
+    strict_validation: bool = False
+
+class TailSamplingSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="OTEL_TAIL_SAMPLING_")
+    enabled: bool = False
+    #? Traces whose local root span takes at least this long are always kept (milliseconds)
+    latency_threshold_ms: float = 500.0
+    #? Per-route thresholds keyed on the route template, e.g. '{"/products": 2000}'
+    route_latency_thresholds_ms: dict[str, float] = {}
+    #? Share of healthy traces kept anyway, decided on the trace id so every service keeps the same ones
+    baseline_ratio: float = 0.1
+    #? Bounds on what is buffered while waiting for local root spans to end, the oldest traces are evicted first
+    max_traces: int = 10_000
+    max_spans: int = 100_000
+
+class SpoolSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="OTEL_SPOOL_")
+    #? Spool OTLP/HTTP exports on local disk and replay them in order, so a slow or down collector costs disk instead of memory
+    enabled: bool = False
+    #? A sub-directory per service instance and signal is created below this
+    directory: str = "/tmp/otel-spool"
+    segment_size_bytes: int = 4 * 1024 * 1024
+    #? Per signal, the oldest segments are evicted past this whether replayed or not
+    max_size_bytes: int = 256 * 1024 * 1024
+    retry_initial_backoff: float = 1.0
+    retry_max_backoff: float = 30.0
+
+class LogControlSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="LOG_CONTROL_")
+    enabled: bool = True
+    #? Records at or above this level are never sampled or rate limited
+    always_keep_level: str = "WARNING"
+    #? Keep every record emitted inside a sampled trace, so it only trims logs once trace sampling is below 100%
+    keep_sampled_traces: bool = True
+    #? Ratios keyed on "logger:LEVEL", "logger" or "LEVEL", e.g. LOG_CONTROL_SAMPLE_RATIOS='{"main:INFO": 0.1}'
+    sample_ratios: dict[str, float] = {}
+    #? Per logger, 0 disables
+    max_records_per_second: float = 0.0
+
+class RuntimeMetricsSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="RUNTIME_METRICS_")
+    enabled: bool = True
+    #? How often the event loop probe wakes up; lag is how late it wakes (seconds)
+    loop_lag_interval: float = 0.5
+
+class ProfilerSettings(BaseSettings):
+    model_config = SettingsConfigDict(env_prefix="OTEL_PROFILER_")
+    #? Opt-in: samples every thread's stack and attributes it to the span active there
+    enabled: bool = False
+    interval_ms: float = 10.0
+    #? The sampler backs off so it never takes more than this share of wall time, whatever the interval
+    max_overhead_ratio: float = 0.02
+    #? Samples are aggregated per span and flushed once per window (seconds)
+    window_seconds: float = 30.0
+    #? "otlp" emits one log record per span and window, linked to the span; "file" writes folded stacks per window
+    output: Literal["otlp", "file"] = "otlp"
+    #? A sub-directory per service instance is created below this
+    directory: str = "/tmp/otel-profiles"
+    max_stack_depth: int = 64
+    #? Distinct (span, stack) pairs kept per window, further ones are counted but dropped
+    max_stacks_per_window: int = 10_000
+    #? Also keep samples outside any sampled span, mostly idle threads
+    include_unattributed: bool = False
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Protocol, Sequence
+from weakref import WeakKeyDictionary
+
+import aiomysql
+import pymysql
+from pymysql.cursors import DictCursor
+from opentelemetry import trace
+from opentelemetry.semconv.trace import SpanAttributes
+from starlette.concurrency import run_in_threadpool
+
+from config import PymysqlSettings
+from metrics import record_db_operation
+
+logger = logging.getLogger(__name__)
+tracer = trace.get_tracer(__name__)
+
+
+class DatabasePool(Protocol):
+    async def open(self) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def fetchone(self, query: str, args: Sequence[Any] | None = None) -> dict | None: ...
+
+    async def fetchall(self, query: str, args: Sequence[Any] | None = None) -> list[dict]: ...
+
+
+class _PooledConnection:
+    def __init__(self, conn: pymysql.Connection) -> None:
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class PymysqlPool:
+    """
+    Thread-safe pool of blocking PyMySQL connections.
+
+    Connections are opened through `pymysql.connect`, so the PyMySQL
+    instrumentation keeps wrapping them and every query still produces a DB
+    span. Queries run on the AnyIO thread pool, but only for the query itself:
+    connect and auth are paid once per pooled connection.
+    """
+
+    def __init__(self, settings: PymysqlSettings) -> None:
+        self._settings = settings
+        self._idle: queue.LifoQueue[_PooledConnection] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(settings.pool_max_size)
+
+    async def open(self) -> None:
+        await run_in_threadpool(self._warm_up)
+
+    async def close(self) -> None:
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(pooled)
+
+    async def fetchone(self, query: str, args: Sequence[Any] | None = None) -> dict | None:
+        return await run_in_threadpool(self._execute, query, args, False)
+
+    async def fetchall(self, query: str, args: Sequence[Any] | None = None) -> list[dict]:
+        return await run_in_threadpool(self._execute, query, args, True)
+
+    def _execute(self, query: str, args: Sequence[Any] | None, fetch_all: bool):
+        with record_db_operation("mysql", query.split()[0]), self.connection() as conn, conn.cursor(cursor=DictCursor) as cur:
+            cur.execute(query, args)
+            return list(cur.fetchall()) if fetch_all else cur.fetchone()
+
+    @contextmanager
+    def connection(self) -> Iterator[pymysql.Connection]:
+        if not self._slots.acquire(timeout=self._settings.pool_acquire_timeout):
+            raise TimeoutError("Timed out waiting for a database connection")
+        try:
+            pooled = self._checkout()
+            try:
+                yield pooled.conn
+            except Exception:
+                #? The connection may be mid-protocol after a failure, never hand it out again
+                self._discard(pooled)
+                raise
+            pooled.last_used_at = time.monotonic()
+            self._idle.put(pooled)
+        finally:
+            self._slots.release()
+
+    def _warm_up(self) -> None:
+        try:
+            for _ in range(self._settings.pool_min_size):
+                self._idle.put(self._connect())
+        except pymysql.MySQLError as e:
+            logger.warning("Could not pre-open database connections, connecting lazily: %s", e)
+
+    def _checkout(self) -> _PooledConnection:
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+
+            now = time.monotonic()
+            if now - pooled.created_at > self._settings.pool_max_lifetime:
+                self._discard(pooled)
+                continue
+            if self._settings.pool_health_check_interval >= 0 and now - pooled.last_used_at > self._settings.pool_health_check_interval:
+                try:
+                    pooled.conn.ping(reconnect=False)
+                except pymysql.MySQLError:
+                    self._discard(pooled)
+                    continue
+            return pooled
+
+    def _connect(self) -> _PooledConnection:
+        return _PooledConnection(
+            pymysql.connect(
+                host=self._settings.host,
+                port=self._settings.port,
+                database=self._settings.db,
+                user=self._settings.user,
+                password=self._settings.password,
+                autocommit=True,
+            )
+        )
+
+    def _discard(self, pooled: _PooledConnection) -> None:
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+
+class AiomysqlPool:
+    """
+    Non-blocking pool built on aiomysql, so queries never occupy a worker thread.
+
+    aiomysql does not go through `pymysql.connect`, so the PyMySQL
+    instrumentation cannot see it. Each query is wrapped in a client span
+    carrying the same name and `db.*`/`net.*` attributes as the DB-API
+    instrumentation, so traces look the same in either driver mode.
+    """
+
+    def __init__(self, settings: PymysqlSettings) -> None:
+        self._settings = settings
+        self._pool: aiomysql.Pool | None = None
+        self._pool_lock = asyncio.Lock()
+        self._last_used_at: WeakKeyDictionary[aiomysql.Connection, float] = WeakKeyDictionary()
+        self._span_attributes = {
+            SpanAttributes.DB_SYSTEM: "mysql",
+            SpanAttributes.DB_NAME: settings.db,
+            SpanAttributes.DB_USER: settings.user,
+            SpanAttributes.NET_PEER_NAME: settings.host,
+            SpanAttributes.NET_PEER_PORT: settings.port,
+        }
+
+    async def open(self) -> None:
+        try:
+            await self._get_pool()
+        except pymysql.MySQLError as e:
+            logger.warning("Could not pre-open database connections, connecting lazily: %s", e)
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    async def fetchone(self, query: str, args: Sequence[Any] | None = None) -> dict | None:
+        return await self._execute(query, args, False)
+
+    async def fetchall(self, query: str, args: Sequence[Any] | None = None) -> list[dict]:
+        return await self._execute(query, args, True)
+
+    async def _get_pool(self) -> aiomysql.Pool:
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await aiomysql.create_pool(
+                        host=self._settings.host,
+                        port=self._settings.port,
+                        db=self._settings.db,
+                        user=self._settings.user,
+                        password=self._settings.password,
+                        minsize=self._settings.pool_min_size,
+                        maxsize=self._settings.pool_max_size,
+                        pool_recycle=self._settings.pool_max_lifetime,
+                        autocommit=True,
+                    )
+        return self._pool
+
+    async def _execute(self, query: str, args: Sequence[Any] | None, fetch_all: bool):
+        with record_db_operation("mysql", query.split()[0]):
+            return await self._execute_on_pool(query, args, fetch_all)
+
+    async def _execute_on_pool(self, query: str, args: Sequence[Any] | None, fetch_all: bool):
+        pool = await self._get_pool()
+        async with asyncio.timeout(self._settings.pool_acquire_timeout):
+            conn: aiomysql.Connection = await pool.acquire()
+        try:
+            await self._health_check(conn)
+            with tracer.start_as_current_span(query.split()[0], kind=trace.SpanKind.CLIENT) as span:
+                if span.is_recording():
+                    span.set_attributes(self._span_attributes)
+                    span.set_attribute(SpanAttributes.DB_STATEMENT, query)
+                async with conn.cursor(aiomysql.DictCursor) as cur:
+                    await cur.execute(query, args)
+                    result = list(await cur.fetchall()) if fetch_all else await cur.fetchone()
+            self._last_used_at[conn] = time.monotonic()
+            return result
+        except BaseException:
+            #? Closed connections are dropped by the pool on release instead of being reused; a cancelled query
+            #? (deadline, losing hedge, client gone) leaves unread result packets behind, so it is closed too
+            conn.close()
+            raise
+        finally:
+            pool.release(conn)
+
+    async def _health_check(self, conn: aiomysql.Connection) -> None:
+        if self._settings.pool_health_check_interval < 0:
+            return
+        last_used_at = self._last_used_at.get(conn)
+        if last_used_at is not None and time.monotonic() - last_used_at <= self._settings.pool_health_check_interval:
+            return
+        await conn.ping(reconnect=True)
+
+
+def create_database_pool(settings: PymysqlSettings) -> DatabasePool:
+    if settings.driver == "aiomysql":
+        return AiomysqlPool(settings)
+    return PymysqlPool(settings)
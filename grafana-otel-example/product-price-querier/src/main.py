@@ -1,8 +1,9 @@
-from contextlib import contextmanager
+import asyncio
+from contextlib import asynccontextmanager
 import random
-import time
-from fastapi import FastAPI, status
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Query, Request, status
+from typing import AsyncIterator
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from opentelemetry import trace
 
 from otel_instrumentation import (
@@ -11,10 +12,14 @@ from otel_instrumentation import (
     setup_pymysql_instrumentation
 )
 import logging
-from config import DelayInjectionSettings, PymysqlSettings
-import pymysql
-from pymysql.cursors import DictCursor
-from pydantic import BaseModel, field_validator
+from config import DelayInjectionSettings, PymysqlSettings, PaginationSettings, SerializationSettings
+from database import DatabasePool, create_database_pool
+from deadline import DeadlineMiddleware
+from metrics import REDMetricsMiddleware
+from ndjson import NDJSON_MEDIA_TYPE, accepts_ndjson, ndjson_line
+from pagination import InvalidCursorError, decode_cursor, encode_cursor
+from runtime_metrics import shutdown_runtime_metrics
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
 
 logger = logging.getLogger(__name__)
 
@@ -22,12 +27,23 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     setup_otel()
     setup_pymysql_instrumentation()
-    yield
+
+    #? The pool must be created after instrumentation so pooled connections are traced
+    db_pool = create_database_pool(pymysql_settings)
+    await db_pool.open()
+    app.state.db_pool = db_pool
+    try:
+        yield
+    finally:
+        await db_pool.close()
+        await shutdown_runtime_metrics()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 pymysql_settings = PymysqlSettings()
 delay_injection_settings = DelayInjectionSettings()
+pagination_settings = PaginationSettings()
+serialization_settings = SerializationSettings()
 
 class ProductPrice(BaseModel):
     product_id: str
@@ -38,81 +54,190 @@ class ProductPrice(BaseModel):
     def convert_non_compatible_to_zero(cls, value):
         return value if isinstance(value, (int, float)) else 0.0
 
+class ProductPriceBatchRequest(BaseModel):
+    product_ids: list[str] = Field(min_length=1)
+
+#? Selected explicitly so rows match `ProductPrice` field for field and can be returned as they are
+PRICE_COLUMNS = "product_id, currency, value"
+product_prices_adapter = TypeAdapter(list[ProductPrice])
+
+def to_product_prices(rows: list[dict]) -> list[dict]:
+    """
+    Shape `product_price` rows as `ProductPrice` payloads.
+
+    Rows come back from the driver already typed, so by default they are
+    passed through as they are; strict mode runs them through the model for
+    debugging.
+    """
+    if serialization_settings.strict_validation:
+        return product_prices_adapter.dump_python(product_prices_adapter.validate_python(rows))
+    return rows
+
 tracer = trace.get_tracer(__name__)
 
-@contextmanager
-def delay_injection():
+
+async def fetch_page(db_pool: DatabasePool, columns: str, after: str | None, limit: int) -> tuple[list[dict], str | None]:
+    """Keyset page ordered by product_id, reading one extra row to know whether another page exists."""
+    if after is None:
+        rows = await db_pool.fetchall(f"SELECT {columns} FROM product_price ORDER BY product_id LIMIT %s", (limit + 1,))
+    else:
+        rows = await db_pool.fetchall(
+            f"SELECT {columns} FROM product_price WHERE product_id > %s ORDER BY product_id LIMIT %s", (after, limit + 1)
+        )
+    next_after = rows[limit - 1]["product_id"] if len(rows) > limit else None
+    return rows[:limit], next_after
+
+async def stream_product_prices(db_pool: DatabasePool, first_page: list[dict], next_after: str | None) -> AsyncIterator[bytes]:
+    """Yield product prices as NDJSON in product_id order, one keyset page at a time, until the end of the table."""
+    page = first_page
+    while True:
+        for price in to_product_prices(page):
+            yield ndjson_line(price)
+        if next_after is None:
+            return
+        page, next_after = await fetch_page(db_pool, PRICE_COLUMNS, next_after, pagination_settings.max_limit)
+
+@asynccontextmanager
+async def delay_injection():
     yield
     delay_injected = random.randint(1, 100) <= delay_injection_settings.rate
     if delay_injected and delay_injection_settings.enabled:
-        logger.info(f"Delay injected, sleeping for {delay_injection_settings.ms}ms")
-        time.sleep(delay_injection_settings.ms / 1000)
+        logger.info("Delay injected, sleeping for %sms", delay_injection_settings.ms)
+        await asyncio.sleep(delay_injection_settings.ms / 1000)
+
+
+#! Must be registered before /products/prices/{product_id} so "ids" is not taken as an id
+@app.get("/products/prices/ids")
+async def list_product_ids(
+    request: Request,
+    limit: int = Query(pagination_settings.default_limit, ge=1),
+    cursor: str | None = None,
+):
+    with tracer.start_as_current_span("list_product_ids") as span:
+        limit = min(limit, pagination_settings.max_limit)
+        span.set_attribute("product.action", "list_product_ids")
+
+        logger.info("Listing product ids...")
+        try:
+            after = decode_cursor(cursor)
+            db_pool: DatabasePool = request.app.state.db_pool
+            rows, next_after = await fetch_page(db_pool, "product_id", after, limit)
+            span.set_attribute("product.count", len(rows))
+            return ORJSONResponse(
+                content={
+                    "items": [row["product_id"] for row in rows],
+                    "next_cursor": encode_cursor(next_after) if next_after is not None else None,
+                },
+                status_code=status.HTTP_200_OK,
+            )
+        except InvalidCursorError as e:
+            return ORJSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception(str(e))
+            span.set_status(trace.StatusCode.ERROR, str(e))
+            span.record_exception(e)
+            return ORJSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @app.get("/products/prices/{product_id}")
-def get_product_price(product_id: str):
+async def get_product_price(product_id: str, request: Request):
     with tracer.start_as_current_span("get_product_price") as span:
         span.set_attribute("product.action", "get_product_price")
         span.set_attribute("product.count", 1)
         
         try:
-            logger.info(f"Getting product price of {product_id}...")
-
-            with (
-                delay_injection(),
-                pymysql.connect(
-                    host=pymysql_settings.host,
-                    port=pymysql_settings.port,
-                    database=pymysql_settings.db,
-                    user=pymysql_settings.user,
-                    password=pymysql_settings.password,
-                ) as conn,
-                conn.cursor(cursor=DictCursor) as cur,
-            ):
-                cur.execute("SELECT * FROM product_price WHERE product_id = %s", (product_id,))
-                price = cur.fetchone()
+            logger.info("Getting product price of %s...", product_id)
+
+            db_pool: DatabasePool = request.app.state.db_pool
+            async with delay_injection():
+                price = await db_pool.fetchone(f"SELECT {PRICE_COLUMNS} FROM product_price WHERE product_id = %s", (product_id,))
             if price:
-                logger.info(f"Found product price of {product_id}")
-                return JSONResponse(content=ProductPrice(**price).model_dump(), status_code=status.HTTP_200_OK)
-            logger.info(f"Product price of {product_id} not found")
-            return JSONResponse(content={"message": "Product not found"}, status_code=status.HTTP_404_NOT_FOUND)
+                logger.info("Found product price of %s", product_id)
+                return ORJSONResponse(content=ProductPrice(**price).model_dump(), status_code=status.HTTP_200_OK)
+            logger.info("Product price of %s not found", product_id)
+            return ORJSONResponse(content={"message": "Product not found"}, status_code=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             logger.exception(str(e))
-            span.set_status(trace.StatusCode, "ERROR")
+            span.set_status(trace.StatusCode.ERROR, str(e))
             span.record_exception(e)
-            return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return ORJSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @app.get("/products/prices")
-def list_product_infos():
+async def list_product_infos(
+    request: Request,
+    limit: int = Query(pagination_settings.default_limit, ge=1),
+    cursor: str | None = None,
+):
     with tracer.start_as_current_span("list_product_prices") as span:
+        limit = min(limit, pagination_settings.max_limit)
         span.set_attribute("product.action", "list_product_prices")
 
         logger.info("Listing products infos...")
         try:
-            with (
-                delay_injection(),
-                pymysql.connect(
-                    host=pymysql_settings.host,
-                    port=pymysql_settings.port,
-                    database=pymysql_settings.db,
-                    user=pymysql_settings.user,
-                    password=pymysql_settings.password,
-                ) as conn,
-                conn.cursor(cursor=DictCursor) as cur,
-            ):
-                cur.execute("SELECT * FROM product_price")
-                prices = cur.fetchall()
-            if prices:
-                logger.info(f"Found {len(prices)} product prices")
-                return JSONResponse(content=[ProductPrice(**price).model_dump() for price in prices], status_code=status.HTTP_200_OK)
-            logger.info("No products found")
-            return JSONResponse(content={"message": "No products found"}, status_code=status.HTTP_404_NOT_FOUND)
+            after = decode_cursor(cursor)
+            db_pool: DatabasePool = request.app.state.db_pool
+
+            if accepts_ndjson(request):
+                #? The first page is read up front so failures still surface as a status code
+                async with delay_injection():
+                    prices, next_after = await fetch_page(db_pool, PRICE_COLUMNS, after, pagination_settings.max_limit)
+                logger.info("Streaming product prices...")
+                return StreamingResponse(stream_product_prices(db_pool, prices, next_after), media_type=NDJSON_MEDIA_TYPE)
+
+            async with delay_injection():
+                prices, next_after = await fetch_page(db_pool, PRICE_COLUMNS, after, limit)
+            span.set_attribute("product.count", len(prices))
+            logger.info("Found %s product prices", len(prices))
+            return ORJSONResponse(
+                content={
+                    "items": to_product_prices(prices),
+                    "next_cursor": encode_cursor(next_after) if next_after is not None else None,
+                },
+                status_code=status.HTTP_200_OK,
+            )
+        except InvalidCursorError as e:
+            return ORJSONResponse(content={"message": str(e)}, status_code=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.exception(str(e))
-            span.set_status(trace.StatusCode, "ERROR")
+            span.set_status(trace.StatusCode.ERROR, str(e))
             span.record_exception(e)
-            return JSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return ORJSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
+@app.post("/products/prices:batchGet")
+async def batch_get_product_prices(batch_request: ProductPriceBatchRequest, request: Request):
+    with tracer.start_as_current_span("batch_get_product_prices") as span:
+        product_ids = list(dict.fromkeys(batch_request.product_ids))
+        span.set_attribute("product.action", "batch_get_product_prices")
+        span.set_attribute("product.count", len(product_ids))
+
+        try:
+            logger.info("Batch getting %s product prices...", len(product_ids))
+
+            placeholders = ", ".join(["%s"] * len(product_ids))
+            db_pool: DatabasePool = request.app.state.db_pool
+            async with delay_injection():
+                prices = await db_pool.fetchall(f"SELECT {PRICE_COLUMNS} FROM product_price WHERE product_id IN ({placeholders})", product_ids)
+
+            found_product_ids = {price["product_id"] for price in prices}
+            missing_product_ids = [product_id for product_id in product_ids if product_id not in found_product_ids]
+            logger.info("Found %s product prices, %s missing", len(prices), len(missing_product_ids))
+            return ORJSONResponse(
+                content={
+                    "product_prices": to_product_prices(prices),
+                    "missing_product_ids": missing_product_ids,
+                },
+                status_code=status.HTTP_200_OK,
+            )
+        except Exception as e:
+            logger.exception(str(e))
+            span.set_status(trace.StatusCode.ERROR, str(e))
+            span.record_exception(e)
+            return ORJSONResponse(content={"message": str(e)}, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+#! Added first so it runs inside the RED metrics middleware, which then records the 504s it answers
+app.add_middleware(DeadlineMiddleware)
+#! Added before the instrumentation so RED metrics are recorded inside the server span, with its trace as exemplar
+app.add_middleware(REDMetricsMiddleware)
 #! We need to put it here as we can't add middleware after app is created
 setup_fastapi_instrumentation(app)
\ No newline at end of file
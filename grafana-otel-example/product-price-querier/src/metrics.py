@@ -0,0 +1,122 @@
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from opentelemetry import metrics
+from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, View
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+meter = metrics.get_meter(__name__)
+
+#? Seconds; fine below 100ms where most requests land, coarser up to the client timeouts
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+#? Label allow-lists: anything else recorded on these instruments (ids in particular) is dropped by the views
+REQUEST_ATTRIBUTES = {"http.route", "http.request.method", "http.response.status_code"}
+ERROR_ATTRIBUTES = {"http.route", "http.request.method", "error.type"}
+DB_ATTRIBUTES = {"db.system", "db.operation", "error.type"}
+
+_KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+#? Requests currently inside the middleware, only touched from the event loop thread
+_in_flight_requests = 0
+
+request_counter = meter.create_counter(
+    "app.requests", unit="{request}", description="Requests handled, per route and status code"
+)
+error_counter = meter.create_counter(
+    "app.errors", unit="{request}", description="Requests that failed with a 5xx status or an unhandled exception"
+)
+request_duration_histogram = meter.create_histogram(
+    "app.request.duration", unit="s", description="Time to handle a request, including streaming the response body"
+)
+db_duration_histogram = meter.create_histogram(
+    "db.client.operation.duration", unit="s", description="Duration of calls to the data store, per operation"
+)
+
+
+def get_in_flight_requests() -> int:
+    return _in_flight_requests
+
+
+def get_views() -> list[View]:
+    """Views registered on the `MeterProvider`, fixing bucket boundaries and the allowed labels."""
+    return [
+        View(
+            instrument_name="app.request.duration",
+            aggregation=ExplicitBucketHistogramAggregation(LATENCY_BUCKETS),
+            attribute_keys=REQUEST_ATTRIBUTES,
+        ),
+        View(instrument_name="app.requests", attribute_keys=REQUEST_ATTRIBUTES),
+        View(instrument_name="app.errors", attribute_keys=ERROR_ATTRIBUTES),
+        View(
+            instrument_name="db.client.operation.duration",
+            aggregation=ExplicitBucketHistogramAggregation(LATENCY_BUCKETS),
+            attribute_keys=DB_ATTRIBUTES,
+        ),
+    ]
+
+
+class REDMetricsMiddleware:
+    """
+    ASGI middleware recording rate, errors and duration for every request.
+
+    Requests are labelled with the matched route template, never the raw
+    path, so `/products/{product_id}` stays a single series. It must run
+    inside the FastAPI instrumentation's server span for exemplars to link
+    to the request's trace.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global _in_flight_requests
+        _in_flight_requests += 1
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        error_type: str | None = None
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as e:
+            error_type = type(e).__qualname__
+            raise
+        finally:
+            _in_flight_requests -= 1
+            #? The router stores the matched route in the scope; unmatched requests share one label
+            route = scope.get("route")
+            method = scope["method"] if scope["method"] in _KNOWN_METHODS else "_OTHER"
+            attributes = {
+                "http.route": getattr(route, "path", "unmatched"),
+                "http.request.method": method,
+                "http.response.status_code": status_code,
+            }
+            request_counter.add(1, attributes)
+            request_duration_histogram.record(time.perf_counter() - started_at, attributes)
+            if error_type is not None or status_code >= 500:
+                error_counter.add(1, {**attributes, "error.type": error_type or str(status_code)})
+
+
+@contextmanager
+def record_db_operation(system: str, operation: str) -> Iterator[None]:
+    """Record the duration of the wrapped data store call, labelled with the exception type if it fails."""
+    attributes = {"db.system": system, "db.operation": operation}
+    started_at = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        attributes["error.type"] = type(e).__qualname__
+        raise
+    finally:
+        db_duration_histogram.record(time.perf_counter() - started_at, attributes)
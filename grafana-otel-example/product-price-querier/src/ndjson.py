@@ -0,0 +1,12 @@
+import orjson
+from fastapi import Request
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def accepts_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_line(content: dict) -> bytes:
+    return orjson.dumps(content) + b"\n"
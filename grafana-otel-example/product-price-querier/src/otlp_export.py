@@ -0,0 +1,339 @@
+import importlib
+import threading
+import time
+from typing import Iterable, Sequence
+
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+from opentelemetry.exporter.otlp.proto.common._log_encoder import encode_logs
+from opentelemetry.exporter.otlp.proto.common.metrics_encoder import encode_metrics
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.exporter.otlp.proto.http import Compression
+from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
+from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk._logs import LogData
+from opentelemetry.sdk._logs.export import BatchLogRecordProcessor, LogExporter, LogExportResult
+from opentelemetry.sdk.metrics import (
+    Counter,
+    Histogram,
+    ObservableCounter,
+    ObservableGauge,
+    ObservableUpDownCounter,
+    UpDownCounter,
+)
+from opentelemetry.sdk.metrics.export import AggregationTemporality, MetricExporter, MetricExportResult, MetricsData
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+
+from config import BatchExportSettings, MetricExportSettings, OTLPExportSettings
+
+meter = metrics.get_meter(__name__)
+
+export_duration_histogram = meter.create_histogram(
+    "otel.exporter.duration", unit="s", description="Duration of OTLP export calls"
+)
+exported_items_counter = meter.create_counter(
+    "otel.exporter.items", unit="{item}", description="Spans, log records or metric points passed to the OTLP exporter"
+)
+dropped_items_counter = meter.create_counter(
+    "otel.processor.dropped", unit="{item}", description="Items dropped because the batch processor queue was full"
+)
+
+#? Queues whose depth is reported, keyed by signal
+_queues: dict[str, "_QueueTracker"] = {}
+
+#? Exporter class per signal and protocol, as (module, class name); the gRPC ones are imported only when selected
+_GRPC_EXPORTERS = {
+    "traces": ("opentelemetry.exporter.otlp.proto.grpc.trace_exporter", "OTLPSpanExporter"),
+    "logs": ("opentelemetry.exporter.otlp.proto.grpc._log_exporter", "OTLPLogExporter"),
+    "metrics": ("opentelemetry.exporter.otlp.proto.grpc.metric_exporter", "OTLPMetricExporter"),
+}
+_HTTP_EXPORTERS = {
+    "traces": OTLPSpanExporter,
+    "logs": OTLPLogExporter,
+    "metrics": OTLPMetricExporter,
+}
+
+
+def _observe_queue_sizes(options: CallbackOptions) -> Iterable[Observation]:
+    for signal, queue in _queues.items():
+        yield Observation(queue.size, {"signal": signal})
+
+
+meter.create_observable_gauge(
+    "otel.processor.queue_size",
+    callbacks=[_observe_queue_sizes],
+    unit="{item}",
+    description="Items waiting in the batch processor queue",
+)
+
+
+def _record_export(signal: str, items: int, started_at: float, success: bool) -> None:
+    attributes = {"signal": signal, "result": "success" if success else "failure"}
+    export_duration_histogram.record(time.perf_counter() - started_at, attributes)
+    exported_items_counter.add(items, attributes)
+
+
+def get_metric_temporality(settings: MetricExportSettings) -> dict[type, AggregationTemporality]:
+    """Temporality per instrument type, the same as the SDK's own "delta" preference when `settings.temporality` is "delta"."""
+    delta = AggregationTemporality.DELTA if settings.temporality == "delta" else AggregationTemporality.CUMULATIVE
+    return {
+        Counter: delta,
+        ObservableCounter: delta,
+        Histogram: delta,
+        UpDownCounter: AggregationTemporality.CUMULATIVE,
+        ObservableUpDownCounter: AggregationTemporality.CUMULATIVE,
+        ObservableGauge: AggregationTemporality.CUMULATIVE,
+    }
+
+
+def get_otlp_http_endpoint(signal: str, base_endpoint: str, settings: OTLPExportSettings) -> str:
+    """Endpoint of one signal over OTLP/HTTP, the per-signal one if set, else `<base_endpoint>/v1/<signal>`."""
+    return settings.endpoint or f"{base_endpoint}/v1/{signal}"
+
+
+def create_otlp_exporter(signal: str, base_endpoint: str, settings: OTLPExportSettings):
+    """
+    Build the OTLP exporter for one signal ("traces", "logs" or "metrics").
+
+    Over HTTP the endpoint defaults to `<base_endpoint>/v1/<signal>`; over gRPC
+    the base endpoint is used as is, so it must point at the collector's gRPC
+    port. The gRPC exporters are an optional dependency (the `grpc` extra).
+    """
+    timeout = settings.timeout_ms / 1000
+    #? Set explicitly so the wrappers around the exporter can be given the same temporality
+    options = {"preferred_temporality": get_metric_temporality(settings)} if signal == "metrics" else {}
+    if settings.protocol == "grpc":
+        module_name, class_name = _GRPC_EXPORTERS[signal]
+        try:
+            exporter_class = getattr(importlib.import_module(module_name), class_name)
+            import grpc
+        except ImportError as e:
+            raise ImportError(
+                "OTLP over gRPC needs opentelemetry-exporter-otlp-proto-grpc, install the 'grpc' extra"
+            ) from e
+        compression = grpc.Compression.Gzip if settings.compression == "gzip" else grpc.Compression.NoCompression
+        return exporter_class(
+            endpoint=settings.endpoint or base_endpoint, timeout=timeout, compression=compression, **options
+        )
+
+    compression = Compression.Gzip if settings.compression == "gzip" else Compression.NoCompression
+    return _HTTP_EXPORTERS[signal](
+        endpoint=get_otlp_http_endpoint(signal, base_endpoint, settings), timeout=timeout, compression=compression, **options
+    )
+
+
+def create_exporter(signal: str, base_endpoint: str, settings: OTLPExportSettings, mode: str):
+    """The OTLP exporter for one signal, or a local one that never leaves the process for the "none" and "memory" modes."""
+    if mode == "otlp":
+        return create_otlp_exporter(signal, base_endpoint, settings)
+    if signal == "metrics":
+        return LocalMetricExporter(encode=mode == "memory", preferred_temporality=get_metric_temporality(settings))
+    return _LOCAL_EXPORTERS[signal](encode=mode == "memory")
+
+
+class LocalSpanExporter(SpanExporter):
+    """Span exporter dropping spans, after encoding them to OTLP protobuf if `encode` is set; only the byte count is kept."""
+
+    def __init__(self, encode: bool) -> None:
+        self._encode = encode
+        self.encoded_bytes = 0
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        if self._encode:
+            self.encoded_bytes += encode_spans(spans).ByteSize()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+class LocalLogExporter(LogExporter):
+    """Log counterpart of `LocalSpanExporter`."""
+
+    def __init__(self, encode: bool) -> None:
+        self._encode = encode
+        self.encoded_bytes = 0
+
+    def export(self, batch: Sequence[LogData]) -> LogExportResult:
+        if self._encode:
+            self.encoded_bytes += encode_logs(batch).ByteSize()
+        return LogExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+class LocalMetricExporter(MetricExporter):
+    """Metric counterpart of `LocalSpanExporter`."""
+
+    def __init__(self, encode: bool, preferred_temporality: dict[type, AggregationTemporality] | None = None) -> None:
+        super().__init__(preferred_temporality=preferred_temporality)
+        self._encode = encode
+        self.encoded_bytes = 0
+
+    def export(self, metrics_data: MetricsData, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        if self._encode:
+            self.encoded_bytes += encode_metrics(metrics_data).ByteSize()
+        return MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return True
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        pass
+
+
+_LOCAL_EXPORTERS = {
+    "traces": LocalSpanExporter,
+    "logs": LocalLogExporter,
+}
+
+
+class _QueueTracker:
+    """
+    Depth of a batch processor's queue, counted from what enters it and what its exporter is handed.
+
+    The processors' queues are bounded deques that push out their oldest item
+    when full, so an item arriving at a full queue is counted as dropped. Only
+    the processors' public hooks are relied on, not their internals.
+    """
+
+    def __init__(self, signal: str, max_size: int) -> None:
+        self._signal = signal
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self.size = 0
+        _queues[signal] = self
+
+    def put(self) -> None:
+        with self._lock:
+            if self.size < self._max_size:
+                self.size += 1
+                return
+        dropped_items_counter.add(1, {"signal": self._signal})
+
+    def take(self, count: int) -> None:
+        with self._lock:
+            self.size = max(0, self.size - count)
+
+
+class InstrumentedSpanExporter(SpanExporter):
+    """Span exporter wrapper recording export latency and exported span counts."""
+
+    def __init__(self, delegate: SpanExporter, queue: _QueueTracker | None = None) -> None:
+        self._delegate = delegate
+        self._queue = queue
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        if self._queue is not None:
+            self._queue.take(len(spans))
+        started_at = time.perf_counter()
+        result = self._delegate.export(spans)
+        _record_export("traces", len(spans), started_at, result is SpanExportResult.SUCCESS)
+        return result
+
+    def shutdown(self) -> None:
+        self._delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._delegate.force_flush(timeout_millis)
+
+
+class InstrumentedLogExporter(LogExporter):
+    """Log exporter wrapper recording export latency and exported record counts."""
+
+    def __init__(self, delegate: LogExporter, queue: _QueueTracker | None = None) -> None:
+        self._delegate = delegate
+        self._queue = queue
+
+    def export(self, batch: Sequence[LogData]) -> LogExportResult:
+        if self._queue is not None:
+            self._queue.take(len(batch))
+        started_at = time.perf_counter()
+        result = self._delegate.export(batch)
+        _record_export("logs", len(batch), started_at, result is LogExportResult.SUCCESS)
+        return result
+
+    def shutdown(self) -> None:
+        self._delegate.shutdown()
+
+
+class InstrumentedMetricExporter(MetricExporter):
+    """Metric exporter wrapper recording export latency and exported data point counts."""
+
+    def __init__(self, delegate: MetricExporter, settings: MetricExportSettings) -> None:
+        #? The reader collects with the wrapper's temporality, which the delegate was created with too
+        super().__init__(preferred_temporality=get_metric_temporality(settings))
+        self._delegate = delegate
+
+    def export(self, metrics_data: MetricsData, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        started_at = time.perf_counter()
+        result = self._delegate.export(metrics_data, timeout_millis=timeout_millis, **kwargs)
+        points = sum(
+            len(metric.data.data_points)
+            for resource_metrics in metrics_data.resource_metrics
+            for scope_metrics in resource_metrics.scope_metrics
+            for metric in scope_metrics.metrics
+        )
+        _record_export("metrics", points, started_at, result is MetricExportResult.SUCCESS)
+        return result
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return self._delegate.force_flush(timeout_millis)
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        self._delegate.shutdown(timeout_millis=timeout_millis, **kwargs)
+
+
+class InstrumentedBatchSpanProcessor(BatchSpanProcessor):
+    """`BatchSpanProcessor` that counts spans lost to a full queue and reports its queue depth."""
+
+    def __init__(self, exporter: SpanExporter, settings: BatchExportSettings) -> None:
+        self._tracked_queue = _QueueTracker("traces", settings.max_queue_size)
+        self._is_shut_down = False
+        super().__init__(
+            InstrumentedSpanExporter(exporter, self._tracked_queue),
+            max_queue_size=settings.max_queue_size,
+            schedule_delay_millis=settings.schedule_delay_ms,
+            max_export_batch_size=settings.max_export_batch_size,
+            export_timeout_millis=settings.export_timeout_ms,
+        )
+
+    def on_end(self, span: ReadableSpan) -> None:
+        #? Counted before handing it over, so the worker can never take a span not yet counted; unsampled spans are never queued
+        if not self._is_shut_down and span.context.trace_flags.sampled:
+            self._tracked_queue.put()
+        super().on_end(span)
+
+    def shutdown(self) -> None:
+        self._is_shut_down = True
+        super().shutdown()
+
+
+class InstrumentedBatchLogRecordProcessor(BatchLogRecordProcessor):
+    """`BatchLogRecordProcessor` that counts records lost to a full queue and reports its queue depth."""
+
+    def __init__(self, exporter: LogExporter, settings: BatchExportSettings) -> None:
+        self._tracked_queue = _QueueTracker("logs", settings.max_queue_size)
+        self._is_shut_down = False
+        super().__init__(
+            InstrumentedLogExporter(exporter, self._tracked_queue),
+            max_queue_size=settings.max_queue_size,
+            schedule_delay_millis=settings.schedule_delay_ms,
+            max_export_batch_size=settings.max_export_batch_size,
+            export_timeout_millis=settings.export_timeout_ms,
+        )
+
+    def emit(self, log_data: LogData) -> None:
+        if not self._is_shut_down:
+            self._tracked_queue.put()
+        super().emit(log_data)
+
+    def shutdown(self) -> None:
+        self._is_shut_down = True
+        super().shutdown()
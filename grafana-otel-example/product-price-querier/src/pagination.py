@@ -0,0 +1,24 @@
+import base64
+import json
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(after: str) -> str:
+    """Opaque keyset cursor pointing just past the given product id."""
+    return base64.urlsafe_b64encode(json.dumps({"after": after}).encode()).decode()
+
+
+def decode_cursor(cursor: str | None) -> str | None:
+    if cursor is None:
+        return None
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode()))["after"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursorError("Invalid pagination cursor") from e
+    #? Ids are compared with the cursor, any other JSON value would fail there instead of as a bad request
+    if not isinstance(after, str):
+        raise InvalidCursorError("Invalid pagination cursor")
+    return after
@@ -0,0 +1,183 @@
+import asyncio
+import gc
+import logging
+import os
+import threading
+import time
+from typing import Any, Iterable
+
+import anyio.to_thread
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+from config import RuntimeMetricsSettings
+from metrics import get_in_flight_requests
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+#? The running probe, cancelled by `shutdown_runtime_metrics` before the event loop closes
+_probe: "_EventLoopProbe | None" = None
+
+
+class _EventLoopProbe:
+    """
+    Task waking up every `interval` on the event loop, measuring how late it runs.
+
+    The AnyIO thread limiter is sampled from the same task, since its state
+    belongs to the event loop thread and must not be read from the metric
+    reader's thread. Collections report the peaks seen since the previous one.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self._interval = interval
+        self._limiter = anyio.to_thread.current_default_thread_limiter()
+        self._lock = threading.Lock()
+        self._due_at: float | None = None
+        self._max_lag = 0.0
+        self._max_borrowed = 0
+        self._max_waiting = 0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="event-loop-probe")
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        with self._lock:
+            #? A stopped probe is not overdue
+            self._due_at = None
+
+    async def _run(self) -> None:
+        while True:
+            self._due_at = time.perf_counter() + self._interval
+            await asyncio.sleep(self._interval)
+            lag = max(0.0, time.perf_counter() - self._due_at)
+            statistics = self._limiter.statistics()
+            with self._lock:
+                self._due_at = None
+                self._max_lag = max(self._max_lag, lag)
+                self._max_borrowed = max(self._max_borrowed, statistics.borrowed_tokens)
+                self._max_waiting = max(self._max_waiting, statistics.tasks_waiting)
+
+    def observe_lag(self, options: CallbackOptions) -> Iterable[Observation]:
+        with self._lock:
+            lag, self._max_lag = self._max_lag, 0.0
+            #? A loop blocked right now has not woken the probe yet, report how overdue it already is
+            if self._due_at is not None:
+                lag = max(lag, time.perf_counter() - self._due_at)
+        yield Observation(lag)
+
+    def observe_limiter(self, options: CallbackOptions) -> Iterable[Observation]:
+        with self._lock:
+            borrowed, self._max_borrowed = self._max_borrowed, 0
+            waiting, self._max_waiting = self._max_waiting, 0
+        yield Observation(borrowed, {"state": "borrowed"})
+        yield Observation(waiting, {"state": "waiting"})
+        yield Observation(self._limiter.total_tokens, {"state": "limit"})
+
+
+class _GCStats:
+    """`gc.callbacks` hook counting collections and the time spent in them, per generation."""
+
+    def __init__(self) -> None:
+        self.collections = [0, 0, 0]
+        self.pause_time = [0.0, 0.0, 0.0]
+        self._started_at = 0.0
+
+    def __call__(self, phase: str, info: dict[str, Any]) -> None:
+        if phase == "start":
+            self._started_at = time.perf_counter()
+            return
+        generation = info["generation"]
+        self.collections[generation] += 1
+        self.pause_time[generation] += time.perf_counter() - self._started_at
+
+    def observe_collections(self, options: CallbackOptions) -> Iterable[Observation]:
+        for generation, count in enumerate(self.collections):
+            yield Observation(count, {"generation": generation})
+
+    def observe_pause_time(self, options: CallbackOptions) -> Iterable[Observation]:
+        for generation, pause_time in enumerate(self.pause_time):
+            yield Observation(pause_time, {"generation": generation})
+
+
+def _observe_in_flight_requests(options: CallbackOptions) -> Iterable[Observation]:
+    yield Observation(get_in_flight_requests())
+
+
+def _observe_rss(options: CallbackOptions) -> Iterable[Observation]:
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            resident_pages = int(f.read().split()[1])
+    except OSError:
+        return
+    yield Observation(resident_pages * _PAGE_SIZE)
+
+
+def setup_runtime_metrics(settings: RuntimeMetricsSettings) -> None:
+    """
+    Register saturation metrics for this process: event loop lag, AnyIO thread
+    limiter usage, in-flight requests, GC collections and pauses, and RSS.
+
+    Must be called from the running event loop (the app lifespan), whose
+    default thread limiter is the one serving `run_in_threadpool`.
+    """
+    global _probe
+    if not settings.enabled:
+        return
+
+    gc_stats = _GCStats()
+    gc.callbacks.append(gc_stats)
+    meter.create_observable_counter(
+        "runtime.gc.collections",
+        callbacks=[gc_stats.observe_collections],
+        unit="{collection}",
+        description="Garbage collections, per generation",
+    )
+    meter.create_observable_counter(
+        "runtime.gc.pause_time",
+        callbacks=[gc_stats.observe_pause_time],
+        unit="s",
+        description="Time spent in garbage collections, during which every thread is stopped",
+    )
+    meter.create_observable_gauge(
+        "runtime.requests.in_flight",
+        callbacks=[_observe_in_flight_requests],
+        unit="{request}",
+        description="Requests being handled by this process",
+    )
+    meter.create_observable_gauge(
+        "process.memory.usage", callbacks=[_observe_rss], unit="By", description="Resident set size of the process"
+    )
+
+    try:
+        probe = _EventLoopProbe(settings.loop_lag_interval)
+        probe.start()
+    except RuntimeError:
+        logger.warning("No running event loop, event loop and thread limiter metrics are disabled")
+        return
+    _probe = probe
+    meter.create_observable_gauge(
+        "runtime.event_loop.lag",
+        callbacks=[probe.observe_lag],
+        unit="s",
+        description="Longest delay of the event loop in running a ready callback since the last collection",
+    )
+    meter.create_observable_gauge(
+        "runtime.thread_limiter.tokens",
+        callbacks=[probe.observe_limiter],
+        unit="{thread}",
+        description="Peak AnyIO worker threads borrowed and tasks waiting for one since the last collection, and the limit",
+    )
+
+
+async def shutdown_runtime_metrics() -> None:
+    """Stop the event loop probe, called from the app lifespan on shutdown."""
+    global _probe
+    if _probe is not None:
+        await _probe.close()
+        _probe = None
@@ -0,0 +1,109 @@
+import threading
+import time
+from typing import Optional, Sequence
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace.sampling import (
+    Decision,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from opentelemetry.semconv.trace import SpanAttributes
+from opentelemetry.trace import Link, SpanKind
+from opentelemetry.trace.span import TraceState
+from opentelemetry.util.types import Attributes
+
+
+class RouteRatioSampler(Sampler):
+    """
+    Trace-id ratio sampler with per-route overrides.
+
+    The route is taken from the `http.route` attribute the FastAPI
+    instrumentation sets on server spans, so overrides are keyed on route
+    templates such as `/products/{product_id}`. Spans without a route fall
+    back to matching on their name, then to the default ratio.
+    """
+
+    def __init__(self, default_ratio: float, route_ratios: dict[str, float]) -> None:
+        self._default = TraceIdRatioBased(default_ratio)
+        self._routes = {route: TraceIdRatioBased(ratio) for route, ratio in route_ratios.items()}
+
+    def should_sample(
+        self,
+        parent_context: Optional[Context],
+        trace_id: int,
+        name: str,
+        kind: Optional[SpanKind] = None,
+        attributes: Attributes = None,
+        links: Optional[Sequence[Link]] = None,
+        trace_state: Optional[TraceState] = None,
+    ) -> SamplingResult:
+        route = attributes.get(SpanAttributes.HTTP_ROUTE) if attributes else None
+        sampler = self._routes.get(route) or self._routes.get(name) or self._default
+        return sampler.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+
+    def get_description(self) -> str:
+        routes = ",".join(f"{route}={sampler.rate}" for route, sampler in self._routes.items())
+        return f"RouteRatioSampler{{default={self._default.rate},routes={{{routes}}}}}"
+
+
+class RateLimitingSampler(Sampler):
+    """
+    Caps the number of traces the delegate may start per second.
+
+    A token bucket refilled at `max_per_second` (bursting up to one second's
+    worth) is checked only for spans the delegate wants to sample, so the
+    ratio decision still applies below the cap.
+    """
+
+    def __init__(self, delegate: Sampler, max_per_second: float) -> None:
+        self._delegate = delegate
+        self._max_per_second = max_per_second
+        self._capacity = max(max_per_second, 1.0)
+        self._tokens = self._capacity
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def should_sample(
+        self,
+        parent_context: Optional[Context],
+        trace_id: int,
+        name: str,
+        kind: Optional[SpanKind] = None,
+        attributes: Attributes = None,
+        links: Optional[Sequence[Link]] = None,
+        trace_state: Optional[TraceState] = None,
+    ) -> SamplingResult:
+        result = self._delegate.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+        if result.decision is Decision.RECORD_AND_SAMPLE and not self._take_token():
+            return SamplingResult(Decision.DROP, trace_state=result.trace_state)
+        return result
+
+    def get_description(self) -> str:
+        return f"RateLimitingSampler{{{self._max_per_second}/s,{self._delegate.get_description()}}}"
+
+    def _take_token(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._refilled_at) * self._max_per_second)
+            self._refilled_at = now
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+def create_sampler(ratio: float, route_ratios: dict[str, float], max_traces_per_second: float) -> Sampler:
+    """
+    Build the trace sampler used by `setup_otel`.
+
+    Root spans are sampled by route ratio, then rate limited when a cap is set.
+    Spans with a parent follow the parent's decision, so a trace sampled (or
+    dropped) by api-gateway is sampled (or dropped) by the queriers as well.
+    """
+    root: Sampler = RouteRatioSampler(ratio, route_ratios)
+    if max_traces_per_second > 0:
+        root = RateLimitingSampler(root, max_traces_per_second)
+    return ParentBased(root)
@@ -0,0 +1,403 @@
+import fcntl
+import gzip
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+from pathlib import Path
+from typing import Callable, Iterable, Sequence
+
+import requests
+from opentelemetry import metrics
+from opentelemetry.exporter.otlp.proto.common._log_encoder import encode_logs
+from opentelemetry.exporter.otlp.proto.common.metrics_encoder import encode_metrics
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.metrics import CallbackOptions, Observation
+from opentelemetry.sdk._logs import LogData
+from opentelemetry.sdk._logs.export import LogExporter, LogExportResult
+from opentelemetry.sdk.metrics.export import AggregationTemporality, MetricExporter, MetricExportResult, MetricsData
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.util.re import parse_env_headers
+
+from config import OTLPExportSettings, SpoolSettings
+from otlp_export import get_otlp_http_endpoint
+
+logger = logging.getLogger(__name__)
+meter = metrics.get_meter(__name__)
+
+replayed_counter = meter.create_counter(
+    "otel.spool.replayed", unit="{request}", description="Spooled export requests delivered to the collector"
+)
+evicted_counter = meter.create_counter(
+    "otel.spool.evicted", unit="{request}", description="Spooled export requests discarded to stay within the size cap"
+)
+rejected_counter = meter.create_counter(
+    "otel.spool.rejected", unit="{request}", description="Spooled export requests the collector refused as invalid"
+)
+
+#? Record header: payload length and CRC32 of the payload; a zero length marks the end of a segment
+_HEADER = struct.Struct("<II")
+_SEGMENT_SUFFIX = ".seg"
+_CURSOR_FILE = "cursor"
+_LOCK_FILE = "lock"
+
+#? Spool logs whose size is reported, keyed by signal
+_logs: dict[str, "SegmentLog"] = {}
+
+
+def _observe_spool_sizes(options: CallbackOptions) -> Iterable[Observation]:
+    for signal, log in _logs.items():
+        yield Observation(log.size, {"signal": signal})
+
+
+meter.create_observable_gauge(
+    "otel.spool.size", callbacks=[_observe_spool_sizes], unit="By", description="Bytes held in spool segments on disk"
+)
+
+
+class _Segment:
+    def __init__(self, path: Path, size: int) -> None:
+        self.path = path
+        self.seq = int(path.stem)
+        with open(path, "a+b") as f:
+            if os.fstat(f.fileno()).st_size < size:
+                f.truncate(size)
+            self.mmap = mmap.mmap(f.fileno(), 0)
+        self.write_offset = self._find_end()
+
+    @property
+    def capacity(self) -> int:
+        return len(self.mmap)
+
+    def read(self, offset: int) -> bytes | None:
+        """Return the record at `offset`, or None past the last complete record."""
+        if offset + _HEADER.size > self.write_offset:
+            return None
+        length, _ = _HEADER.unpack_from(self.mmap, offset)
+        return bytes(self.mmap[offset + _HEADER.size:offset + _HEADER.size + length])
+
+    def append(self, payload: bytes) -> None:
+        _HEADER.pack_into(self.mmap, self.write_offset, len(payload), zlib.crc32(payload))
+        start = self.write_offset + _HEADER.size
+        self.mmap[start:start + len(payload)] = payload
+        self.write_offset = start + len(payload)
+
+    def close(self) -> None:
+        self.mmap.flush()
+        self.mmap.close()
+
+    def _find_end(self) -> int:
+        #? Scan for the first empty or torn record, which is where the previous process stopped writing
+        offset = 0
+        while offset + _HEADER.size <= len(self.mmap):
+            length, crc = _HEADER.unpack_from(self.mmap, offset)
+            end = offset + _HEADER.size + length
+            if length == 0 or end > len(self.mmap) or zlib.crc32(self.mmap[offset + _HEADER.size:end]) != crc:
+                break
+            offset = end
+        return offset
+
+
+class SegmentLog:
+    """
+    Bounded, append-only log of export requests, stored as memory-mapped segment files.
+
+    Records are appended to the newest segment and read back in order from a
+    cursor persisted next to the segments, so a restarted process resumes
+    where the last one stopped. Fully read segments are deleted. When the log
+    would outgrow `max_size`, the oldest segments are evicted first, whether
+    they were replayed or not. Segment pages live in the page cache rather
+    than on the heap, so an outage grows disk usage, not process memory.
+    """
+
+    def __init__(self, directory: Path, segment_size: int, max_size: int) -> None:
+        self._directory = directory
+        self._segment_size = segment_size
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        directory.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(directory / _LOCK_FILE, "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError as e:
+            self._lock_file.close()
+            raise RuntimeError(f"Spool directory {directory} is already used by another process") from e
+        self._segments: deque[_Segment] = deque(
+            _Segment(path, segment_size) for path in sorted(directory.glob(f"*{_SEGMENT_SUFFIX}"))
+        )
+        if not self._segments:
+            self._segments.append(self._new_segment(0, segment_size))
+        self._read_seq, self._read_offset = self._load_cursor()
+        self._peeked: tuple[int, int, int] | None = None
+
+    @property
+    def size(self) -> int:
+        return sum(segment.capacity for segment in self._segments)
+
+    def append(self, payload: bytes) -> int:
+        """Append one record, returning the number of unread records evicted to make room."""
+        needed = _HEADER.size + len(payload)
+        evicted = 0
+        with self._lock:
+            tail = self._segments[-1]
+            if tail.write_offset + needed > tail.capacity:
+                #? Oversized records get a segment of their own
+                new_segment = self._new_segment(tail.seq + 1, max(self._segment_size, needed + _HEADER.size))
+                self._segments.append(new_segment)
+                tail = new_segment
+            while self.size > self._max_size and len(self._segments) > 1:
+                evicted += self._evict_oldest()
+            tail.append(payload)
+        return evicted
+
+    def peek(self) -> bytes | None:
+        """Return the oldest unread record without consuming it."""
+        with self._lock:
+            while True:
+                head = self._segments[0]
+                payload = head.read(self._read_offset)
+                if payload is not None:
+                    self._peeked = (self._read_seq, self._read_offset, len(payload))
+                    return payload
+                if len(self._segments) == 1:
+                    return None
+                self._drop_head()
+
+    def ack(self) -> None:
+        """Consume the record returned by the last `peek`, unless it was evicted in the meantime."""
+        with self._lock:
+            if self._peeked is None:
+                return
+            seq, offset, length = self._peeked
+            self._peeked = None
+            if (seq, offset) == (self._read_seq, self._read_offset):
+                self._read_offset += _HEADER.size + length
+                self._save_cursor()
+
+    def close(self) -> None:
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+        self._lock_file.close()
+
+    def _new_segment(self, seq: int, size: int) -> _Segment:
+        return _Segment(self._directory / f"{seq:020d}{_SEGMENT_SUFFIX}", size)
+
+    def _drop_head(self) -> None:
+        head = self._segments.popleft()
+        head.close()
+        head.path.unlink(missing_ok=True)
+        self._read_seq, self._read_offset = self._segments[0].seq, 0
+        self._save_cursor()
+
+    def _evict_oldest(self) -> int:
+        head = self._segments[0]
+        evicted, offset = 0, self._read_offset
+        while (payload := head.read(offset)) is not None:
+            evicted += 1
+            offset += _HEADER.size + len(payload)
+        self._drop_head()
+        return evicted
+
+    def _load_cursor(self) -> tuple[int, int]:
+        head = self._segments[0]
+        try:
+            seq, offset = map(int, (self._directory / _CURSOR_FILE).read_text().split())
+        except (FileNotFoundError, ValueError):
+            return head.seq, 0
+        if seq != head.seq or offset > head.write_offset:
+            return head.seq, 0
+        return seq, offset
+
+    def _save_cursor(self) -> None:
+        cursor_path = self._directory / _CURSOR_FILE
+        tmp_path = cursor_path.with_suffix(".tmp")
+        tmp_path.write_text(f"{self._read_seq} {self._read_offset}")
+        os.replace(tmp_path, cursor_path)
+
+
+class OTLPHTTPSender:
+    """
+    Posts already-serialized export requests of one signal to its OTLP/HTTP endpoint.
+
+    Requests go out as the SDK's OTLP/HTTP exporter would send them: to the
+    same endpoint, gzipped if compression is on, with its timeout and the
+    headers of OTEL_EXPORTER_OTLP_<SIGNAL>_HEADERS or OTEL_EXPORTER_OTLP_HEADERS.
+    """
+
+    def __init__(self, signal: str, base_endpoint: str, settings: OTLPExportSettings) -> None:
+        if settings.protocol != "http/protobuf":
+            raise ValueError(f"The {signal} spool replays over OTLP/HTTP, its export protocol must be http/protobuf")
+        self.endpoint = get_otlp_http_endpoint(signal, base_endpoint, settings)
+        self._compress = settings.compression == "gzip"
+        self._timeout = settings.timeout_ms / 1000
+        headers = os.environ.get(f"OTEL_EXPORTER_OTLP_{signal.upper()}_HEADERS", os.environ.get("OTEL_EXPORTER_OTLP_HEADERS", ""))
+        self._session = requests.Session()
+        self._session.headers.update(parse_env_headers(headers, liberal=True))
+        self._session.headers["Content-Type"] = "application/x-protobuf"
+        if self._compress:
+            self._session.headers["Content-Encoding"] = "gzip"
+
+    def __call__(self, payload: bytes) -> requests.Response:
+        data = gzip.compress(payload) if self._compress else payload
+        return self._session.post(self.endpoint, data=data, timeout=self._timeout)
+
+    def close(self) -> None:
+        self._session.close()
+
+
+class SpoolReplayer:
+    """
+    Background thread sending spooled export requests to the collector, oldest first.
+
+    A request that fails with a connection error or a retryable status stays
+    at the head of the log and is retried with exponential backoff, which
+    keeps delivery in order. Requests rejected as invalid are dropped so they
+    cannot block the ones behind them.
+    """
+
+    def __init__(
+        self, signal: str, log: SegmentLog, send: Callable[[bytes], requests.Response], settings: SpoolSettings
+    ) -> None:
+        self._signal = signal
+        self._log = log
+        self._send = send
+        self._settings = settings
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=f"OtelSpoolReplayer-{signal}", daemon=True)
+        self._thread.start()
+
+    def notify(self) -> None:
+        with self._condition:
+            self._condition.notify()
+
+    def shutdown(self, timeout: float | None = None) -> None:
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        backoff = self._settings.retry_initial_backoff
+        while not self._stopping:
+            payload = self._log.peek()
+            if payload is None:
+                with self._condition:
+                    if not self._stopping:
+                        self._condition.wait(self._settings.retry_max_backoff)
+                continue
+
+            try:
+                resp = self._send(payload)
+            except requests.RequestException as e:
+                logger.debug("Spooled %s export failed, retrying in %ss: %s", self._signal, backoff, e)
+            else:
+                if resp.ok or not (resp.status_code in (408, 429) or resp.status_code >= 500):
+                    if resp.ok:
+                        replayed_counter.add(1, {"signal": self._signal})
+                    else:
+                        rejected_counter.add(1, {"signal": self._signal})
+                    self._log.ack()
+                    backoff = self._settings.retry_initial_backoff
+                    continue
+                logger.debug("Spooled %s export got %s, retrying in %ss", self._signal, resp.status_code, backoff)
+
+            with self._condition:
+                if not self._stopping:
+                    self._condition.wait(backoff)
+            backoff = min(backoff * 2, self._settings.retry_max_backoff)
+
+
+class _Spool:
+    """Shared plumbing of the spooling exporters: a segment log plus its replayer."""
+
+    def __init__(self, signal: str, send: OTLPHTTPSender, directory: Path, settings: SpoolSettings) -> None:
+        self.signal = signal
+        self.send = send
+        self.log = SegmentLog(directory, settings.segment_size_bytes, settings.max_size_bytes)
+        self.replayer = SpoolReplayer(signal, self.log, send, settings)
+        _logs[signal] = self.log
+
+    def write(self, payload: bytes) -> bool:
+        try:
+            evicted = self.log.append(payload)
+        except OSError as e:
+            logger.warning("Could not spool %s export: %s", self.signal, e)
+            return False
+        if evicted:
+            evicted_counter.add(evicted, {"signal": self.signal})
+        self.replayer.notify()
+        return True
+
+    def shutdown(self) -> None:
+        #? Whatever is still spooled is replayed by the next process
+        _logs.pop(self.signal, None)
+        self.replayer.shutdown(timeout=1.0)
+        self.log.close()
+        self.send.close()
+
+
+class SpoolingSpanExporter(SpanExporter):
+    """
+    Span exporter writing batches to a disk spool, replayed to the collector by `send`.
+
+    Used in place of the OTLP/HTTP exporter: batches are encoded exactly as it
+    would send them, so the batch processor never waits on the collector.
+    """
+
+    def __init__(self, directory: Path, settings: SpoolSettings, send: OTLPHTTPSender) -> None:
+        self._spool = _Spool("traces", send, directory, settings)
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        ok = self._spool.write(encode_spans(spans).SerializePartialToString())
+        return SpanExportResult.SUCCESS if ok else SpanExportResult.FAILURE
+
+    def shutdown(self) -> None:
+        self._spool.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+class SpoolingLogExporter(LogExporter):
+    """Log record counterpart of `SpoolingSpanExporter`."""
+
+    def __init__(self, directory: Path, settings: SpoolSettings, send: OTLPHTTPSender) -> None:
+        self._spool = _Spool("logs", send, directory, settings)
+
+    def export(self, batch: Sequence[LogData]) -> LogExportResult:
+        ok = self._spool.write(encode_logs(batch).SerializeToString())
+        return LogExportResult.SUCCESS if ok else LogExportResult.FAILURE
+
+    def shutdown(self) -> None:
+        self._spool.shutdown()
+
+
+class SpoolingMetricExporter(MetricExporter):
+    """Metric counterpart of `SpoolingSpanExporter`."""
+
+    def __init__(
+        self,
+        directory: Path,
+        settings: SpoolSettings,
+        send: OTLPHTTPSender,
+        preferred_temporality: dict[type, AggregationTemporality] | None = None,
+    ) -> None:
+        #? The temporality configured for metric exports, see get_metric_temporality
+        super().__init__(preferred_temporality=preferred_temporality)
+        self._spool = _Spool("metrics", send, directory, settings)
+
+    def export(self, metrics_data: MetricsData, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        ok = self._spool.write(encode_metrics(metrics_data).SerializeToString())
+        return MetricExportResult.SUCCESS if ok else MetricExportResult.FAILURE
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return True
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        self._spool.shutdown()
@@ -0,0 +1,35 @@
+import fcntl
+import tempfile
+from pathlib import Path
+from typing import IO
+
+#? Kept open for the life of the process; the OS releases the lock when the worker exits
+_slot_lock: IO | None = None
+_slot: int | None = None
+
+
+def claim_worker_slot(name: str, workers: int) -> int | None:
+    """
+    Claim the lowest free slot in `range(workers)` for this worker process.
+
+    Slots are locked files shared by the workers of one container, so a worker
+    restarted by the server takes over the slot of the one it replaces, along
+    with its instance id and on-disk state (spool, profiles). Returns None if
+    every slot is held.
+    """
+    global _slot_lock, _slot
+    if _slot_lock is not None:
+        return _slot
+
+    directory = Path(tempfile.gettempdir()) / f"{name}-workers"
+    directory.mkdir(parents=True, exist_ok=True)
+    for slot in range(workers):
+        lock_file = open(directory / f"{slot}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            continue
+        _slot_lock, _slot = lock_file, slot
+        return slot
+    return None
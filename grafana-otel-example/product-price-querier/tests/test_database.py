@@ -0,0 +1,96 @@
+import asyncio
+
+from config import PymysqlSettings
+from database import AiomysqlPool
+
+
+class StubCursor:
+    def __init__(self, conn: "StubConnection") -> None:
+        self._conn = conn
+
+    async def __aenter__(self) -> "StubCursor":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+    async def execute(self, query: str, args=None) -> None:
+        self._conn.executing.set()
+        await self._conn.replies.wait()
+
+    async def fetchone(self) -> dict:
+        return {"connection": self._conn.number}
+
+
+class StubConnection:
+    def __init__(self, number: int) -> None:
+        self.number = number
+        self.closed = False
+        self.executing = asyncio.Event()
+        self.replies = asyncio.Event()
+
+    def cursor(self, cursor_class) -> StubCursor:
+        return StubCursor(self)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class StubPool:
+    """Hands out idle connections first and, like aiomysql's pool, drops closed ones on release."""
+
+    def __init__(self) -> None:
+        self.idle: list[StubConnection] = []
+        self.opened: list[StubConnection] = []
+
+    async def acquire(self) -> StubConnection:
+        if self.idle:
+            return self.idle.pop()
+        conn = StubConnection(len(self.opened) + 1)
+        self.opened.append(conn)
+        return conn
+
+    def release(self, conn: StubConnection) -> None:
+        if not conn.closed:
+            self.idle.append(conn)
+
+
+def create_pool() -> tuple[AiomysqlPool, StubPool]:
+    settings = PymysqlSettings(
+        host="mysql", port=3306, db="products", user="user", password="password", pool_health_check_interval=-1
+    )
+    pool = AiomysqlPool(settings)
+    stub = StubPool()
+    pool._pool = stub
+    return pool, stub
+
+
+def test_cancelled_query_closes_its_connection():
+    async def run() -> None:
+        pool, stub = create_pool()
+        query = asyncio.create_task(pool.fetchone("SELECT 1"))
+        while not stub.opened:
+            await asyncio.sleep(0)
+        conn = stub.opened[0]
+        await conn.executing.wait()
+        query.cancel()
+        await asyncio.gather(query, return_exceptions=True)
+
+        # Its result was never read, so the connection is closed rather than handed to the next query
+        assert query.cancelled()
+        assert conn.closed
+        assert stub.idle == []
+
+    asyncio.run(run())
+
+
+def test_completed_query_returns_its_connection_to_the_pool():
+    async def run() -> None:
+        pool, stub = create_pool()
+        conn = StubConnection(1)
+        conn.replies.set()
+        stub.idle.append(conn)
+        assert await pool.fetchone("SELECT 1") == {"connection": 1}
+        assert stub.idle == [conn]
+
+    asyncio.run(run())
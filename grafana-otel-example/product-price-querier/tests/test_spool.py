@@ -0,0 +1,119 @@
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import ExportTraceServiceRequest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExportResult
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from config import BatchExportSettings, SpoolSettings
+from spool import OTLPHTTPSender, SegmentLog, SpoolReplayer, SpoolingSpanExporter
+
+SEGMENT_SIZE = 64
+SETTINGS = SpoolSettings(retry_initial_backoff=0.01, retry_max_backoff=0.05)
+
+
+class Collector:
+    """OTLP/HTTP receiver standing in for the collector, recording the path, headers and payload of every export."""
+
+    def __init__(self) -> None:
+        self.exports: list[tuple[str, dict[str, str], bytes]] = []
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                payload = gzip.decompress(body) if self.headers.get("Content-Encoding") == "gzip" else body
+                collector.exports.append((self.path, dict(self.headers), payload))
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def payloads(self) -> list[bytes]:
+        return [payload for _, _, payload in self.exports]
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_restarted_spool_replays_unacked_records_in_order(tmp_path):
+    # A first process spools three requests and dies after delivering only the first
+    log = SegmentLog(tmp_path, SEGMENT_SIZE * 16, SEGMENT_SIZE * 64)
+    for payload in (b"first", b"second", b"third"):
+        log.append(payload)
+    assert log.peek() == b"first"
+    log.ack()
+    log.close()
+
+    collector = Collector()
+    send = OTLPHTTPSender("traces", collector.endpoint, BatchExportSettings())
+    log = SegmentLog(tmp_path, SEGMENT_SIZE * 16, SEGMENT_SIZE * 64)
+    replayer = SpoolReplayer("traces", log, send, SETTINGS)
+    wait_for(lambda: len(collector.payloads) == 2)
+    replayer.shutdown(timeout=1.0)
+    log.close()
+    collector.close()
+
+    assert collector.payloads == [b"second", b"third"]
+
+    # The cursor moved past everything delivered, a third process has nothing to replay
+    log = SegmentLog(tmp_path, SEGMENT_SIZE * 16, SEGMENT_SIZE * 64)
+    assert log.peek() is None
+    log.close()
+
+
+def test_oldest_segments_are_evicted_past_max_size(tmp_path):
+    # Each record fills a segment of its own, the cap leaves room for two of them
+    log = SegmentLog(tmp_path, SEGMENT_SIZE, SEGMENT_SIZE * 2)
+    payloads = [bytes([i]) * 40 for i in range(4)]
+    evicted = sum(log.append(payload) for payload in payloads)
+
+    assert evicted == 2
+    assert log.size <= SEGMENT_SIZE * 2
+    assert len(list(tmp_path.glob("*.seg"))) == 2
+    assert log.peek() == payloads[2]
+    log.ack()
+    assert log.peek() == payloads[3]
+    log.close()
+
+
+def test_spooling_exporter_delivers_encoded_spans(tmp_path):
+    spans = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(spans))
+    with provider.get_tracer(__name__).start_as_current_span("spooled"):
+        pass
+
+    collector = Collector()
+    send = OTLPHTTPSender("traces", collector.endpoint, BatchExportSettings(compression="gzip"))
+    exporter = SpoolingSpanExporter(tmp_path, SETTINGS, send)
+    assert exporter.export(spans.get_finished_spans()) is SpanExportResult.SUCCESS
+    wait_for(lambda: len(collector.exports) == 1)
+    exporter.shutdown()
+    collector.close()
+
+    path, headers, payload = collector.exports[0]
+    assert path == "/v1/traces"
+    assert headers["Content-Type"] == "application/x-protobuf"
+    assert headers["Content-Encoding"] == "gzip"
+    request = ExportTraceServiceRequest()
+    request.ParseFromString(payload)
+    assert request.resource_spans[0].scope_spans[0].spans[0].name == "spooled"